@@ -0,0 +1,83 @@
+#! /usr/bin/python
+#
+# Benchmark rendering templates of genconf for many repos.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Time generating .repo, mock.cfg and RPM SPEC files of N (default: 100)
+repos in the same way as genconf does, with a new jinja2 environment made for
+each template rendered (as myrepo.utils.compile_template did before), and
+with the shared and cached one, the first and the second time.
+
+Usage: PYTHONPATH=. python aux/bench_genconf.py [N]
+"""
+import myrepo.commands.genconf as MCG
+import myrepo.repo as MR
+import myrepo.utils as MU
+
+import jinja2
+import os.path
+import sys
+import time
+
+
+def bench(name, f, *args):
+    start = time.time()
+    f(*args)
+    print "%-36s %8.3f sec" % (name, time.time() - start)
+
+
+def compile_template_0(tmpl, context={}, tpaths=[]):
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(tpaths))
+    return env.get_template(tmpl).render(**context)
+
+
+def mk_repos(n):
+    server = MR.Server("localhost", topdir="/tmp/yum", baseurl="file:///tmp")
+    return [MR.Repo("fedora", 10 + i, ["x86_64", "i386"], server)
+            for i in range(n)]
+
+
+def genconf(repos, tpaths):
+    for repo in repos:
+        ctx = dict(repos=repos, fullname="John Doe", keyid=False,
+                   email="jdoe@example.com", datestamp="Wed Jul 31 2013")
+        list(MCG.gen_repo_files_g(repo, ctx, "/tmp/w", tpaths))
+        list(MCG.gen_mockcfg_files_cmd_g(repo, ctx, "/tmp/w", tpaths))
+
+
+def main(argv=sys.argv):
+    n = int(argv[1]) if len(argv) > 1 else 100
+    repos = mk_repos(n)
+    tpaths = [os.path.join(os.path.dirname(__file__), "..", "templates", "2")]
+
+    compile_template = MU.compile_template
+    try:
+        MU.compile_template = compile_template_0
+        bench("genconf: %d repos, uncached" % n, genconf, repos, tpaths)
+    finally:
+        MU.compile_template = compile_template
+
+    bench("genconf: %d repos, cached (1st)" % n, genconf, repos, tpaths)
+    bench("genconf: %d repos, cached (2nd)" % n, genconf, repos, tpaths)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,128 @@
+#! /usr/bin/python
+#
+# Benchmark myrepo.repodata against createrepo.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Time generating repodata of RPMs in DIR from scratch and updating it after
+an RPM was added, with createrepo (--database, w/o --deltas) and with
+myrepo.repodata. DIR is copied into a temporary dir and is not changed.
+
+With --synthetic N, time myrepo.repodata only on N fake RPMs whose metadata is
+made up w/o reading headers, to measure the cost of writing metadata.
+
+Usage: PYTHONPATH=. python aux/bench_repodata.py DIR
+       PYTHONPATH=. python aux/bench_repodata.py --synthetic N
+"""
+import myrepo.repodata as MRD
+
+import glob
+import os.path
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def bench(name, f, *args):
+    start = time.time()
+    f(*args)
+    print "%-36s %8.3f sec" % (name, time.time() - start)
+
+
+def createrepo(topdir, update=False):
+    subprocess.check_call("createrepo -q --database %s%s" %
+                          ("--update " if update else '', topdir),
+                          shell=True)
+
+
+def myrepo(topdir, read=MRD.read_package):
+    MRD.generate(topdir, read=read)
+
+
+def fake_package(path, href):
+    name = href[:-len(".rpm")]
+    return dict(pkgid=name, name=name, arch=u"x86_64", epoch=u'0',
+                version=u"0.1", release=u'1', summary=u"Summary of " + name,
+                description=u"Description of " + name, url=u'', packager=u'',
+                time_file=0, time_build=0, license=u"GPLv3+", vendor=u'',
+                group=u"System/Tools", buildhost=u"localhost",
+                sourcerpm=name + u"-0.1-1.src.rpm", header_start=0,
+                header_end=0, size_package=0, size_installed=0,
+                size_archive=0, location=href,
+                provides=[(name, "EQ", u'0', u"0.1", u'1', False)],
+                requires=[(u"libc.so.6()(64bit)", None, None, None, None,
+                           False)],
+                conflicts=[], obsoletes=[],
+                files=[(u"/usr/share/%s/%d" % (name, i), u'') for i
+                       in range(50)] + [(u"/usr/bin/" + name, u'')],
+                changelogs=[(u"John Doe <jdoe@example.com>", 0, u"- init")])
+
+
+def synthetic(n):
+    workdir = tempfile.mkdtemp()
+    try:
+        for i in range(n):
+            open(os.path.join(workdir, "p%05d.rpm" % i), 'w').close()
+
+        bench("myrepo: %d RPMs" % n, myrepo, workdir, fake_package)
+
+        open(os.path.join(workdir, "p%05d.rpm" % n), 'w').close()
+        bench("myrepo: update, 1 RPM added", myrepo, workdir, fake_package)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        print >> sys.stderr, __doc__
+        return 1
+
+    if argv[1] == "--synthetic":
+        synthetic(int(argv[2]) if len(argv) > 2 else 10000)
+        return 0
+
+    rpms = sorted(glob.glob(os.path.join(argv[1], "*.rpm")))
+    workdir = tempfile.mkdtemp()
+    try:
+        for name, fn in (("createrepo", createrepo), ("myrepo", myrepo)):
+            topdir = os.path.join(workdir, name)
+            os.makedirs(topdir)
+            for rpm in rpms[:-1]:
+                os.symlink(os.path.abspath(rpm),
+                           os.path.join(topdir, os.path.basename(rpm)))
+
+            bench("%s: %d RPMs" % (name, len(rpms) - 1), fn, topdir)
+
+            os.symlink(os.path.abspath(rpms[-1]),
+                       os.path.join(topdir, os.path.basename(rpms[-1])))
+            if name == "createrepo":
+                bench("%s: update, 1 RPM added" % name, fn, topdir, True)
+            else:
+                bench("%s: update, 1 RPM added" % name, fn, topdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,91 @@
+#! /usr/bin/python
+#
+# Benchmark per-command overhead of myrepo.shell.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Compare the old process-per-command engine (multiprocessing.Process runs
+subprocess.Popen and pumps its output) with myrepo.shell.Job.
+
+Usage: PYTHONPATH=. python aux/bench_shell.py [NUMBER_OF_COMMANDS]
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import myrepo.shell as MS
+
+
+def _old_run(cmd, workdir):
+    """Replica of the old myrepo.shell._run.
+    """
+    proc = subprocess.Popen(cmd, cwd=workdir, shell=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            close_fds=True)
+    for line in iter(proc.stdout.readline, b''):
+        sys.stdout.write(line)
+
+    if proc.wait() != 0:
+        raise RuntimeError("Failed to run command: " + cmd)
+
+
+def old_run_async(cmd, workdir=os.curdir):
+    proc = multiprocessing.Process(target=_old_run, args=(cmd, workdir))
+    proc.start()
+    return proc
+
+
+def old_run(cmd):
+    proc = old_run_async(cmd)
+    proc.join()
+    return proc.exitcode == 0
+
+
+def old_prun(cs):
+    ps = [old_run_async(c) for c in cs]
+    for p in ps:
+        p.join()
+
+    return [p.exitcode == 0 for p in ps]
+
+
+def bench(name, f, n):
+    start = time.time()
+    f(n)
+    elapsed = time.time() - start
+
+    print "%-28s %4d cmds: %7.3f sec, %6.2f msec/cmd" % \
+        (name, n, elapsed, elapsed * 1000 / n)
+
+
+def main(argv=sys.argv):
+    n = int(argv[1]) if len(argv) > 1 else 200
+    cs = ["true" for _ in range(n)]
+
+    bench("old: run (sequential)", lambda n: [old_run(c) for c in cs], n)
+    bench("new: run (sequential)", lambda n: [MS.run(c) for c in cs], n)
+    bench("old: prun", lambda n: old_prun(cs), n)
+    bench("new: prun", lambda n: MS.prun(cs), n)
+    bench("new: prun (maxjobs=8)", lambda n: MS.prun(cs, maxjobs=8), n)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,237 @@
+#
+# Content-addressed cache of built RPMs.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Each entry of the cache is a dir named by the sha256 hash of the content of
+the SRPM, the contents of the mock.cfg and of the config files it depends on
+(see ``mock_cfg_files``) and the arch to build for, contains RPMs built from
+them. Entries are evicted in LRU order if the total size of the
+cache exceeds the limit; the mtime of the stamp file in each entry is updated
+when it's used.
+"""
+import myrepo.globals as G
+
+import hashlib
+import logging
+import os.path
+import os
+import re
+import shutil
+
+
+_MOCK_CFG_DIR = "/etc/mock"
+_STAMP = ".used"
+
+# Config files mock reads before the one of the build label, and the ones
+# included from mock.cfg files, e.g. include('templates/fedora-branched.tpl').
+_MOCK_SITE_CFGS = ("site-defaults.cfg", )
+_MOCK_INCLUDE_RE = re.compile(r"^\s*include\(\s*['\"]([^'\"]+)['\"]\s*\)",
+                              re.M)
+
+
+def _sha256_of_file(path, bufsize=1024 * 1024):
+    """
+    :param path: File path
+    :return: sha256 hash of the file content or of '' if it does not exist
+    """
+    h = hashlib.sha256()
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(bufsize), ''):
+                h.update(data)
+
+    return h.hexdigest()
+
+
+def mock_cfg_files(label, mockcfgdir=_MOCK_CFG_DIR):
+    """
+    :param label: Build label, e.g. 'fedora-19-x86_64'
+    :param mockcfgdir: Dir in which mock.cfg files are
+
+    :return: List of paths of config files mock reads to build for the label;
+        site-defaults.cfg, "<label>.cfg" and files included from them
+        recursively. Paths of files not exist are also in it.
+
+    >>> import tempfile
+    >>> topdir = tempfile.mkdtemp()
+    >>> open(os.path.join(topdir, "a.cfg"), 'w').write("include('b.tpl')")
+    >>> [os.path.relpath(f, topdir) for f in mock_cfg_files("a", topdir)]
+    ['site-defaults.cfg', 'a.cfg', 'b.tpl']
+    >>> shutil.rmtree(topdir)
+    """
+    ret = []
+    todo = [os.path.join(mockcfgdir, f) for f in _MOCK_SITE_CFGS] + \
+           [os.path.join(mockcfgdir, label + ".cfg")]
+
+    while todo:
+        path = todo.pop(0)
+        if path in ret:
+            continue
+
+        ret.append(path)
+        if os.path.exists(path):
+            todo += [os.path.join(mockcfgdir, os.path.expanduser(f)) for f
+                     in _MOCK_INCLUDE_RE.findall(open(path).read())]
+
+    return ret
+
+
+def _du(path):
+    """
+    :param path: Dir path
+    :return: Total size of files in the dir in bytes
+    """
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _ds, fs
+               in os.walk(path) for f in fs)
+
+
+class BuildCache(object):
+    """
+    >>> import tempfile
+    >>> topdir = tempfile.mkdtemp()
+    >>> cache = BuildCache(topdir, mockcfgdir=topdir)
+    >>> cache.lookup("/not/exist.src.rpm", "fedora-19-x86_64")
+    >>> cache.hits, cache.misses
+    (0, 1)
+    >>> shutil.rmtree(topdir)
+    """
+
+    def __init__(self, topdir=G._BUILD_CACHE_DIR, maxsize=G._BUILD_CACHE_SIZE,
+                 mockcfgdir=_MOCK_CFG_DIR):
+        """
+        :param topdir: Top dir of the cache
+        :param maxsize: Max size of the cache in bytes
+        :param mockcfgdir: Dir in which mock.cfg files are
+        """
+        self.topdir = topdir
+        self.maxsize = maxsize
+        self.mockcfgdir = mockcfgdir
+
+        self.hits = 0
+        self.misses = 0
+        self._keys = dict()  # Memoized keys; (srpm, label) -> key
+
+    def key(self, srpm, label):
+        """
+        :param srpm: SRPM path
+        :param label: Build label, e.g. 'fedora-19-x86_64'; the arch is the
+            last part of it and mock.cfg is "<label>.cfg" in ``mockcfgdir``.
+
+        :return: Key of the cache entry :: str
+        """
+        k = (srpm, label)
+        if k not in self._keys:
+            cfgs = mock_cfg_files(label, self.mockcfgdir)
+            arch = label.rsplit('-', 1)[-1]
+
+            h = hashlib.sha256()
+            for x in [_sha256_of_file(srpm)] + \
+                    [_sha256_of_file(f) for f in cfgs] + [arch]:
+                h.update(x)
+
+            self._keys[k] = h.hexdigest()
+
+        return self._keys[k]
+
+    def path(self, srpm, label):
+        """
+        :return: The path of the cache entry for given SRPM and build label
+        """
+        return os.path.join(self.topdir, self.key(srpm, label))
+
+    def lookup(self, srpm, label, count=True):
+        """
+        Look up the cache entry for given SRPM and build label.
+
+        :param srpm: SRPM path
+        :param label: Build label
+        :param count: Count up hits or misses if True
+
+        :return: The path of the cache entry if found else None
+        """
+        path = self.path(srpm, label)
+        found = os.path.exists(os.path.join(path, _STAMP))
+
+        if count:
+            if found:
+                self.hits += 1
+                os.utime(os.path.join(path, _STAMP), None)
+            else:
+                self.misses += 1
+
+        logging.debug("Build cache %s: %s for %s" %
+                      ("hit" if found else "miss", srpm, label))
+        return path if found else None
+
+    def store_cmd(self, srpm, label, rpmdir):
+        """
+        Make up a command string to store RPMs built in ``rpmdir`` into the
+        cache. The entry will appear atomically.
+
+        :param srpm: SRPM path
+        :param label: Build label
+        :param rpmdir: Dir in which built RPMs are
+
+        :return: Command string
+        """
+        path = self.path(srpm, label)
+        tmp = "%s.$$.tmp" % path
+
+        # NOTE: mv -T fails if other process stored the entry already.
+        return "mkdir -p %s && cp -p %s/*.rpm %s/ && touch %s/%s && " \
+               "(mv -T %s %s 2>/dev/null || rm -rf %s)" % \
+               (tmp, rpmdir, tmp, tmp, _STAMP, tmp, path, tmp)
+
+    def evict(self):
+        """
+        Evict least recently used entries until the total size of the cache
+        is less than ``maxsize``.
+
+        :return: Number of entries evicted
+        """
+        if not os.path.isdir(self.topdir):
+            return 0
+
+        entries = []
+        for e in os.listdir(self.topdir):
+            path = os.path.join(self.topdir, e)
+            stamp = os.path.join(path, _STAMP)
+
+            if os.path.exists(stamp):
+                entries.append((os.path.getmtime(stamp), path, _du(path)))
+
+        total = sum(e[2] for e in entries)
+        n = 0
+
+        for _mtime, path, size in sorted(entries):
+            if total <= self.maxsize:
+                break
+
+            logging.info("Evict the build cache entry: " + path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            n += 1
+
+        return n
+
+    def report(self):
+        logging.info("Build cache: hits=%d, misses=%d" % (self.hits,
+                                                          self.misses))
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,246 @@
+#
+# Build farm; schedule builds over build hosts (workers).
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Builds are assigned to workers when the plan is made up: each build goes
+to the least loaded worker, relative to its slots, which can build for the
+arch. The number of builds run at once on each worker is limited by its slots
+at run time; build steps on a worker are of the kind ``Worker.kind`` and
+``BuildFarm.limits`` gives the limits of them (see myrepo.shell.prun).
+"""
+import myrepo.globals as G
+import myrepo.parser as MP
+import myrepo.plan as MPL
+import myrepo.repo as MR
+
+import hashlib
+import os.path
+import os
+
+
+_CHECKSUMS = dict()  # (path, size, mtime, inode) -> checksum
+
+
+def _checksum(path, bufsize=1024 * 1024):
+    """
+    :param path: File path
+    :return: The checksum (sha256) of the file, memoized while it's unchanged
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime, st.st_ino)
+
+    if key not in _CHECKSUMS:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(bufsize), ''):
+                h.update(data)
+
+        _CHECKSUMS[key] = h.hexdigest()
+
+    return _CHECKSUMS[key]
+
+
+class Worker(MR.Server):
+    """
+    A build host runs mock to build RPMs.
+
+    >>> w = Worker("localhost", "jdoe", ["x86_64"], 2, "/tmp/w0")
+    >>> w.id, w.kind, w.slots
+    ('jdoe@localhost:/tmp/w0', 'mock@jdoe@localhost:/tmp/w0', 2)
+    >>> d = MR.Dist("fedora-19", "x86_64")
+    >>> w.can_build(d), w.can_build(MR.Dist("fedora-19", "i386"))
+    (True, False)
+    >>> import myrepo.srpm as MSR
+    >>> srpm = MSR.Srpm("/a/b/foo-0.1-1.src.rpm")
+    >>> w.rpmdir(d, srpm)
+    '/tmp/w0/results/fedora-19-x86_64-foo-0.1-1'
+    """
+
+    def __init__(self, name, user=None, archs=G._WORKER_ARCHS, slots=1,
+                 topdir=G._WORKER_TOPDIR, timeout=G._CONN_TIMEOUT, mux=True):
+        """
+        :param name: FQDN or hostname of the worker
+        :param user: User name on the worker to run mock
+        :param archs: List of archs the worker can build RPMs for
+        :param slots: Max number of builds run on the worker at once
+        :param topdir: Top dir or its format string on the worker to put
+            SRPMs and built RPMs in. Workers on the same host must have
+            different top dirs.
+        :param timeout: SSH connection timeout to the worker
+        :param mux: Share a multiplexed SSH connection to the worker
+        """
+        super(Worker, self).__init__(name, user, topdir=topdir,
+                                     timeout=timeout, mux=mux)
+        self.archs = list(archs)
+        self.slots = slots
+
+        self.id = "%s@%s:%s" % (self.user, self.name, self.topdir)
+        self.kind = "mock@" + self.id
+
+    def can_build(self, dist):
+        """
+        :param dist: myrepo.repo.Dist instance
+        """
+        return dist.arch in self.archs
+
+    def srpm_path(self, srpm):
+        """
+        :return: The path of given SRPM on the worker, in the dir named by
+            its checksum so that SRPMs rebuilt w/ the same NVR are shipped
+            again
+        """
+        return os.path.join(self.topdir, "srpms", _checksum(srpm.path),
+                            os.path.basename(srpm.path))
+
+    def rpmdir(self, dist, srpm):
+        """
+        :return: Dir on the worker to save RPMs built from given SRPM
+        """
+        return os.path.join(self.topdir, "results",
+                            "%s-%s" % (dist.label, MR.build_id(srpm)))
+
+    def ship_cmd(self, srpm):
+        """
+        Make up a command string to copy given SRPM to the worker only if the
+        worker lacks it, that is, the one of the same checksum.
+        """
+        dst = self.srpm_path(srpm)
+
+        test = self.adjust_cmd("test -f " + dst)[0]
+        mkdir = self.adjust_cmd("mkdir -p " + os.path.dirname(dst))[0]
+
+        return "%s || (%s && %s)" % (test, mkdir,
+                                     self.deploy_cmd(srpm.path,
+                                                     os.path.dirname(dst)))
+
+    def build_cmd(self, dist, srpm, logopt=''):
+        """
+        Make up a command string to build given SRPM on the worker.
+
+        :param dist: myrepo.repo.Dist instance
+        :param srpm: myrepo.srpm.Srpm instance
+        :param logopt: Options to redirect the output of mock
+        """
+        c = "mock -r %s --uniqueext=%s --resultdir=%s %s%s" % \
+            (dist.label, MR.build_id(srpm), self.rpmdir(dist, srpm),
+             self.srpm_path(srpm), logopt)
+
+        return self.adjust_cmd(c)[0]
+
+    def fetch_cmd(self, dist, srpm, dst):
+        """
+        Make up a command string to collect RPMs built on the worker.
+
+        >>> import myrepo.srpm as MSR
+        >>> w = Worker("localhost", "jdoe", topdir="/tmp/w0")
+        >>> w.fetch_cmd(MR.Dist("fedora-19", "x86_64"),
+        ...             MSR.Srpm("/a/b.src.rpm"), "/c")
+        'mkdir -p /c && cp -p /tmp/w0/results/fedora-19-x86_64-b/*.rpm /c/'
+
+        :param dist: myrepo.repo.Dist instance
+        :param srpm: myrepo.srpm.Srpm instance
+        :param dst: Local dir to put RPMs in
+        """
+        src = os.path.join(self.rpmdir(dist, srpm), "*.rpm")
+
+        if self.is_local:
+            c = "cp -p %s %s/" % (os.path.expanduser(src), dst)
+        else:
+            opts = self._ssh_opts()
+            c = "scp -p %s%s@%s:%s %s/" % ('' if opts is None else opts + ' ',
+                                           self.user, self.name, src, dst)
+
+        return "mkdir -p %s && %s" % (dst, c)
+
+
+class BuildFarm(object):
+    """
+    A pool of build workers.
+
+    >>> ws = [Worker("localhost", "jdoe", ["x86_64"], 2, "/tmp/w0"),
+    ...       Worker("localhost", "jdoe", ["x86_64", "i386"], 1, "/tmp/w1")]
+    >>> farm = BuildFarm(ws)
+    >>> (d0, d1) = (MR.Dist("fedora-19", "x86_64"), MR.Dist("fedora-19",
+    ...                                                      "i386"))
+    >>> [farm.assign(d).topdir for d in (d0, d1, d0, d0)]
+    ['/tmp/w0', '/tmp/w1', '/tmp/w0', '/tmp/w0']
+    >>> sorted(farm.limits().values())
+    [1, 2]
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: List of Worker instances
+        """
+        assert workers, "No build workers were given!"
+
+        self.workers = workers
+        self._load = dict((w.id, 0) for w in workers)  # id -> builds
+        self._ships = dict()  # (id, srpm path) -> Step to ship the SRPM
+
+    def assign(self, dist):
+        """
+        Assign a build for the dist to the least loaded worker can build it.
+
+        :param dist: myrepo.repo.Dist instance
+        :return: Worker instance
+        """
+        ws = [w for w in self.workers if w.can_build(dist)]
+        if not ws:
+            raise RuntimeError("No build workers can build for " + dist.label)
+
+        worker = min(ws, key=lambda w: float(self._load[w.id]) / w.slots)
+        self._load[worker.id] += 1
+
+        return worker
+
+    def ship_step(self, worker, srpm, deps=[]):
+        """
+        :return: Step to ship given SRPM to the worker, shared among builds
+        """
+        key = (worker.id, srpm.path)
+        if key not in self._ships:
+            self._ships[key] = MPL.Step(worker.ship_cmd(srpm), deps,
+                                        "ship:%s:%s" % (worker.id,
+                                                        srpm.name))
+        return self._ships[key]
+
+    def limits(self):
+        """
+        :return: A dict of (kind, max number of jobs of the kind) to limit the
+            number of builds on each worker
+        """
+        return dict((w.kind, w.slots) for w in self.workers)
+
+
+def mk_worker(spec, timeout=G._CONN_TIMEOUT, mux=True):
+    """
+    :param spec: Worker spec string (see myrepo.parser.parse_worker_option)
+    :return: Worker instance
+
+    >>> w = mk_worker("jdoe@localhost:i386:3:/tmp/w0")
+    >>> w.user, w.name, w.archs, w.slots, w.topdir
+    ('jdoe', 'localhost', ['i386'], 3, '/tmp/w0')
+    """
+    (user, host, archs, slots, topdir) = MP.parse_worker_option(spec)
+
+    return Worker(host, user, archs or G._WORKER_ARCHS, slots,
+                  topdir or G._WORKER_TOPDIR, timeout, mux)
+
+
+# vim:sw=4:ts=4:et:
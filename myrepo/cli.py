@@ -17,16 +17,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-from itertools import groupby
-from operator import itemgetter
-
 import myrepo.cmds as CM
 import myrepo.config as CF
 import myrepo.globals as G
+import myrepo.headercache as MHC
 import myrepo.parser as P
 import myrepo.repo as R
+import myrepo.shell as MS
 import myrepo.srpm as SRPM
 
+import glob
 import logging
 import os.path
 import os
@@ -51,16 +51,29 @@ def _degenerate_dists_g(dists):
     ... ]
     >>> list(_degenerate_dists_g([d0, d1, d2])) == ds2
     True
+
+    # dists of the same bdist may not be adjacent, and may be duplicated:
+    >>> list(_degenerate_dists_g([d0, d2, d1, d0])) == ds2
+    True
     """
-    key_f = itemgetter(3)  # to extract bdist from dist.
-    bds = [(bdist, list(ds)) for bdist, ds in groupby(dists, key_f)]
+    bdists = []  # to keep the order of bdists.
+    bds = dict()  # bdist -> [dist]
+
+    for dist in dists:
+        bdist = dist[3]
+        if bdist not in bds:
+            bdists.append(bdist)
 
-    for bd in bds:
-        bdist = bd[0]
-        dists = bd[1]
+        bds.setdefault(bdist, []).append(dist)
+
+    for bdist in bdists:
+        dists = bds[bdist]
 
         dist0 = dists[0]
-        archs = [d[2] for d in dists]
+        archs = []
+        for d in dists:
+            if d[2] not in archs:
+                archs.append(d[2])
 
         (dname, dver) = dist0[:2]
 
@@ -84,7 +97,17 @@ def mk_repo_server(ctx):
     'http://yumrepos.example.com/~jdoe/yum'
     """
     return R.Server(ctx["hostname"], ctx["user"], ctx["altname"],
-                    ctx["topdir"], ctx["baseurl"], ctx["timeout"])
+                    ctx["topdir"], ctx["baseurl"], ctx["timeout"],
+                    ctx.get("ssh_mux", True),
+                    ctx.get("transfer", G._TRANSFERS[0]),
+                    ctx.get("checksum", False),
+                    ctx.get("compress", G._TAR_COMPRESS[0]),
+                    ctx.get("bandwidth", None),
+                    ctx.get("pool", False),
+                    ctx.get("repodata_generator",
+                            G._REPODATA_GENERATORS[0]),
+                    ctx.get("num_deltas", G._NUM_DELTAS),
+                    ctx.get("max_delta_rpm_size", G._MAX_DELTA_RPM_SIZE))
 
 
 def mk_repos(ctx, degenerate=True):
@@ -102,6 +125,96 @@ def mk_repos(ctx, degenerate=True):
                      selfref=ctx["selfref"])
 
 
+def expand_srpm_paths(args):
+    """
+    Expand glob patterns and list files in given SRPM arguments.
+
+    >>> expand_srpm_paths(["/a/b.src.rpm", "/c/d.src.rpm", "/a/b.src.rpm"])
+    ['/a/b.src.rpm', '/c/d.src.rpm']
+
+    :param args: List of SRPM paths, glob patterns of SRPM paths, or paths of
+        list files prefixed with '@', lists SRPM paths or glob patterns one
+        per line (empty lines and lines start with '#' are ignored).
+
+    :return: List of SRPM paths w/o duplicates
+    """
+    paths = []
+
+    for arg in args:
+        if arg.startswith('@'):
+            ls = [l.strip() for l in open(arg[1:]).readlines()]
+            ps = expand_srpm_paths([l for l in ls if l and
+                                    not l.startswith('#')])
+        elif glob.has_magic(arg):
+            ps = sorted(glob.glob(arg))
+            if not ps:
+                logging.warn("No SRPMs matched with: " + arg)
+        else:
+            ps = [arg]
+
+        paths += [p for p in ps if p not in paths]
+
+    return paths
+
+
+def _resolve_srpm(path):
+    """
+    :param path: SRPM path
+    :return: Resolved myrepo.srpm.Srpm instance or None if failed to resolve
+    """
+    srpm = SRPM.Srpm(path)
+    try:
+        srpm.resolve()
+    except RuntimeError:
+        return None
+
+    return srpm
+
+
+def resolve_srpms(paths):
+    """
+    Resolve given SRPMs in parallel.
+
+    :param paths: List of SRPM paths
+    :return: List of resolved myrepo.srpm.Srpm instances or None if failed
+    """
+    for path in paths:
+        if not os.path.exists(path):
+            logging.error("Could not find given srpm: " + path)
+            return None
+
+        if not os.access(path, os.R_OK):
+            logging.error("Could not read given srpm: " + path)
+            return None
+
+    # Resolve SRPMs found in the header cache here, and read the headers of
+    # the others in child processes, which store them into the cache.
+    cache = MHC.shared()
+    srpms = dict()
+    for path in paths:
+        h = cache.lookup(path)
+        if h is not None:
+            srpms[path] = SRPM.Srpm(path)
+            srpms[path].resolve_by_header(h)
+
+    misses = [p for p in paths if p not in srpms]
+    if len(misses) > 1:
+        srpms.update(zip(misses, MS.pmap(_resolve_srpm, misses,
+                                         min(len(misses), MS._NPROC))))
+    else:
+        srpms.update((p, _resolve_srpm(p)) for p in misses)
+
+    cache.report()
+    srpms = [srpms[p] for p in paths]
+
+    for path, srpm in zip(paths, srpms):
+        if srpm is None or not srpm.is_srpm:
+            logging.error("It does not look srpm: " + path)
+            return None
+
+    return srpms
+
+
 def modmain(argv):
     """
     :param argv: Argument list for the program
@@ -135,31 +248,24 @@ def modmain(argv):
 
     # Hack:
     ctx = options.__dict__.copy()
-    srpms = args[1:]  # List of srpm paths or []
-
-    if srpms:
-        if len(srpms) > 1:
-            sys.stdout.write("Sorry, myrepo does not support build and/or "
-                             "deploy multiple SRPMs yet.")
-            return 1
-
-        if not os.path.exists(srpms[0]):
-            logging.error("Could not find given srpm: " + srpms[0])
+    if func in CM._NON_SRPM_ARGS_CMDS:
+        ctx["args"] = args[1:]
+        paths = []
+    else:
+        paths = expand_srpm_paths(args[1:])  # List of srpm paths or []
+
+        if args[1:] and not paths:
+            logging.error("No SRPMs found: " + ' '.join(args[1:]))
             return False
 
-        if not os.access(srpms[0], os.R_OK):
-            logging.error("Could not read given srpm: " + srpms[0])
-            return False
-
-        srpm = SRPM.Srpm(srpms[0])
-        srpm.resolve()
-
-        if not srpm.is_srpm:
-            logging.error("It does not look srpm: " + srpms[0])
+    if paths:
+        srpms = resolve_srpms(paths)
+        if not srpms:
             return False
 
-        ctx["srpms"] = [srpm]
-        ctx["srpm"] = srpm
+        logging.info("%d SRPMs to process" % len(srpms))
+        ctx["srpms"] = srpms
+        ctx["srpm"] = srpms[0]
 
     ctx["repos"] = repos = list(mk_repos(ctx))
 
@@ -20,6 +20,9 @@ import myrepo.commands.genconf
 import myrepo.commands.build
 import myrepo.commands.deploy
 import myrepo.commands.update
+import myrepo.commands.cache
+import myrepo.commands.gc
+import myrepo.commands.verify
 
 
 # command_abrev, command, help, mod_function
@@ -33,7 +36,15 @@ _LIST = [('i', "init", "Initialize yum repo", myrepo.commands.init.run),
           myrepo.commands.build.run),
          ('d', "deploy",
           "Build and deploy given SRPMs for the yum repos",
-          myrepo.commands.deploy.run)]
+          myrepo.commands.deploy.run),
+         ('gc', "gc", "Remove old RPMs in yum repos", myrepo.commands.gc.run),
+         ('v', "verify", "Verify RPMs in yum repos against the metadata",
+          myrepo.commands.verify.run),
+         ('c', "cache", "Maintain the cache of RPM headers",
+          myrepo.commands.cache.run)]
+
+# Commands take other arguments than SRPMs.
+_NON_SRPM_ARGS_CMDS = [myrepo.commands.cache.run]
 
 
 class CommandNotFoundError(Exception):
@@ -16,9 +16,9 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.commands.utils as MCU
+import myrepo.plan as MPL
 import myrepo.shell as MS
 import myrepo.utils as MU
-import itertools
 import logging
 import os.path
 
@@ -49,35 +49,130 @@ def _log_opt(level=None):
         return " -v" if level <= 0 else ''
 
 
-def prepare_0(repo, srpm, level=None):
+def mk_build_cmd(dist, srpm, level=None, cache=None, worker=None):
+    """
+    Make up a command string to build given srpm for the dist.
+
+    :param dist: myrepo.repo.Dist instance
+    :param srpm: myrepo.srpm.Srpm instance
+    :param level: Logging level
+    :param cache: myrepo.buildcache.BuildCache instance or None
+    :param worker: myrepo.buildfarm.Worker instance to build on, or None
+        (build on this host). RPMs built on the worker are collected into
+        ``dist.rpmdir(srpm)`` on this host.
+
+    :return: Command string, or None if the RPMs were found in the cache
+
+    >>> import myrepo.repo as MR, myrepo.srpm as MSR
+    >>> mk_build_cmd(MR.Dist("fedora-19", "x86_64"),
+    ...              MSR.Srpm("/a/b.src.rpm"), logging.INFO)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    'mock -r fedora-19-x86_64 --uniqueext=b
+     --resultdir=/var/lib/mock/fedora-19-x86_64-b/result /a/b.src.rpm'
+    """
+    if worker is None:
+        c = "mock -r %s %s %s%s" % (dist.label, dist.mock_opts(srpm),
+                                    srpm.path, _log_opt(level))
+    else:
+        c = MS.join(worker.build_cmd(dist, srpm, _log_opt(level)),
+                    worker.fetch_cmd(dist, srpm, dist.rpmdir(srpm)))
+
+    if cache is None:
+        return c
+
+    if cache.lookup(srpm.path, dist.label):
+        logging.info("Found RPMs in the cache: %s for %s" %
+                     (srpm.path, dist.label))
+        return None
+
+    return MS.join(c, cache.store_cmd(srpm.path, dist.label,
+                                      dist.rpmdir(srpm)))
+
+
+def prepare_0(repo, srpm, level=None, cache=None, farm=None):
     """
     Make up list of command strings to deploy built RPMs.
 
     :param repo: myrepo.repo.Repo instance
     :param srpm: myrepo.srpm.Srpm instance
     :param level: Logging level
+    :param cache: myrepo.buildcache.BuildCache instance or None. The builds
+        of RPMs found in the cache are skipped.
+    :param farm: myrepo.buildfarm.BuildFarm instance to build on, or None
 
     :return: List of command strings to deploy built RPMs.
     """
-    MCU.assert_repo(repo)
-    MCU.assert_srpm(srpm)
-
-    f = lambda b: "mock -r %s %s%s" % (b, srpm.path, _log_opt(level))
-
-    return [f(b) for b in repo.list_build_labels(srpm)]
+    return [s.cmd if farm is None else MS.join(s.deps[-1].cmd, s.cmd) for s
+            in mk_steps_0(repo, srpm, level, cache, farm=farm)
+            if s is not None]
 
 
-def prepare(repos, srpm, level=None):
+def prepare(repos, srpm, level=None, farm=None):
     """
     Make up list of command strings to update metadata of given repos.
     It's similar to above ``prepare_0`` but applicable to multiple repos.
 
     :param repos: List of Repo instances
     :param srpm: myrepo.srpm.Srpm instance
+    :param farm: myrepo.buildfarm.BuildFarm instance or None
 
     :return: List of command strings to deploy built RPMs.
     """
-    return MU.concat(prepare_0(repo, srpm, level) for repo in repos)
+    return MU.concat(prepare_0(repo, srpm, level, farm=farm) for repo
+                     in repos)
+
+
+def mk_steps_0(repo, srpm, level=None, cache=None, deps=[], farm=None):
+    """
+    Make up a plan (steps) to build given srpm for the repo.
+
+    :param repo: myrepo.repo.Repo instance
+    :param srpm: myrepo.srpm.Srpm instance
+    :param level: Logging level
+    :param cache: myrepo.buildcache.BuildCache instance or None
+    :param deps: List of Steps all of the steps depend on
+    :param farm: myrepo.buildfarm.BuildFarm instance or None. Each build is
+        assigned to a worker of the farm, and runs after the SRPM was shipped
+        to the worker.
+
+    :return: List of myrepo.plan.Step instances or None for each dist to
+        build for (None if RPMs were found in the cache)
+    """
+    MCU.assert_repo(repo)
+    MCU.assert_srpm(srpm)
+
+    steps = []
+    for d in repo.list_dists(srpm):
+        name = "build:%s:%s" % (d.label, srpm.name)
+
+        if farm is None or (cache is not None and
+                            cache.lookup(srpm.path, d.label, False)):
+            c = mk_build_cmd(d, srpm, level, cache)
+            steps.append(None if c is None else MPL.Step(c, deps, name))
+        else:
+            w = farm.assign(d)
+            c = mk_build_cmd(d, srpm, level, cache, w)
+            steps.append(MPL.Step(c, [farm.ship_step(w, srpm, deps)], name,
+                                  w.kind))
+
+    return steps
+
+
+def mk_steps(repos, srpms, level=None, cache=None, farm=None):
+    """
+    Make up a plan (steps) to build given srpms for repos.
+
+    :param repos: List of Repo instances
+    :param srpms: List of myrepo.srpm.Srpm instances
+    :param level: Logging level
+    :param cache: myrepo.buildcache.BuildCache instance or None
+    :param farm: myrepo.buildfarm.BuildFarm instance or None
+
+    :return: List of myrepo.plan.Step instances
+    """
+    return [s for srpm in srpms for repo in repos for s
+            in mk_steps_0(repo, srpm, level, cache, farm=farm)
+            if s is not None]
 
 
 def run(ctx):
@@ -88,16 +183,28 @@ def run(ctx):
     """
     MCU.assert_ctx_has_keys(ctx, ("repos", "srpm"))
 
-    cs = prepare(ctx["repos"], ctx["srpm"], logging.getLogger().level)
+    level = logging.getLogger().level
+    srpms = MCU.get_srpms(ctx)
+    farm = MCU.get_build_farm(ctx)
 
     if ctx.get("dryrun", False):
-        for c in cs:
-            print c
+        for srpm in srpms:
+            for c in prepare(ctx["repos"], srpm, level, farm):
+                print c
 
         return True
 
+    cache = MCU.get_build_cache(ctx)
+    steps = mk_steps(ctx["repos"], srpms, level, cache, farm)
+
     logging.info("Run myrepo.commands.build.run...")
-    return all(MS.prun(cs, dict(logfile=False, )))
+    rc = MCU.run_steps(steps, ctx, farm and farm.limits(), logfile=False)
+
+    if cache is not None:
+        cache.report()
+        cache.evict()
+
+    return rc
 
 
 # vim:sw=4:ts=4:et:
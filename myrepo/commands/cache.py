@@ -0,0 +1,60 @@
+#
+# Copyright (C) 2011 - 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.headercache as MHC
+import logging
+
+
+# Actions of 'cache' command: action -> help
+_ACTIONS = dict(prune="Remove entries of RPMs removed or changed",
+                stats="Show the number of entries")
+
+
+def run(ctx, cache=None):
+    """
+    Maintain the header cache, see myrepo.headercache.
+
+    :param ctx: Application context; ctx["args"] is a list of actions, one of
+        _ACTIONS, and it's "prune" if empty
+    :param cache: myrepo.headercache.HeaderCache instance or None to use the
+        shared one
+
+    :return: True if actions done successfully else False
+    """
+    cache = MHC.shared() if cache is None else cache
+
+    for action in ctx.get("args", None) or ["prune"]:
+        if action not in _ACTIONS:
+            logging.error("Unknown action of 'cache' command: %s (choices: "
+                          "%s)" % (action, ", ".join(sorted(_ACTIONS))))
+            return False
+
+        if ctx.get("dryrun", False):
+            print "%s the header cache: %s" % (action, cache.path)
+            continue
+
+        if action == "prune":
+            logging.info("Removed %d entries from the header cache: %s" %
+                         (cache.prune(), cache.path))
+        else:
+            print "%d entries in the header cache: %s" % (len(cache),
+                                                          cache.path)
+
+    return True
+
+
+# vim:sw=4:ts=4:et:
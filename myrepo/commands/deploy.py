@@ -16,12 +16,16 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 from myrepo.commands.utils import assert_repo, assert_srpm, \
-    assert_ctx_has_keys
+    assert_ctx_has_keys, get_build_cache, get_build_farm, get_srpms, \
+    print_steps, run_steps
 
 import myrepo.commands.build as MCB
 import myrepo.commands.update as MCU
+import myrepo.plan as MPL
 import myrepo.shell as MS
+import myrepo.srpm as MSR
 import myrepo.utils as MU
+import copy
 import itertools
 import logging
 import os.path
@@ -97,38 +101,319 @@ def prepare_0(repo, srpm, build=False):
     return cs
 
 
-def prepare(repos, srpm, build=False):
+def _mk_remote_build_steps(repo, srpm, deps=[]):
     """
-    Make up list of command strings to update metadata of given repos.
-    It's similar to above ``prepare_0`` but applicable to multiple repos.
+    Make up steps to build given srpm on the server of the repo and move
+    built RPMs into the arch dirs of the repo there. The srpm must be copied
+    into the 'sources' dir of the repo before.
 
-    :param repos: List of Repo instances
+    :param repo: myrepo.repo.Repo instance
+    :param srpm: myrepo.srpm.Srpm instance
+    :param deps: List of Steps all of the steps depend on
+
+    :return: List of Steps for each dist to build for
+    """
+    rsrpm = copy.copy(srpm)  # The srpm on the server.
+    rsrpm.path = os.path.join(repo.destdir, "sources",
+                              os.path.basename(srpm.path))
+
+    steps = []
+    for d in repo.list_dists(srpm):
+        (arch, destarch) = ("noarch", repo.primary_arch) if srpm.noarch \
+            else (d.arch, d.arch)
+        rpmdir = d.rpmdir(srpm)
+
+        c = MS.join(MCB.mk_build_cmd(d, rsrpm),
+                    "mv %s/*.%s.rpm %s/" % (rpmdir, arch,
+                                            os.path.join(repo.destdir,
+                                                         destarch)),
+                    "rm -rf " + rpmdir)
+
+        # Do not merge builds into one ssh session to run them in parallel.
+        steps.append(MPL.Step(repo.adjust_cmd(c)[0], deps,
+                              "build:%s:%s" % (d.label, srpm.name), "mock"))
+
+    return steps
+
+
+def _mk_bulk_deploy_step(repo, srpm, rpmdirs, bsteps, deps=[]):
+    """
+    Make up a step to deploy given srpm and RPMs built from it into the dirs
+    of the repo at once in one stream and to make symlinks to noarch RPMs,
+    if the backend to transfer files to the server is 'tar'.
+
+    :param repo: myrepo.repo.Repo instance
+    :param srpm: myrepo.srpm.Srpm instance
+    :param rpmdirs: List of dirs in which built RPMs are
+    :param bsteps: List of Steps to build RPMs or None for each dirs
+    :param deps: List of Steps all of the steps depend on
+
+    :return: A Step or None if the backend is not 'tar'
+    """
+    files = [(srpm.path, "sources")]
+    post = None
+
+    if srpm.noarch:
+        files.append((os.path.join(rpmdirs[0], "*.noarch.rpm"),
+                      repo.primary_arch))
+
+        if repo.other_archs:
+            post = _MK_SYMLINKS_TO_NOARCH_RPM % \
+                dict(other_archs_s=' '.join(repo.other_archs),
+                     primary_arch=repo.primary_arch,
+                     noarch_rpms="*.noarch.rpm")
+    else:
+        files += [(os.path.join(d, "*.%s.rpm" % a), a) for d, a
+                  in itertools.izip(rpmdirs, repo.archs)]
+
+    c = repo.server.bulk_deploy_cmd(files, repo.destdir, post)
+    if c is None:
+        return None
+
+    return MPL.Step(c, [s for s in bsteps if s is not None] or deps,
+                    "deploy:%s:%s" % (repo.dist, srpm.name))
+
+
+def _mk_deploy_steps(repo, srpm, build=False, deps=[], cache=None,
+                     farm=None, remote=False):
+    """
+    :param repo: myrepo.repo.Repo instance
     :param srpm: myrepo.srpm.Srpm instance
     :param build: Build given srpm before deployment
+    :param deps: List of Steps all of the steps depend on
+    :param cache: myrepo.buildcache.BuildCache instance or None. RPMs found
+        in the cache are deployed from it instead of building them.
+    :param farm: myrepo.buildfarm.BuildFarm instance to build on, or None
+    :param remote: Build given srpm on the server of the repo if True, and
+            only the srpm is copied to the server. ``cache`` and ``farm``
+            are not used in this mode.
 
-    :return: List of command strings to deploy built RPMs.
+    :return: A tuple of (list of Steps, list of Steps to put RPMs into each
+        dirs of ["sources"] + repo.archs)
+    """
+    assert_srpm(srpm)
+
+    if not build:
+        (cache, remote) = (None, False)
+
+    dcmd = repo.server.deploy_cmd
+    rpmdirs = repo.mockdirs(srpm, cache)
+
+    if build and not remote:
+        bsteps = MCB.mk_steps_0(repo, srpm, cache=cache, deps=deps,
+                                farm=farm)
+    else:
+        bsteps = [None for _ in rpmdirs]
+
+    if not remote:
+        step = _mk_bulk_deploy_step(repo, srpm, rpmdirs, bsteps, deps)
+        if step is not None:
+            return ([s for s in bsteps if s is not None] + [step],
+                    [step for _ in ["sources"] + repo.archs])
+
+    s0 = MPL.Step(dcmd(srpm.path, os.path.join(repo.destdir, "sources")),
+                  deps, "deploy:%s:sources:%s" % (repo.dist, srpm.name))
+    steps = [s0]
+
+    if remote:
+        rsteps = _mk_remote_build_steps(repo, srpm, [s0])
+        steps += rsteps
+    else:
+        steps += [s for s in bsteps if s is not None]
+
+    def mk_deploy_step(rpms, rpmdir, arch, bstep):
+        return MPL.Step(dcmd(os.path.join(rpmdir, rpms),
+                             os.path.join(repo.destdir, arch)),
+                        deps if bstep is None else [bstep],
+                        "deploy:%s:%s:%s" % (repo.dist, arch, srpm.name))
+
+    if srpm.noarch:
+        pc = repo.server.pool_deploy_cmd(os.path.join(rpmdirs[0],
+                                                      "*.noarch.rpm"),
+                                         [os.path.join(repo.destdir, a)
+                                          for a in repo.archs])
+        if remote:
+            dstep = rsteps[0]
+        elif pc is not None:
+            # Hardlink noarch RPMs into all of the arch dirs from the pool.
+            dstep = MPL.Step(pc, deps if bsteps[0] is None else [bsteps[0]],
+                             "deploy:%s:noarch:%s" % (repo.dist, srpm.name))
+            steps.append(dstep)
+        else:
+            dstep = mk_deploy_step("*.noarch.rpm", rpmdirs[0],
+                                   repo.primary_arch, bsteps[0])
+            steps.append(dstep)
+
+        if repo.other_archs and (remote or pc is None):
+            ctx = dict(other_archs_s=' '.join(repo.other_archs),
+                       primary_arch=repo.primary_arch,
+                       noarch_rpms="*.noarch.rpm")
+            (sc, _sc_dir) = repo.adjust_cmd(_MK_SYMLINKS_TO_NOARCH_RPM % ctx,
+                                            repo.destdir)
+            dstep = MPL.Step(sc, [dstep], "symlink:%s" % repo.dist)
+            steps.append(dstep)
+
+        dsteps = [dstep for _ in repo.archs]
+    elif remote:
+        dsteps = rsteps
+    else:
+        dsteps = [mk_deploy_step("*.%s.rpm" % a, d, a, b) for d, a, b
+                  in itertools.izip(rpmdirs, repo.archs, bsteps)]
+        steps += dsteps
+
+    return (steps, [s0] + dsteps)
+
+
+def mk_steps_0(repo, srpms, build=False, deps=[], chain=False, cache=None,
+               farm=None, remote=False, defer=False):
     """
-    return MU.concat(prepare_0(repo, srpm, build) for repo in repos)
+    Make up a plan (steps) to deploy built RPMs. It does same as the commands
+    ``prepare_0`` makes up but steps independent each other run in parallel,
+    e.g. the SRPM is copied and the metadata of the 'sources' dir is updated
+    w/o waiting for the build of RPMs. Metadata of each dir is updated once
+    after all of the RPMs of ``srpms`` were put into it.
 
+    In chain build mode, ``srpms`` are built in layers sorted by build time
+    dependencies among them (see myrepo.srpm.toposort_layers); SRPMs in each
+    layer are built in parallel after RPMs built in the previous layer were
+    deployed and metadata of the arch dirs they were put into was refreshed.
+
+    :param repo: myrepo.repo.Repo instance
+    :param srpms: List of myrepo.srpm.Srpm instances
+    :param build: Build given srpms before deployment
+    :param deps: List of Steps all of the steps depend on
+    :param chain: Chain build mode if True
+    :param cache: myrepo.buildcache.BuildCache instance or None
+    :param farm: myrepo.buildfarm.BuildFarm instance or None
+    :param remote: Build given srpms on the server of the repo if True
+    :param defer: Do not update metadata of the dirs after all, which is
+        deferred (see myrepo.commands.update.mark_pending), if True
 
-def run(ctx):
+    :return: List of myrepo.plan.Step instances, or [] if circular build
+        dependencies were found in chain build mode
+    """
+    assert_repo(repo)
+
+    dirs = ["sources"] + repo.archs
+    ucs = MCU.prepare_0(repo)  # [sources, archs[0], archs[1], ...]
+
+    steps = []
+    dsteps = [[] for _ in dirs]  # Steps to put RPMs into each dirs.
+    try:
+        layers = MSR.toposort_layers(srpms) if chain else [srpms]
+    except ValueError as e:
+        logging.error(str(e))
+        return []
+
+    for i, layer in enumerate(layers):
+        lsteps = [[] for _ in dirs]
+
+        for srpm in layer:
+            (ss, ds) = _mk_deploy_steps(repo, srpm, build, deps, cache, farm,
+                                        remote)
+            steps += ss
+
+            for dss, d in itertools.izip(lsteps, ds):
+                if d not in dss:
+                    dss.append(d)
+
+        for dss, lss in itertools.izip(dsteps, lsteps):
+            dss.extend(lss)
+
+        if i < len(layers) - 1:
+            deps = [MPL.Step(uc, lss, "refresh:%s:%s:%d" % (repo.dist, d, i))
+                    for uc, lss, d in itertools.izip(ucs[1:], lsteps[1:],
+                                                     repo.archs) if lss]
+            steps += deps
+
+    if not defer:
+        steps += [MPL.Step(uc, dss, "update:%s:%s" % (repo.dist, d)) for uc,
+                  dss, d in itertools.izip(ucs, dsteps, dirs)]
+
+    return steps
+
+
+def mk_steps(repos, srpms, build=False, deps=[], chain=False, cache=None,
+             farm=None, remote=False, defer=False):
+    """
+    Make up a plan (steps) to deploy built RPMs. It's similar to above
+    ``mk_steps_0`` but applicable to multiple repos.
+
+    :param repos: List of Repo instances
+    :param srpms: List of myrepo.srpm.Srpm instances
+    :param build: Build given srpms before deployment
+    :param deps: List of Steps all of the steps depend on
+    :param chain: Chain build mode if True
+    :param cache: myrepo.buildcache.BuildCache instance or None
+    :param farm: myrepo.buildfarm.BuildFarm instance or None
+    :param remote: Build given srpms on the servers of repos if True
+    :param defer: Defer updates of metadata of the repos if True
+
+    :return: List of myrepo.plan.Step instances
+    """
+    return MU.concat(mk_steps_0(repo, srpms, build, deps, chain, cache, farm,
+                                remote, defer) for repo in repos)
+
+
+def run(ctx, journal=None):
     """
     :param ctx: Application context
+    :param journal: myrepo.journal.Journal instance to mark dirs dirty in w/
+        --defer-update, or None to use the default one
+
     :return: True if commands run successfully else False
     """
     assert_ctx_has_keys(ctx, ("repos", "srpm"))
 
-    cs = [c for c in prepare(ctx["repos"], ctx["srpm"],
-                             ctx.get("build", False))]
+    srpms = get_srpms(ctx)
+    build = ctx.get("build", False)
+    remote = build and ctx.get("remote_build", False)
 
-    if ctx.get("dryrun", False):
-        for c in cs:
-            print c
+    chain = ctx.get("chain", False)
+    if chain:
+        try:
+            layers = MSR.toposort_layers(srpms)
+        except ValueError as e:
+            logging.error(str(e))
+            return False
 
+        logging.info("Chain build: %d layers: %s" % (len(layers), layers))
+
+    if remote:
+        logging.info("Build RPMs on the servers")
+        (cache, farm) = (None, None)
+    else:
+        cache = get_build_cache(ctx) if build else None
+        farm = get_build_farm(ctx) if build else None
+
+    defer = ctx.get("defer_update", False)
+    steps = mk_steps(ctx["repos"], srpms, build, chain=chain, cache=cache,
+                     farm=farm, remote=remote, defer=defer)
+
+    if ctx.get("dryrun", False):
+        print_steps(steps, ctx)
         return True
 
+    if defer:
+        # Marked before deploys in case this process dies halfway.
+        MCU.mark_pending(ctx["repos"], journal)
+
     logging.info("Run myrepo.commands.deploy.run...")
-    return all(MS.prun(cs, dict(logfile=False, )))
+    rc = run_steps(steps, ctx, farm and farm.limits(), logfile=False)
+
+    if defer:
+        # Marked again after deploys (even if some of them failed) as the
+        # journal may be flushed while building RPMs, before they're copied.
+        MCU.mark_pending(ctx["repos"], journal)
+
+        if ctx.get("quiet_period", 0):
+            MCU.spawn_pending_update(ctx["quiet_period"], journal)
+
+    if cache is not None:
+        cache.report()
+        cache.evict()
+
+    return rc
 
 
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,321 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.commands.update as MCU
+import myrepo.commands.utils as MCUT
+import myrepo.globals as G
+import myrepo.headercache as MHC
+import myrepo.journal as MJ
+import myrepo.plan as MPL
+import myrepo.utils as MU
+import logging
+import os.path
+import re
+import subprocess
+
+
+# List RPMs in each dir given, separated by the line '::'.
+_LIST_RPMS = "for d in %s; do echo ::; { cd $d && ls -1 -- *.rpm; } " \
+             "2>/dev/null || :; done"
+
+_VER_SEGMENT_RE = re.compile(r"~|[0-9]+|[a-zA-Z]+")
+
+
+def rpmvercmp(a, b):
+    """
+    Compare versions or releases of RPMs in the same way as rpm does.
+
+    >>> rpmvercmp("1.10", "1.9"), rpmvercmp("1.0", "1.0.1")
+    (1, -1)
+    >>> rpmvercmp("1.0~rc1", "1.0"), rpmvercmp("1.0a", "1.0.1")
+    (-1, -1)
+    >>> rpmvercmp("2.fc19", "2.fc19")
+    0
+
+    :return: 1 if a is newer, -1 if b is newer or 0 if they are same
+    """
+    if a == b:
+        return 0
+
+    (xs, ys) = (_VER_SEGMENT_RE.findall(a), _VER_SEGMENT_RE.findall(b))
+    for i in range(max(len(xs), len(ys))):
+        x = xs[i] if i < len(xs) else None
+        y = ys[i] if i < len(ys) else None
+
+        if x == '~' or y == '~':  # Tilde sorts before anything.
+            if x != y:
+                return -1 if x == '~' else 1
+            continue
+
+        if x is None or y is None:
+            return -1 if x is None else 1
+
+        if x.isdigit() != y.isdigit():  # Numbers are newer than alphabets.
+            return 1 if x.isdigit() else -1
+
+        c = cmp(int(x), int(y)) if x.isdigit() else cmp(x, y)
+        if c:
+            return c
+
+    return 0
+
+
+def evrcmp(p1, p2):
+    """
+    :param p1, p2: Dicts of RPMs have epoch, version and release
+    :return: 1 if p1 is newer, -1 if p2 is newer or 0 if they are same
+    """
+    return cmp(int(p1["epoch"] or 0), int(p2["epoch"] or 0)) or \
+        rpmvercmp(p1["version"], p2["version"]) or \
+        rpmvercmp(p1["release"], p2["release"])
+
+
+def parse_filename(filename):
+    """
+    Parse the file name of RPM named in the form of N-V-R.A.rpm.
+
+    >>> p = parse_filename("foo-bar-0.1.2-1.fc19.noarch.rpm")
+    >>> [p[k] for k in ("name", "version", "release", "arch")]
+    ['foo-bar', '0.1.2', '1.fc19', 'noarch']
+    >>> parse_filename("foo.rpm")
+
+    :return: A dict of the RPM or None if the name is not in the form
+    """
+    m = re.match(r"^(.+)-([^-]+)-([^-]+)\.([^.-]+)\.rpm$", filename)
+    if not m:
+        return None
+
+    return dict(zip(("name", "version", "release", "arch"), m.groups()),
+                epoch=None, filename=filename)
+
+
+def _read_rpm(path, cache=None):
+    """
+    Read NEVRA of the RPM through the header cache, or from its file name if
+    failed, e.g. no headers could be read as it's a dangling symlink.
+
+    :param path: RPM path on this host
+    :param cache: myrepo.headercache.HeaderCache instance or None
+
+    :return: A dict of the RPM or None
+    """
+    cache = MHC.shared() if cache is None else cache
+    try:
+        h = cache.get(path)
+        return dict(name=h["name"], epoch=h["epoch"], version=h["version"],
+                    release=h["release"], filename=os.path.basename(path),
+                    arch="src" if h["is_srpm"] else h["arch"])
+    except:
+        return parse_filename(os.path.basename(path))
+
+
+def list_rpms_to_gc(ps, keep=G._GC_KEEP):
+    """
+    :param ps: List of dicts of RPMs in a dir
+    :param keep: Number of the newest builds of each package to keep
+
+    :return: List of the file names of RPMs to remove, older builds than the
+        newest ``keep`` ones of each name and arch
+
+    >>> fs = ["a-0.1-1.noarch.rpm", "a-0.10-1.noarch.rpm",
+    ...       "a-0.9-1.noarch.rpm", "a-0.1-1.src.rpm", "b-1.0-1.x86_64.rpm"]
+    >>> list_rpms_to_gc([parse_filename(f) for f in fs], 1)
+    ['a-0.9-1.noarch.rpm', 'a-0.1-1.noarch.rpm']
+    """
+    groups = dict()
+    for p in ps:
+        groups.setdefault((p["name"], p["arch"]), []).append(p)
+
+    return MU.concat([p["filename"] for p in
+                      sorted(g, cmp=evrcmp, reverse=True)[keep:]]
+                     for _k, g in sorted(groups.iteritems()))
+
+
+def list_rpms(repos):
+    """
+    List RPMs in dirs of given repos on a server at once.
+
+    :param repos: List of Repo instances on the same server
+    :return: List of lists of file names of RPMs in each dir of each repo
+    """
+    dirs = MU.concat([os.path.join(r.destdir, d) for d in ["sources"] +
+                      r.archs] for r in repos)
+
+    repos[0].server.connect()
+    c = repos[0].mk_cmd(_LIST_RPMS % ' '.join(dirs))[0]
+    out = subprocess.check_output(c, shell=True)
+
+    ret = []
+    for l in out.splitlines():
+        if l == "::":
+            ret.append([])
+        elif ret and l.endswith(".rpm"):
+            ret[-1].append(l)
+
+    assert len(ret) == len(dirs), "Wrong output of the command: " + c
+    return ret
+
+
+def _gc_cmd(dir, fs, adir=None):
+    """
+    :param dir: Dir in which RPMs to remove are
+    :param fs: List of file names of RPMs to remove
+    :param adir: Dir to move RPMs into instead of removing them, or None
+
+    >>> _gc_cmd("/y/19/x86_64", ["a.rpm", "b.rpm"])
+    'cd /y/19/x86_64 && rm -f a.rpm b.rpm'
+    >>> _gc_cmd("/y/19/x86_64", ["a.rpm"], "/a/19/x86_64")
+    'cd /y/19/x86_64 && mkdir -p /a/19/x86_64 && mv -f a.rpm /a/19/x86_64/'
+    """
+    if adir is None:
+        return "cd %s && rm -f %s" % (dir, ' '.join(fs))
+
+    return "cd %s && mkdir -p %s && mv -f %s %s/" % (dir, adir, ' '.join(fs),
+                                                     adir)
+
+
+def mk_steps_0(repos, keep=G._GC_KEEP, archive=None, update=True):
+    """
+    Make up a plan (steps) to remove old RPMs in dirs of given repos on a
+    server and to update metadata of the dirs changed once after that.
+
+    :param repos: List of Repo instances on the same server
+    :param keep: Number of the newest builds of each package to keep
+    :param archive: Dir to move old RPMs into instead of removing them
+    :param update: Update metadata of the dirs changed if True
+
+    :return: A tuple of (list of Steps, list of (name, update command) of the
+        dirs changed)
+    """
+    server = repos[0].server
+    cache = MHC.shared()
+
+    dirs = MU.concat([(r, s) for s in ["sources"] + r.archs] for r in repos)
+    usteps = MCU.mk_steps(repos)  # Same order as ``dirs``.
+
+    cs = []
+    updates = []
+    for (repo, sub), fs, ustep in zip(dirs, list_rpms(repos), usteps):
+        d = os.path.join(repo.destdir, sub)
+        if server.is_local:
+            ps = [_read_rpm(os.path.join(os.path.expanduser(d), f), cache)
+                  for f in fs]
+        else:
+            ps = [parse_filename(f) for f in fs]
+
+        # RPMs not in the form of N-V-R.A.rpm are kept.
+        gcs = list_rpms_to_gc([p for p in ps if p is not None], keep)
+        if gcs:
+            logging.info("%d RPMs to remove in %s: %s" %
+                         (len(gcs), d, ', '.join(gcs)))
+            cs.append(_gc_cmd(d, gcs, archive and
+                              os.path.join(archive, repo.subdir, sub)))
+            updates.append((ustep.name, ustep.cmd))
+
+    if server.is_local:
+        cache.report()
+
+    if not cs:
+        return ([], [])
+
+    pc = server.pool_gc_cmd()
+    if pc is not None:
+        cs.append(pc)
+
+    # Run in subshells as each command changes the dir.
+    c = repos[0].mk_cmd(' && '.join("(%s)" % c for c in cs))[0]
+    gstep = MPL.Step(c, name="gc:%s@%s" % (server.user, server.name))
+
+    if not update:
+        return ([gstep], updates)
+
+    return ([gstep] + [MPL.Step(uc, [gstep], n) for n, uc in updates],
+            updates)
+
+
+def mk_steps(repos, keep=G._GC_KEEP, archive=None, update=True):
+    """
+    Make up a plan (steps) to remove old RPMs in dirs of given repos. It's
+    similar to above ``mk_steps_0`` but applicable to repos on multiple
+    servers; RPMs in repos on each server are listed and removed at once.
+
+    :return: A tuple of (list of Steps, list of (name, update command) of the
+        dirs changed)
+    """
+    servers = []  # to keep the order of servers.
+    srepos = dict()  # (user, hostname) -> [repo]
+
+    for repo in repos:
+        k = (repo.server.user, repo.server.name)
+        if k not in srepos:
+            servers.append(k)
+
+        srepos.setdefault(k, []).append(repo)
+
+    (steps, updates) = ([], [])
+    for k in servers:
+        (ss, us) = mk_steps_0(srepos[k], keep, archive, update)
+        steps += ss
+        updates += us
+
+    return (steps, updates)
+
+
+def run(ctx, journal=None):
+    """
+    Remove old RPMs in the yum repos, and update metadata of the dirs
+    changed, or mark them dirty w/ --defer-update.
+
+    :param ctx: Application context
+    :param journal: myrepo.journal.Journal instance to mark dirs dirty in, or
+        None to use the default one
+
+    :return: True if commands run successfully else False
+    """
+    MCUT.assert_ctx_has_key(ctx, "repos")
+
+    defer = ctx.get("defer_update", False)
+    (steps, updates) = mk_steps(ctx["repos"], ctx.get("gc_keep", G._GC_KEEP),
+                                ctx.get("gc_archive", None), not defer)
+
+    if ctx.get("dryrun", False):
+        for s in steps:
+            print s.cmd
+
+        return True
+
+    if not steps:
+        logging.info("No RPMs to remove")
+        return True
+
+    journal = MJ.Journal() if defer and journal is None else journal
+    if defer:
+        # Marked before removals in case this process dies halfway.
+        journal.mark(updates)
+
+    logging.info("Run myrepo.commands.gc.run...")
+    rc = MCUT.run_steps(steps, ctx, logfile=False)
+
+    if defer:
+        # Marked again after removals (even if some of them failed) as the
+        # journal may be flushed while they're running.
+        journal.mark(updates)
+
+    return rc
+
+
+# vim:sw=4:ts=4:et:
@@ -18,10 +18,12 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 from myrepo.commands.utils import assert_repo, assert_ctx_has_keys, \
-    setup_workdir
+    setup_workdir, run_steps
 from myrepo.srpm import Srpm
 
 import myrepo.commands.deploy as MCD
+import myrepo.globals as G
+import myrepo.plan as MPL
 import myrepo.repo as MR
 import myrepo.shell as MS
 import myrepo.utils as MU
@@ -31,11 +33,13 @@ import getpass
 import glob
 import locale
 import logging
+import multiprocessing.pool
 import os.path
 import os
 import re
 import subprocess
 import sys
+import tempfile
 import uuid
 
 
@@ -80,8 +84,8 @@ def gen_repo_file_content(ctx, tpaths):
     Make up the content of .repo file for given yum repositoriy ``repo``
     will be put in /etc/yum.repos.d/ and return it.
 
-    NOTE: This function will be called more than twice. So, results of this
-    function will be memoized.
+    NOTE: This function will be called more than twice for each repo, and
+    results of this are memoized in myrepo.utils.compile_template.
 
     :param ctx: Context object to instantiate the template
     :param tpaths: Template path list :: [str]
@@ -129,6 +133,14 @@ def gen_rpmspec_content(repo, ctx, tpaths):
     return MU.compile_template("yum-repodata.spec", ctx, tpaths)
 
 
+def _rpmspec_path(repo, workdir):
+    """
+    :param repo: Repo object
+    :param workdir: Working dir to build RPMs
+    """
+    return os.path.join(workdir, "%s-%s.spec" % (repo.reponame, repo.version))
+
+
 def gen_repo_files_g(repo, ctx, workdir, tpaths):
     """
     Generate .repo, mock.cfg files and the RPM SPEC file for given ``repo`` and
@@ -145,7 +157,7 @@ def gen_repo_files_g(repo, ctx, workdir, tpaths):
     ctx0.update(repo.as_dict())
     rfc = gen_repo_file_content(ctx0, tpaths)
     yield (os.path.join(workdir, "%s.repo" % repo.reponame), rfc)
-    yield (os.path.join(workdir, "%s-%s.spec" % (repo.reponame, repo.version)),
+    yield (_rpmspec_path(repo, workdir),
            gen_rpmspec_content(repo, ctx, tpaths))
 
 
@@ -181,17 +193,18 @@ cat << "%(eof)s" >> %(mockcfg)s
 )"""
 
 
-def gen_mockcfg_files_cmd_g(repo, ctx, workdir, tpaths, eof=None):
+def gen_mockcfg_files_g(repo, ctx, workdir, tpaths):
     """
-    Generate .repo, mock.cfg files and the RPM SPEC file for given ``repo`` and
-    return list of pairs of the path and the content of each files.
+    Generate the content of mock.cfg files for given ``repo``, appended to the
+    ones of base dists in /etc/mock/.
 
     :param repo: Repo object
     :param ctx: Context object to instantiate the template
     :param workdir: Working dir to build RPMs
     :param tpaths: Template path list :: [str]
 
-    :return: List of pairs of path to file to generate and its content
+    :return: List of tuples of (path to file to generate, the base mock.cfg
+        file name, content to append)
     """
     ctx0 = ctx
     ctx0.update(repo.as_dict())
@@ -204,15 +217,96 @@ def gen_mockcfg_files_cmd_g(repo, ctx, workdir, tpaths, eof=None):
         ctx2 = dict(mockcfg=d.mockcfg, label=label, repo_file_content=rfc2)
         content = gen_mock_cfg_content(ctx2, tpaths)
 
-        eof = gen_eof() if eof is None or not callable(eof) else eof()
+        yield (os.path.join(workdir, "%s.cfg" % label), d.mockcfg, content)
+
+
+def gen_mockcfg_files_cmd_g(repo, ctx, workdir, tpaths, eof=None):
+    """
+    Generate command strings to write mock.cfg files for given ``repo``. It's
+    only used to show what will be done w/ --dryrun; files are written
+    directly w/ ``write_files`` otherwise.
+
+    :param repo: Repo object
+    :param ctx: Context object to instantiate the template
+    :param workdir: Working dir to build RPMs
+    :param tpaths: Template path list :: [str]
 
-        path = os.path.join(workdir, "%s.cfg" % label)
-        ctx3 = dict(base_mockcfg=d.mockcfg, mockcfg=path, eof=eof,
+    :return: List of command strings to write mock.cfg files
+    """
+    for path, base, content in gen_mockcfg_files_g(repo, ctx, workdir,
+                                                   tpaths):
+        eof = gen_eof() if eof is None or not callable(eof) else eof()
+        ctx3 = dict(base_mockcfg=base, mockcfg=path, eof=eof,
                     content=content)
 
         yield _CMD_TEMPLATE_0_1 % ctx3
 
 
+def _write_file(path, content, base=None):
+    """
+    Write the file atomically; content is written into a temporary file in
+    the same dir and it's renamed to ``path``. The content is terminated with
+    a new line in the same way as the commands ``mk_write_file_cmd`` makes up.
+
+    :param path: Path of output file
+    :param content: Content to be written into output file
+    :param base: Path of the file the content is appended to, or None
+    """
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path),
+                                 prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if base is not None:
+                f.write(open(base).read())
+
+            f.write(content.encode("utf-8") if isinstance(content, unicode)
+                    else content)
+            f.write("\n")
+
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def write_files(repos, ctx, mockdir="/etc/mock"):
+    """
+    Write .repo, mock.cfg files and the RPM SPEC files for given repos in
+    ctx["workdir"] directly. The content of files are made up in this
+    thread, and files are written in parallel.
+
+    :param repos: List of Repo instances
+    :param ctx: Context object to instantiate the template
+    :param mockdir: Dir in which mock.cfg files of base dists are
+
+    :return: List of paths of files written
+    """
+    _check_vars_for_template(ctx, ["workdir", "tpaths"])
+    (workdir, tpaths) = (ctx["workdir"], ctx["tpaths"])
+
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+
+    files = []
+    for repo in repos:
+        files += [(p, c, None) for p, c in
+                  gen_repo_files_g(repo, ctx, workdir, tpaths)]
+        files += [(p, c, os.path.join(mockdir, b)) for p, b, c in
+                  gen_mockcfg_files_g(repo, ctx, workdir, tpaths)]
+
+    pool = multiprocessing.pool.ThreadPool(max(1, min(len(files),
+                                                      ctx.get("maxjobs",
+                                                              G._MAXJOBS))))
+    try:
+        pool.map(lambda f: _write_file(*f), files, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return [p for p, _c, _b in files]
+
+
 # NOTE: It will override some macros to fix the dir to build srpm, name of
 # built srpm and so on.
 _CMD_TEMPLATE_1 = """\
@@ -451,6 +545,54 @@ def prepare_0(repo, ctx, deploy=False, eof=None):
     return [MS.join(c, *dcs)]
 
 
+def mk_steps_0(repo, ctx, deploy=False):
+    """
+    Make up a plan (steps) to generate repo's metadata rpms. It does same as
+    the commands ``prepare_0`` makes up but files to build the SRPM from must
+    be written w/ ``write_files`` in advance.
+
+    :param repo: myrepo.repo.Repo instance
+    :param ctx: Context object to instantiate the template
+    :param deploy: Deploy generated yum repo metadata RPMs also if True
+
+    :return: List of myrepo.plan.Step instances
+    """
+    assert_repo(repo)
+    _check_vars_for_template(ctx, ["workdir", "tpaths"])
+
+    fsteps = []
+    keyid = ctx.get("keyid", False)
+    if keyid:
+        fsteps.append(MPL.Step(mk_export_gpgkey_cmd(keyid, ctx["workdir"],
+                                                    repo),
+                               name="export:gpgkey:%s" % repo.dist))
+
+    # NOTE: srpm must be built after all files were generated.
+    bstep = MPL.Step(mk_build_srpm_cmd(_rpmspec_path(repo, ctx["workdir"]),
+                                       ctx.get("verbose", False)),
+                     fsteps, "build:srpm:%s" % repo.dist)
+
+    if not deploy:
+        return [bstep]
+
+    srpm = _mk_repo_metadata_srpm_obj(repo, ctx["workdir"])
+    return MCD.mk_steps_0(repo, [srpm], True, [bstep])
+
+
+def mk_steps(repos, ctx, deploy=False):
+    """
+    Make up a plan (steps) to generate repos' metadata rpms. It's similar to
+    above ``mk_steps_0`` but applicable to multiple repos.
+
+    :param repos: List of Repo instances
+    :param ctx: Context object to instantiate the template
+    :param deploy: Deploy generated yum repo metadata RPMs also if True
+
+    :return: List of myrepo.plan.Step instances
+    """
+    return MU.concat(mk_steps_0(repo, ctx, deploy) for repo in repos)
+
+
 def prepare(repos, ctx, deploy=False, eof=None):
     """
     Make up list of command strings to update metadata of given repos.
@@ -510,17 +652,25 @@ def run(ctx):
         ctx["workdir"] = workdir = _mk_temporary_workdir()
 
     ctx = _setup_extra_template_vars(ctx)
-    cs = [c for c in prepare(ctx["repos"], ctx, ctx.get("deploy", False))]
 
     if ctx.get("dryrun", False):
-        for c in cs:
+        for c in prepare(ctx["repos"], ctx, ctx.get("deploy", False)):
             print c
 
         return True
 
+    try:
+        fs = write_files(ctx["repos"], ctx)
+        logging.info("Wrote %d files in %s" % (len(fs), workdir))
+    except (IOError, OSError) as e:
+        logging.error("Failed to write files in %s: %s" % (workdir, e))
+        return False
+
+    steps = mk_steps(ctx["repos"], ctx, ctx.get("deploy", False))
+
     logging.info("Run myrepo.commands.genconf.run...")
     _logfile = lambda: os.path.join(workdir, "%d.log" % os.getpid())
-    rc = all(MS.prun(cs, dict(logfile=_logfile, )))
+    rc = run_steps(steps, ctx, logfile=_logfile)
 
     if not ctx.get("deploy", False):
         prefix = "Created " if rc else "Failed to create "
@@ -16,7 +16,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 from myrepo.commands.utils import assert_repo, assert_ctx_has_key, \
-    setup_workdir
+    setup_workdir, prun
 
 import myrepo.commands.genconf as MCG
 import myrepo.shell as MS
@@ -80,7 +80,7 @@ def run(ctx):
         return True
 
     logging.info("Run myrepo.commands.init.run...")
-    if all(MS.prun(cs, dict(logfile=False, ))):
+    if all(prun(cs, ctx, logfile=False)):
         return MCG.run(ctx) if ctx.get("genconf", False) else True
     else:
         RuntimeError("Could not initialize the yum repos")
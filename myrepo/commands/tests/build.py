@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import myrepo.buildcache as MBC
 import myrepo.commands.build as TT
 import myrepo.repo as MR
 import myrepo.srpm as MS
@@ -39,6 +40,11 @@ def mk_local_repos(**kwargs):
             MR.Repo("rhel", 6, ["x86_64", ], server, **kwargs)]
 
 
+def mock_cmd(dist, srpm):
+    return "mock -r %s --uniqueext=%s --resultdir=%s %s" % \
+        (dist.label, MR.build_id(srpm), dist.rpmdir(srpm), srpm.path)
+
+
 def build_sample_rpm_if_not_exist():
     rpms = glob.glob(os.path.join(CURDIR, "rpm-sample-*.src.rpm"))
 
@@ -62,8 +68,8 @@ class Test_00_pure_functions(unittest.TestCase):
         (repo, srpm) = (self.repo, self.srpm)
         srpm.noarch = False  # Override it.
 
-        cs_expected = ["mock -r fedora-19-x86_64 %s" % srpm.path,
-                       "mock -r fedora-19-i386 %s" % srpm.path]
+        cs_expected = [mock_cmd(repo.dists[0], srpm),
+                       mock_cmd(repo.dists[1], srpm)]
         cs = TT.prepare_0(repo, srpm, logging.INFO)
 
         self.assertListEqual(cs, cs_expected)
@@ -71,7 +77,7 @@ class Test_00_pure_functions(unittest.TestCase):
     def test_02_prepare_0_noarch(self):
         (repo, srpm) = (self.repo, self.srpm)
 
-        cs_expected = ["mock -r fedora-19-x86_64 %s" % srpm.path]
+        cs_expected = [mock_cmd(repo.dists[0], srpm)]
         cs = TT.prepare_0(repo, srpm, logging.INFO)
 
         self.assertListEqual(cs, cs_expected)
@@ -80,17 +86,40 @@ class Test_00_pure_functions(unittest.TestCase):
         repo = mk_local_repos(reponame="fedora-custom", selfref=True)[1]
         srpm = self.srpm
 
-        cs_expected = ["mock -r fedora-custom-19-x86_64 %s" % srpm.path]
+        cs_expected = [mock_cmd(repo.dists[0], srpm)]
+        self.assertTrue(cs_expected[0].startswith("mock -r "
+                                                  "fedora-custom-19-x86_64 "))
         cs = TT.prepare_0(repo, srpm, logging.INFO)
 
         self.assertListEqual(cs, cs_expected)
 
+    def test_06_prepare_0__cache(self):
+        (repo, srpm) = (self.repo, self.srpm)
+        srpm.noarch = False
+
+        workdir = C.setup_workdir()
+        try:
+            cache = MBC.BuildCache(workdir, mockcfgdir=workdir)
+            os.makedirs(os.path.join(cache.path(srpm.path,
+                                                "fedora-19-x86_64"),
+                                     MBC._STAMP))
+
+            cs = TT.prepare_0(repo, srpm, logging.INFO, cache)
+
+            self.assertEquals(len(cs), 1)
+            c = mock_cmd(repo.dists[1], srpm)
+            self.assertTrue(cs[0].startswith(c + " && "))
+            self.assertTrue(cache.path(srpm.path, "fedora-19-i386") in cs[0])
+            self.assertEquals((cache.hits, cache.misses), (1, 1))
+            self.assertEquals(repo.mockdirs(srpm, cache)[0],
+                              cache.path(srpm.path, "fedora-19-x86_64"))
+        finally:
+            C.cleanup_workdir(workdir)
+
     def test_10_prepare__noarch(self):
         (repos, srpm) = (self.repos, self.srpm)
 
-        cs_expected = ["mock -r fedora-18-x86_64 %s" % srpm.path,
-                       "mock -r fedora-19-x86_64 %s" % srpm.path,
-                       "mock -r rhel-6-x86_64 %s" % srpm.path]
+        cs_expected = [mock_cmd(r.dists[0], srpm) for r in repos]
         cs = TT.prepare(repos, srpm, logging.INFO)
 
         self.assertListEqual(cs, cs_expected)
@@ -0,0 +1,55 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.commands.cache as TT
+import myrepo.headercache as MHC
+import myrepo.tests.common as C
+import myrepo.tests.headercache as THC
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_run(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.cache = MHC.HeaderCache(os.path.join(self.workdir,
+                                                  "headers.sqlite"),
+                                     THC.read_entry)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run__prune(self):
+        rpm = os.path.join(self.workdir, "a-0.1-1.src.rpm")
+        open(rpm, 'w').write("a")
+        self.cache.get(rpm)
+
+        self.assertTrue(TT.run(dict(args=["stats"]), self.cache))
+        self.assertEquals(len(self.cache), 1)
+
+        os.remove(rpm)
+        self.assertTrue(TT.run(dict(args=[]), self.cache))
+        self.assertEquals(len(self.cache), 0)
+
+    def test_20_run__unknown_action(self):
+        self.assertFalse(TT.run(dict(args=["clean"]), self.cache))
+
+
+# vim:sw=4:ts=4:et:
@@ -18,14 +18,17 @@
 import myrepo.commands.deploy as TT
 import myrepo.commands.build as MCB
 import myrepo.commands.update as MCU
+import myrepo.journal as MJ
+import myrepo.plan as MPL
 import myrepo.repo as MR
 import myrepo.srpm as MS
-import myrepo.utils as MU
 import myrepo.tests.common as C
 
+import StringIO
 import glob
 import os.path
 import subprocess
+import sys
 import unittest
 
 
@@ -48,9 +51,9 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.noarch.rpm",
                   "/tmp/yum/fedora/19/x86_64")
 
         ctx = dict(other_archs_s="i386", primary_arch="x86_64",
@@ -74,9 +77,9 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.noarch.rpm",
                   "/tmp/yum/fedora/19/x86_64")
 
         ctx = dict(other_archs_s="i386", primary_arch="x86_64",
@@ -99,9 +102,9 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.noarch.rpm",
                   "/tmp/yum/fedora/19/x86_64")
 
         cs_expected = [_join(c0, ucs[0]), _join(c1, *ucs[1:])]
@@ -121,9 +124,9 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.noarch.rpm",
                   "/tmp/yum/fedora/19/x86_64")
 
         cs_expected = [_join(bcmds[0], c0, c1, *ucs)]
@@ -142,11 +145,11 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.x86_64.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.x86_64.rpm",
                   "/tmp/yum/fedora/19/x86_64")
-        c2 = dcmd("/var/lib/mock/fedora-19-i386/result/*.i386.rpm",
+        c2 = dcmd("/var/lib/mock/fedora-19-i386-dummy/result/*.i386.rpm",
                   "/tmp/yum/fedora/19/i386")
 
         cs_expected = [_join(c0, ucs[0]), _join(c1, ucs[1]), _join(c2, ucs[2])]
@@ -166,114 +169,299 @@ class Test_00_pure_functions(unittest.TestCase):
         ucs = MCU.prepare_0(repo)
 
         dcmd = repo.server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
+        c0 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.src.rpm",
                   "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.x86_64.rpm",
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.x86_64.rpm",
                   "/tmp/yum/fedora/19/x86_64")
-        c2 = dcmd("/var/lib/mock/fedora-19-i386/result/*.i386.rpm",
+        c2 = dcmd("/var/lib/mock/fedora-19-i386-dummy/result/*.i386.rpm",
                   "/tmp/yum/fedora/19/i386")
 
         cs_expected = [_join(bcs[0], c1, ucs[1], c0, ucs[0]),
                        _join(bcs[1], c2, ucs[2])]
         self.assertListEqual(TT.prepare_0(repo, srpm, True), cs_expected)
 
-    def test_10_prepare__localhost_noarch(self):
+    def test_20_mk_steps_0__localhost_w_build(self):
         server = MR.Server("localhost", topdir="/tmp/yum",
                            baseurl="file:///tmp")
-        repos = [MR.Repo("fedora", 18, ["x86_64", "i386"], server),
-                 MR.Repo("fedora", 19, ["x86_64", "i386"], server),
-                 MR.Repo("rhel", 6, ["x86_64", ], server)]
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
 
         srpm = MS.Srpm("/a/b/c/dummy.src.rpm")
-        srpm.name = "foo"
-        srpm.version = "1.0"
-        srpm.noarch = True
-
-        cs_expected = []
+        srpm.noarch = False
 
-        ucs = MCU.prepare_0(repos[0])
-        dcmd = repos[0].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-18-x86_64/result/*.src.rpm",
-                  "/tmp/yum/fedora/18/sources")
-        c1 = dcmd("/var/lib/mock/fedora-18-x86_64/result/*.noarch.rpm",
-                  "/tmp/yum/fedora/18/x86_64")
-        ctx = dict(other_archs_s="i386", primary_arch="x86_64",
-                   noarch_rpms="*.noarch.rpm")
-        c2 = "cd /tmp/yum/fedora/18 && " + TT._MK_SYMLINKS_TO_NOARCH_RPM % ctx
-        cs_expected.append(_join(c0, ucs[0]))
-        cs_expected.append(_join(c1, c2, *ucs[1:]))
+        bcs = MCB.prepare_0(repo, srpm)
+        ucs = MCU.prepare_0(repo)
 
-        ucs = MCU.prepare_0(repos[1])
-        dcmd = repos[1].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
-                  "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
+        dcmd = repo.server.deploy_cmd
+        c0 = dcmd("/a/b/c/dummy.src.rpm", "/tmp/yum/fedora/19/sources")
+        c1 = dcmd("/var/lib/mock/fedora-19-x86_64-dummy/result/*.x86_64.rpm",
                   "/tmp/yum/fedora/19/x86_64")
-        ctx = dict(other_archs_s="i386", primary_arch="x86_64",
-                   noarch_rpms="*.noarch.rpm")
-        c2 = "cd /tmp/yum/fedora/19 && " + TT._MK_SYMLINKS_TO_NOARCH_RPM % ctx
-        cs_expected.append(_join(c0, ucs[0]))
-        cs_expected.append(_join(c1, c2, *ucs[1:]))
+        c2 = dcmd("/var/lib/mock/fedora-19-i386-dummy/result/*.i386.rpm",
+                  "/tmp/yum/fedora/19/i386")
+
+        steps = dict((s.cmd, s) for s in TT.mk_steps_0(repo, [srpm], True))
+        deps = lambda c: [s.cmd for s in steps[c].deps]
+
+        self.assertEquals(sorted(steps.keys()),
+                          sorted([c0, c1, c2] + bcs + ucs))
 
-        ucs = MCU.prepare_0(repos[2])
-        dcmd = repos[2].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/rhel-6-x86_64/result/*.src.rpm",
-                  "/tmp/yum/rhel/6/sources")
-        c1 = dcmd("/var/lib/mock/rhel-6-x86_64/result/*.noarch.rpm",
-                  "/tmp/yum/rhel/6/x86_64")
-        cs_expected.append(_join(c0, ucs[0]))
-        cs_expected.append(_join(c1, *ucs[1:]))
+        # The SRPM and the 'sources' dir do not wait for builds.
+        self.assertEquals(deps(c0), [])
+        self.assertEquals(deps(ucs[0]), [c0])
 
-        self.assertListEqual(TT.prepare(repos, srpm), cs_expected)
+        self.assertEquals(deps(c1), [bcs[0]])
+        self.assertEquals(deps(ucs[1]), [c1])
+        self.assertEquals(deps(c2), [bcs[1]])
+        self.assertEquals(deps(ucs[2]), [c2])
 
-    def test_12_prepare__localhost_noarch_w_build(self):
+    def test_22_mk_steps_0__localhost_noarch(self):
         server = MR.Server("localhost", topdir="/tmp/yum",
                            baseurl="file:///tmp")
-        repos = [MR.Repo("fedora", 18, ["x86_64", "i386"], server),
-                 MR.Repo("fedora", 19, ["x86_64", "i386"], server),
-                 MR.Repo("rhel", 6, ["x86_64", ], server)]
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
 
         srpm = MS.Srpm("/a/b/c/dummy.src.rpm")
-        srpm.name = "foo"
-        srpm.version = "1.0"
         srpm.noarch = True
 
-        cs_expected = []
+        ucs = MCU.prepare_0(repo)
+        c1 = repo.server.deploy_cmd(
+            "/var/lib/mock/fedora-19-x86_64-dummy/result/*.noarch.rpm",
+            "/tmp/yum/fedora/19/x86_64")
 
-        ucs = MCU.prepare_0(repos[0])
-        bcs = MCB.prepare_0(repos[0], srpm)  # ['mock -r fedora-18-x86_64 ...']
-        dcmd = repos[0].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-18-x86_64/result/*.src.rpm",
-                  "/tmp/yum/fedora/18/sources")
-        c1 = dcmd("/var/lib/mock/fedora-18-x86_64/result/*.noarch.rpm",
-                  "/tmp/yum/fedora/18/x86_64")
-        ctx = dict(other_archs_s="i386", primary_arch="x86_64",
-                   noarch_rpms="*.noarch.rpm")
-        c2 = "cd /tmp/yum/fedora/18 && " + TT._MK_SYMLINKS_TO_NOARCH_RPM % ctx
-        cs_expected.append(_join(bcs[0], c0, c1, c2, *ucs))
+        steps = dict((s.cmd, s) for s in TT.mk_steps_0(repo, [srpm]))
+        self.assertEquals(len(steps), 6)
+        self.assertEquals(steps[c1].deps, [])
 
-        ucs = MCU.prepare_0(repos[1])
-        bcs = MCB.prepare_0(repos[1], srpm)  # ['mock -r fedora-19-x86_64 ...']
-        dcmd = repos[1].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.src.rpm",
-                  "/tmp/yum/fedora/19/sources")
-        c1 = dcmd("/var/lib/mock/fedora-19-x86_64/result/*.noarch.rpm",
-                  "/tmp/yum/fedora/19/x86_64")
-        ctx = dict(other_archs_s="i386", primary_arch="x86_64",
-                   noarch_rpms="*.noarch.rpm")
-        c2 = "cd /tmp/yum/fedora/19 && " + TT._MK_SYMLINKS_TO_NOARCH_RPM % ctx
-        cs_expected.append(_join(bcs[0], c0, c1, c2, *ucs))
-
-        ucs = MCU.prepare_0(repos[2])
-        bcs = MCB.prepare_0(repos[2], srpm)  # ['mock -r rhel-6-x86_64 ...']
-        dcmd = repos[2].server.deploy_cmd
-        c0 = dcmd("/var/lib/mock/rhel-6-x86_64/result/*.src.rpm",
-                  "/tmp/yum/rhel/6/sources")
-        c1 = dcmd("/var/lib/mock/rhel-6-x86_64/result/*.noarch.rpm",
-                  "/tmp/yum/rhel/6/x86_64")
-        cs_expected.append(_join(bcs[0], c0, c1, *ucs))
-
-        self.assertListEqual(TT.prepare(repos, srpm, True), cs_expected)
+        # Metadata of both archs are updated after symlinks were made.
+        symlink = steps[ucs[1]].deps[0]
+        self.assertEquals(steps[ucs[2]].deps, [symlink])
+        self.assertEquals(symlink.deps, [steps[c1]])
+
+    def test_24_mk_steps_0__localhost_multi_srpms(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        srpms = [MS.Srpm("/a/b/c/%s.src.rpm" % n, n) for n in ("foo", "bar")]
+        for srpm in srpms:
+            srpm.noarch = False
+
+        ucs = MCU.prepare_0(repo)
+        c0s = [repo.server.deploy_cmd(s.path, "/tmp/yum/fedora/19/sources")
+               for s in srpms]
+
+        steps = TT.mk_steps_0(repo, srpms, True)
+        cs = [s.cmd for s in steps]
+
+        # Metadata of each dir is updated only once after all were copied.
+        for uc in ucs:
+            self.assertEquals(cs.count(uc), 1)
+
+        usteps = dict((s.cmd, s) for s in steps if s.cmd in ucs)
+        self.assertEquals([s.cmd for s in usteps[ucs[0]].deps], c0s)
+        self.assertEquals(len(usteps[ucs[1]].deps), 2)
+
+        # RPMs are copied from the result dir of each build.
+        dcs = [s.cmd for s in usteps[ucs[1]].deps]
+        for srpm, dc in zip(srpms, dcs):
+            rpmdir = "/var/lib/mock/fedora-19-x86_64-%s/result" % srpm.name
+            self.assertTrue(rpmdir in dc, dc)
+
+    def test_26_mk_steps_0__localhost_chain_build(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        foo = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=False)
+        bar = MS.Srpm("/a/b/c/bar.src.rpm", "bar", noarch=False,
+                      buildrequires=["foo-devel"])
+
+        ucs = MCU.prepare_0(repo)
+        steps = TT.mk_steps_0(repo, [bar, foo], True, chain=True)
+        names = [s.name for s in steps]
+
+        # Metadata of arch dirs are refreshed between layers but the one of
+        # 'sources' is updated only once at the end.
+        self.assertEquals([s.cmd for s in steps].count(ucs[0]), 1)
+        self.assertEquals([s.cmd for s in steps].count(ucs[1]), 2)
+
+        bstep = steps[names.index("build:fedora-19-x86_64:bar")]
+        self.assertEquals([s.name for s in bstep.deps],
+                          ["refresh:fedora-19:x86_64:0",
+                           "refresh:fedora-19:i386:0"])
+
+        refresh = bstep.deps[0]
+        self.assertEquals([s.name for s in refresh.deps],
+                          ["deploy:fedora-19:x86_64:foo"])
+
+    def test_28_mk_steps_0__remote_build(self):
+        server = MR.Server("yumrepos-1.local", "jdoe", topdir="/tmp/yum",
+                           mux=False)
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        srpm = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=False)
+        steps = TT.mk_steps_0(repo, [srpm], True, remote=True)
+        bsteps = [s for s in steps if s.name.startswith("build:")]
+
+        # Only the SRPM is copied to the server.
+        scps = [s.cmd for s in steps if s.cmd.startswith("scp ")]
+        self.assertEquals(scps, [server.deploy_cmd(srpm.path,
+                                                   "/tmp/yum/fedora/19/"
+                                                   "sources")])
+
+        self.assertEquals(len(bsteps), 2)
+        for bstep, d in zip(bsteps, repo.dists):
+            self.assertTrue(bstep.cmd.startswith("ssh "))
+            self.assertTrue("mock -r %s " % d.label in bstep.cmd)
+            self.assertTrue("/tmp/yum/fedora/19/sources/foo.src.rpm"
+                            in bstep.cmd)
+            self.assertTrue("mv %s/*.%s.rpm /tmp/yum/fedora/19/%s/" %
+                            (d.rpmdir(srpm), d.arch, d.arch) in bstep.cmd)
+            self.assertEquals([s.cmd for s in bstep.deps], scps)
+
+    def test_30_mk_steps_0__localhost_bulk(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp", transfer="tar")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        srpm = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=True)
+        steps = TT.mk_steps_0(repo, [srpm], True)
+        names = [s.name for s in steps]
+
+        # A build, a bulk deploy and updates of three dirs.
+        self.assertEquals(len(steps), 5)
+
+        bulk = steps[names.index("deploy:fedora-19:foo")]
+        self.assertEquals([s.name for s in bulk.deps],
+                          ["build:fedora-19-x86_64:foo"])
+        self.assertTrue("--transform 's,^,sources/,' foo.src.rpm" in
+                        bulk.cmd)
+        self.assertTrue("--transform 's,^,x86_64/,' *.noarch.rpm" in
+                        bulk.cmd)
+        self.assertTrue("for arch in i386" in bulk.cmd)  # symlinks.
+
+        for s in steps:
+            if s.name.startswith("update:"):
+                self.assertEquals(s.deps, [bulk])
+
+    def test_32_mk_steps_0__localhost_noarch_pool(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp", pool=True)
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        srpm = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=True)
+        steps = TT.mk_steps_0(repo, [srpm], True)
+        names = [s.name for s in steps]
+
+        # No symlinks to noarch RPMs are made.
+        self.assertFalse([n for n in names if n.startswith("symlink:")])
+
+        dstep = steps[names.index("deploy:fedora-19:noarch:foo")]
+        self.assertTrue("mkdir -p /tmp/yum/fedora/19/x86_64 "
+                        "/tmp/yum/fedora/19/i386" in dstep.cmd)
+        self.assertTrue("p=/tmp/yum/.pool/" in dstep.cmd)
+
+    def test_34_mk_steps_0__localhost_chain_build_defer(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        foo = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=False)
+        bar = MS.Srpm("/a/b/c/bar.src.rpm", "bar", noarch=False,
+                      buildrequires=["foo-devel"])
+
+        steps = TT.mk_steps_0(repo, [bar, foo], True, chain=True, defer=True)
+        names = [s.name for s in steps]
+
+        # Arch dirs are still refreshed between layers for the builds.
+        self.assertFalse([n for n in names if n.startswith("update:")])
+        self.assertEquals(len([n for n in names if
+                               n.startswith("refresh:")]), 2)
+
+    def test_36_mk_steps_0__chain_build_circular_deps(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64"], server)
+
+        foo = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=False,
+                      buildrequires=["bar"])
+        bar = MS.Srpm("/a/b/c/bar.src.rpm", "bar", noarch=False,
+                      buildrequires=["foo"])
+
+        self.assertEquals(TT.mk_steps_0(repo, [foo, bar], True, chain=True),
+                          [])
+        self.assertFalse(TT.run(dict(repos=[repo], srpm=foo,
+                                     srpms=[foo, bar], build=True,
+                                     chain=True)))
+
+    def test_40_run__dryrun(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        foo = MS.Srpm("/a/b/c/foo.src.rpm", "foo", noarch=False)
+        bar = MS.Srpm("/a/b/c/bar.src.rpm", "bar", noarch=True,
+                      buildrequires=["foo-devel"])
+
+        workdir = C.setup_workdir()
+        journal = MJ.Journal(os.path.join(workdir, "pending"))
+        ctx = dict(repos=[repo], srpm=foo, srpms=[foo, bar], build=True,
+                   chain=True, build_cache=False, defer_update=True,
+                   dryrun=True)
+
+        (stdout, out) = (sys.stdout, StringIO.StringIO())
+        try:
+            sys.stdout = out
+            self.assertTrue(TT.run(ctx, journal))
+        finally:
+            sys.stdout = stdout
+
+        # It prints the plan the real run runs and does nothing else.
+        steps = TT.mk_steps([repo], [foo, bar], True, chain=True,
+                            defer=True)
+        self.assertEquals(out.getvalue().splitlines(),
+                          MPL.linearize(MPL.optimize(steps))[0])
+        self.assertEquals(journal.pending(), [])
+
+        C.cleanup_workdir(workdir)
+
+
+class Test_05_run__defer(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run__defer_update_flushed_while_deploying(self):
+        server = MR.Server("localhost", topdir=os.path.join(self.workdir,
+                                                            "yum"),
+                           baseurl="file:///tmp")
+        repo = MR.Repo("fedora", 19, ["x86_64"], server)
+        srpm = MS.Srpm("/a/b/c/foo-0.1-1.src.rpm", "foo", "0.1", "1", True,
+                       True, True)
+
+        journal = MJ.Journal(os.path.join(self.workdir, "pending"))
+        flushed = []
+
+        def run_steps(*args, **kwargs):
+            # Flushed by 'update --pending' while building RPMs, before
+            # they're deployed.
+            flushed.append(journal.flush(lambda cs: [True for c in cs]))
+            return True
+
+        run_steps_0 = TT.run_steps
+        try:
+            TT.run_steps = run_steps
+            self.assertTrue(TT.run(dict(repos=[repo], srpm=srpm, build=True,
+                                        build_cache=False,
+                                        defer_update=True), journal))
+        finally:
+            TT.run_steps = run_steps_0
+
+        self.assertEquals(flushed, [True])
+        self.assertEquals(sorted(n for n, _c in journal.pending()),
+                          ["update:fedora-19:sources",
+                           "update:fedora-19:x86_64"])
 
 
 CURDIR = os.path.dirname(__file__)
@@ -0,0 +1,121 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.commands.gc as TT
+import myrepo.journal as MJ
+import myrepo.repo as MR
+import myrepo.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_00_pure_functions(unittest.TestCase):
+
+    def test_10_list_rpms_to_gc__epoch(self):
+        ps = [dict(name="a", epoch=e, version=v, release="1", arch="x86_64",
+                   filename="a-%s-%s.rpm" % (e, v))
+              for e, v in (("1", "0.1"), (None, "0.2"), ("0", "1.0"))]
+
+        self.assertEquals(TT.list_rpms_to_gc(ps, 1),
+                          ["a-0-1.0.rpm", "a-None-0.2.rpm"])
+        self.assertEquals(TT.list_rpms_to_gc(ps, 3), [])
+
+
+class Test_10_effecful_functions(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+        topdir = os.path.join(self.workdir, "yum")
+        server = MR.Server("localhost", topdir=topdir, baseurl="file:///tmp")
+        self.repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        self.files = dict(sources=["a-0.%d-1.fc19.src.rpm" % i for i
+                                   in range(1, 4)],
+                          x86_64=["a-0.%d-1.fc19.noarch.rpm" % i for i
+                                  in range(1, 4)] + ["b-1.0-1.x86_64.rpm"],
+                          i386=["b-1.0-1.i686.rpm", "README"])
+
+        for d, fs in self.files.iteritems():
+            os.makedirs(os.path.join(self.repo.destdir, d))
+            for f in fs:
+                open(os.path.join(self.repo.destdir, d, f), 'w').write(f)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_list_rpms(self):
+        self.assertEquals(TT.list_rpms([self.repo]),
+                          [sorted(self.files[d]) for d
+                           in ("sources", "x86_64")] + [["b-1.0-1.i686.rpm"]])
+
+    def test_20_mk_steps(self):
+        (steps, updates) = TT.mk_steps([self.repo], 2)
+
+        # Metadata of dirs not changed are not updated.
+        self.assertEquals([s.name for s in steps],
+                          ["gc:%s@localhost" % self.repo.server.user,
+                           "update:fedora-19:sources",
+                           "update:fedora-19:x86_64"])
+        self.assertEquals([n for n, _c in updates], [s.name for s
+                                                     in steps[1:]])
+
+        (steps, updates) = TT.mk_steps([self.repo], 3)
+        self.assertEquals((steps, updates), ([], []))
+
+    def test_30_run__archive(self):
+        archive = os.path.join(self.workdir, "archive")
+        journal = MJ.Journal(os.path.join(self.workdir, "pending"))
+        self.assertTrue(TT.run(dict(repos=[self.repo], gc_keep=1,
+                                    gc_archive=archive, defer_update=True),
+                               journal))
+        self.assertEquals(len(journal.pending()), 2)
+
+        def ls(d):
+            return sorted(os.listdir(d))
+
+        self.assertEquals(ls(os.path.join(self.repo.destdir, "x86_64")),
+                          ["a-0.3-1.fc19.noarch.rpm", "b-1.0-1.x86_64.rpm"])
+        self.assertEquals(ls(os.path.join(archive, "fedora/19/sources")),
+                          self.files["sources"][:2])
+
+    def test_32_run__defer_update_flushed_while_removing(self):
+        journal = MJ.Journal(os.path.join(self.workdir, "pending"))
+        flushed = []
+        run_steps_0 = TT.MCUT.run_steps
+
+        def run_steps(*args, **kwargs):
+            # Flushed by 'update --pending' before RPMs are removed.
+            flushed.append(journal.flush(lambda cs: [True for c in cs]))
+            return run_steps_0(*args, **kwargs)
+
+        try:
+            TT.MCUT.run_steps = run_steps
+            self.assertTrue(TT.run(dict(repos=[self.repo], gc_keep=1,
+                                        defer_update=True), journal))
+        finally:
+            TT.MCUT.run_steps = run_steps_0
+
+        self.assertEquals(flushed, [True])
+        self.assertEquals(sorted(n for n, _c in journal.pending()),
+                          ["update:fedora-19:sources",
+                           "update:fedora-19:x86_64"])
+
+
+# vim:sw=4:ts=4:et:
@@ -21,6 +21,7 @@ import myrepo.commands.genconf as TT
 import myrepo.repo as MR
 import myrepo.shell as MS
 import myrepo.tests.common as C
+import myrepo.utils as MU
 
 import datetime
 import glob
@@ -228,6 +229,36 @@ class Test_20_effectful_functions(unittest.TestCase):
         TT.gen_gpgkey(ctx, rpmmacros=os.path.join(self.workdir, "rpmmacros"),
                       homedir=self.workdir, compat=True, passphrase="secret")
 
+    def test_080_write_files(self):
+        repos = mk_local_repos(os.path.join(self.workdir, "yum"))[:2]
+        ctx = mk_ctx(repos)
+        ctx["workdir"] = workdir = os.path.join(self.workdir, "w")
+        ctx["datestamp"] = "Wed Jul 31 2013"
+
+        mockdir = os.path.join(self.workdir, "mock")
+        os.makedirs(mockdir)
+        for d in MU.concat(r.dists for r in repos):
+            open(os.path.join(mockdir, d.mockcfg), 'w').write("# BASE\n")
+
+        fs = TT.write_files(repos, ctx, mockdir)
+        self.assertEquals(len(fs), 8)  # (.repo, .spec, 2 mock.cfg) * 2
+
+        # .repo files of repos of different versions are same and no
+        # temporary files are left.
+        self.assertEquals(sorted(os.listdir(workdir)),
+                          sorted(set(os.path.basename(f) for f in fs)))
+
+        repo = repos[0]
+        ctx.update(repo.as_dict())
+        self.assertEquals(open(fs[0]).read(),
+                          TT.gen_repo_file_content(ctx, C.template_paths()) +
+                          "\n")
+
+        (path, _base, content) = list(TT.gen_mockcfg_files_g(repo, ctx,
+                                                             workdir,
+                                                             ctx["tpaths"]))[0]
+        self.assertEquals(open(path).read(), "# BASE\n" + content + "\n")
+
     def test_110_run(self):
         repos = mk_local_repos(os.path.join(self.workdir, "yum"))
         ctx = mk_ctx(repos[:1])
@@ -34,7 +34,8 @@ def mk_local_repos(topdir="/tmp"):
 
 
 def mk_remote_repos():
-    server = MR.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com")
+    server = MR.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com",
+                       mux=False)
     assert isinstance(server, MR.Server)
 
     reponame = "%(name)s-%(server_shortaltname)s"
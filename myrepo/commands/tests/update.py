@@ -16,12 +16,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.commands.update as TT
+import myrepo.journal as MJ
 import myrepo.repo as MR
 import myrepo.utils as MU
 import myrepo.tests.common as C
 
 import itertools
 import os.path
+import shutil
 import unittest
 
 
@@ -40,6 +42,54 @@ class Test_00_pure_functions(unittest.TestCase):
         cs = TT.prepare_0(repo)
         self.assertListEqual(cs, cs_expected)
 
+    def test_02_prepare_0__localhost_native_generator(self):
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp/yum",
+                           repodata_generator="myrepo")
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"], server)
+
+        for c in TT.prepare_0(repo):
+            self.assertTrue("python -m myrepo.repodata -o $g ." in c)
+            self.assertFalse("createrepo" in c)
+
+    def test_03_prepare_0__deltas(self):
+        repo = MR.Repo("fedora", 19, ["x86_64"], self.server)
+        for c in TT.prepare_0(repo):
+            (fg, bg) = c.split(" && { i=$(command -v ionice")
+            self.assertFalse("--deltas" in fg)
+            self.assertTrue("--deltas --num-deltas 1 --max-delta-rpm-size "
+                            "100000000" in bg, bg)
+            self.assertTrue(bg.endswith(" >/dev/null 2>&1 & }"), bg)
+
+        server = MR.Server("localhost", topdir="/tmp/yum",
+                           baseurl="file:///tmp/yum", num_deltas=0)
+        repo = MR.Repo("fedora", 19, ["x86_64"], server)
+        for c in TT.prepare_0(repo):
+            self.assertFalse("deltas" in c, c)
+
+    def test_04_mk_parallel_steps(self):
+        server = MR.Server("yumrepos-1.local", "jdoe", topdir="/tmp/yum",
+                           mux=False)
+        repos = [MR.Repo("fedora", 19, ["x86_64", "i386"], self.server),
+                 MR.Repo("rhel", 6, ["x86_64"], self.server),
+                 MR.Repo("rhel", 6, ["x86_64"], server)]
+
+        steps = TT.mk_parallel_steps(repos, 4)
+        self.assertEquals([s.name for s in steps],
+                          ["update:%s@localhost" % self.server.user,
+                           "update:jdoe@yumrepos-1.local"])
+
+        c = steps[0].cmd
+        self.assertTrue(c.startswith("n=4 && "), c)
+        self.assertTrue(" /tmp/yum/fedora/19/sources /tmp/yum/fedora/19/"
+                        "x86_64 /tmp/yum/fedora/19/i386 /tmp/yum/rhel/6/"
+                        "sources /tmp/yum/rhel/6/x86_64 | nice " in c, c)
+        self.assertTrue('xargs -n 1 -P $n sh -c "cd \\$1 && ' in c, c)
+
+        c = steps[1].cmd
+        self.assertTrue(c.startswith("ssh "), c)
+        self.assertFalse("'" in c[c.index("'") + 1:-1], c)
+
     def test_10_prepare__localhost(self):
         repos = [MR.Repo("fedora", 18, ["x86_64", "i386"], self.server),
                  MR.Repo("fedora", 19, ["x86_64", "i386"], self.server),
@@ -84,5 +134,69 @@ class Test_10_effecful_functions(unittest.TestCase):
             self.assertTrue(os.path.exists(os.path.join(d, "repodata")),
                             "Failed to create %s/repodata !" % d)
 
+    def test_22_run__localhost_publish_atomically(self):
+        topdir = os.path.join(self.workdir, "yum")
+        server = MR.Server("localhost", topdir=topdir, baseurl="file:///tmp")
+        repo = MR.Repo("rhel", 6, ["x86_64", ], server)
+        ctx = dict(repos=[repo])
+
+        os.makedirs(os.path.join(repo.destdir, "sources"))
+
+        d = os.path.join(repo.destdir, "x86_64")
+        os.makedirs(os.path.join(d, "repodata"))  # Made before.
+
+        self.assertTrue(TT.run(ctx))
+        gen0 = os.readlink(os.path.join(d, "repodata"))
+
+        self.assertTrue(TT.run(ctx))
+        gen1 = os.readlink(os.path.join(d, "repodata"))
+
+        self.assertNotEquals(gen0, gen1)
+        self.assertTrue(os.path.exists(os.path.join(d, gen0)))  # Kept.
+
+    def test_24_run__localhost_parallel(self):
+        topdir = os.path.join(self.workdir, "yum")
+        server = MR.Server("localhost", topdir=topdir, baseurl="file:///tmp")
+        repos = [MR.Repo("fedora", 19, ["x86_64", "i386"], server),
+                 MR.Repo("rhel", 6, ["x86_64", ], server)]
+        ctx = dict(repos=repos, parallel_update=True)
+
+        dirs = MU.concat([os.path.join(repo.destdir, a) for a in
+                          ["sources"] + repo.archs] for repo in repos)
+        for d in dirs:
+            os.makedirs(d)
+
+        self.assertTrue(TT.run(ctx))
+        for d in dirs:
+            self.assertTrue(os.path.exists(os.path.join(d, "repodata")), d)
+
+        # Failure of one of them is not ignored.
+        shutil.rmtree(os.path.join(repos[1].destdir, "sources"))
+        self.assertFalse(TT.run(ctx))
+
+    def test_30_run__pending(self):
+        topdir = os.path.join(self.workdir, "yum")
+        server = MR.Server("localhost", topdir=topdir, baseurl="file:///tmp",
+                           num_deltas=0)
+        repo = MR.Repo("rhel", 6, ["x86_64", ], server)
+        journal = MJ.Journal(os.path.join(self.workdir, "pending"))
+
+        dirs = [os.path.join(repo.destdir, d) for d in ("sources", "x86_64")]
+        for d in dirs:
+            os.makedirs(d)
+
+        # Marked dirty by deploys twice but updated once.
+        TT.mark_pending([repo], journal)
+        TT.mark_pending([repo], journal)
+        self.assertEquals(len(journal.pending()), 2)
+
+        self.assertTrue(TT.run_pending(dict(), journal))
+        self.assertEquals(journal.pending(), [])
+        for d in dirs:
+            self.assertEquals(len(os.listdir(os.path.join(d, ".repodata.gens"
+                                                          ))), 1)
+
+        self.assertTrue(TT.run_pending(dict(quiet_period=1), journal))
+
 
 # vim:sw=4:ts=4:et:
@@ -16,6 +16,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.commands.utils as TT
+import myrepo.globals as G
+import myrepo.plan as MPL
 import myrepo.repo as MR
 import myrepo.srpm as MS
 import myrepo.tests.common as C
@@ -72,4 +74,21 @@ class Test_10_effecful_functions(unittest.TestCase):
         self.assertEquals(wdir_result, wdir)
         self.assertTrue(os.path.exists(wdir_result))
 
+    def test_40_prun__engines(self):
+        cs = ["true", "false", "true"]
+        for engine in G._ENGINES:
+            ctx = dict(engine=engine, maxjobs=2, joblimits=["other:1"])
+            self.assertEquals(TT.prun(cs, ctx), [True, False, True])
+
+    def test_42_run_steps__kinds(self):
+        mark = os.path.join(self.workdir, "running")
+        c = "test ! -f %s && touch %s && sleep 1 && rm -f %s" % \
+            ((mark, ) * 3)
+
+        # Steps of the kind 'w0' must run one by one.
+        for engine in G._ENGINES:
+            ctx = dict(engine=engine, optimize=False)
+            steps = [MPL.Step(c, kind="w0") for _ in range(2)]
+            self.assertTrue(TT.run_steps(steps, ctx, dict(w0=1)))
+
 # vim:sw=4:ts=4:et:
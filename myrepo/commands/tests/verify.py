@@ -0,0 +1,67 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.commands.verify as TT
+import myrepo.repo as MR
+import myrepo.tests.common as C
+import myrepo.tests.verify as MTV
+import myrepo.verify as MV
+
+import os.path
+import os
+import unittest
+
+
+class Test_00_pure_functions(unittest.TestCase):
+
+    def test_10_group_by_server(self):
+        s0 = MR.Server("localhost", topdir="/tmp/yum", baseurl="file:///tmp")
+        s1 = MR.Server("yumrepos.local", "jdoe")
+        rs = [MR.Repo("fedora", 19, ["x86_64"], s) for s in (s0, s1, s0)]
+
+        self.assertEquals(TT.group_by_server(rs), [[rs[0], rs[2]], [rs[1]]])
+
+
+class Test_10_effecful_functions(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+        topdir = os.path.join(self.workdir, "yum")
+        server = MR.Server("localhost", topdir=topdir, baseurl="file:///tmp")
+        self.repo = MR.Repo("fedora", 19, ["x86_64"], server)
+
+        for d in self.repo.rpmdirs:
+            os.makedirs(d)
+            MTV.generate(d, ["a-0.1-1.fc19.%s.rpm" %
+                             ("src" if d.endswith("sources") else "noarch")])
+
+        self.cache = MV.ChecksumCache(os.path.join(self.workdir, "v.sqlite"))
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run(self):
+        ctx = dict(repos=[self.repo], verify_jobs=2)
+        self.assertTrue(TT.run(ctx, self.cache))
+
+        open(os.path.join(self.repo.rpmdirs[1], "b-0.1-1.noarch.rpm"),
+             'w').write("b")
+        self.assertFalse(TT.run(ctx, self.cache))
+
+
+# vim:sw=4:ts=4:et:
@@ -16,34 +16,144 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.commands.utils as MCU
+import myrepo.globals as G
+import myrepo.journal as MJ
+import myrepo.plan as MPL
 import myrepo.shell as MS
 import myrepo.utils as MU
 import logging
 import os.path
+import os
+import subprocess
+import sys
 
 
-_CMD_TEMPLATE = """\
-test -d repodata \
-&& createrepo --update --deltas --oldpackagedirs . --database . \
-|| createrepo --deltas --oldpackagedirs . --database ."""
+# Commands to generate metadata of RPMs in the current dir into the dir $g,
+# for each generator of G._REPODATA_GENERATORS. The native one (see
+# myrepo.repodata) needs myrepo installed on the server. Delta RPMs are not
+# made here but in background later (see _DELTAS_TEMPLATE).
+_GENERATE_CMDS = dict(createrepo="""\
+test -d repodata && cp -a repodata/. $g/repodata/ \
+&& createrepo --update --database -o $g . \
+|| createrepo --database -o $g .""",
+                      myrepo="python -m myrepo.repodata -o $g .")
 
+# Metadata generated in a new generation dir $g is published by replacing
+# the symlink 'repodata' with the one to it atomically, so that clients never
+# see metadata half-written. The dir 'repodata' made before is moved into a
+# generation dir at the first time. Delta RPMs newly made in $g, not linked
+# from others, are moved into the dir 'drpms' they are refered from. The
+# previous generation is kept for a grace period after it was replaced, and
+# older ones are removed.
+_PUBLISH = """\
+{ test ! -d $g/drpms || { mkdir -p drpms \
+&& find $g/drpms -name \\*.drpm -links 1 -exec mv -f {} drpms/ \\; \
+&& rm -rf $g/drpms; }; } \
+&& o=$(readlink repodata || :) && { test -L repodata || test ! -d repodata \
+|| { o=$g.0/repodata && mkdir -p $g.0 && mv -T repodata $o; }; } \
+&& ln -sfn $g/repodata repodata.new && mv -Tf repodata.new repodata \
+&& { test -z "$o" || touch ${o%%/repodata}; } \
+&& find %(gens)s -mindepth 1 -maxdepth 1 ! -path $g -mmin +%(grace)d \
+-exec rm -rf {} +"""
 
-def prepare_0(repo, ctmpl=_CMD_TEMPLATE):
+_PUBLISH_TEMPLATE = """\
+g=%(gens)s/$(date +%%Y%%m%%d%%H%%M%%S).$$ && mkdir -p $g/repodata \
+&& { %(generate)s; } && """ + _PUBLISH
+
+# Delta RPMs are made w/ createrepo in a new generation dir from the current
+# one $r, hardlinked the ones made before in, as createrepo does not make
+# them again if they exist. It's published only if new ones were made and
+# the current generation was not replaced by others meanwhile.
+_DELTAS_TEMPLATE = """\
+r=$(readlink repodata) && g=%(gens)s/$(date +%%Y%%m%%d%%H%%M%%S).$$ \
+&& mkdir -p $g/repodata $g/drpms && cp -a $r/. $g/repodata/ \
+&& { test ! -d drpms || cp -al drpms/. $g/drpms/; } \
+&& createrepo --update --database --deltas --num-deltas %(num_deltas)d \
+--max-delta-rpm-size %(max_delta_rpm_size)d --oldpackagedirs . -o $g . \
+&& if test -n "$(find $g/drpms -name \\*.drpm -links 1)" \
+&& test "$(readlink repodata)" = "$r"; then """ + _PUBLISH + \
+    "; else rm -rf $g; fi"
+
+# Delta RPMs are made in background at the lowest CPU and IO priority after
+# metadata was published, by a process at once in each dir.
+_BACKGROUND_TEMPLATE = """\
+{ i=$(command -v ionice >/dev/null && echo ionice -c 3); \
+nohup nice -n 19 $i flock .deltas.lock sh -c "%s" >/dev/null 2>&1 & }"""
+
+
+def _dquote(s):
+    """
+    Escape the string to be quoted with double quotes in shell.
+
+    >>> _dquote('echo "$a" `b` \\\;')
+    'echo \\\\"\\\\$a\\\\" \\\\`b\\\\` \\\\\\\;'
+    """
+    for c in ('\\', '"', '$', '`'):
+        s = s.replace(c, '\\' + c)
+
+    return s
+
+
+def mk_cmd_template(generator=G._REPODATA_GENERATORS[0],
+                    num_deltas=G._NUM_DELTAS,
+                    max_delta_rpm_size=G._MAX_DELTA_RPM_SIZE):
+    """
+    :param generator: Generator of repodata, one of G._REPODATA_GENERATORS
+    :param num_deltas: Max number of older versions of each RPM to make delta
+        RPMs from, or 0 not to make delta RPMs. Only createrepo makes them.
+    :param max_delta_rpm_size: Max size of RPMs to make delta RPMs of
+
+    :return: Command string template to update metadata
+
+    >>> "python -m myrepo.repodata -o $g ." in mk_cmd_template("myrepo")
+    True
+    >>> "--deltas" in mk_cmd_template("createrepo", 0)
+    False
+    """
+    ctx = dict(gens=G._REPODATA_GENS, grace=G._REPODATA_GRACE,
+               generate=_GENERATE_CMDS[generator], num_deltas=num_deltas,
+               max_delta_rpm_size=max_delta_rpm_size)
+
+    c = _PUBLISH_TEMPLATE % ctx
+    if generator != "createrepo" or num_deltas <= 0:
+        return c
+
+    return c + " && " + _BACKGROUND_TEMPLATE % _dquote(_DELTAS_TEMPLATE % ctx)
+
+
+_CMD_TEMPLATE = mk_cmd_template()
+
+
+def _cmd_template(repo):
+    """
+    :param repo: Repo instance
+    :return: Command string template to update metadata on the server of it
+    """
+    return mk_cmd_template(repo.server_repodata_generator,
+                           repo.server_num_deltas,
+                           repo.server_max_delta_rpm_size)
+
+
+def prepare_0(repo, ctmpl=None):
     """
     Make up a list of command strings to update metadata of given repo.
 
     :param repo: Repo instance
-    :param ctmpl: Command string template
+    :param ctmpl: Command string template or None to use the one of the
+        generator of repodata of the server of the repo
 
     :return: List of commands to update metadata of ``repo``
     """
     MCU.assert_repo(repo)
 
+    if ctmpl is None:
+        ctmpl = _cmd_template(repo)
+
     return [c for c, _d in (repo.mk_cmd(ctmpl, os.path.join(repo.destdir, a))
             for a in ["sources"] + repo.archs)]
 
 
-def prepare(repos, ctmpl=_CMD_TEMPLATE):
+def prepare(repos, ctmpl=None):
     """
     Make up a list of command strings to update metadata of given repos. It's
     similar to above ``prepare_0`` but will be applied to multiple repos.
@@ -56,24 +166,172 @@ def prepare(repos, ctmpl=_CMD_TEMPLATE):
     return MU.concat(prepare_0(repo, ctmpl) for repo in repos)
 
 
-def run(ctx, ctmpl=_CMD_TEMPLATE):
+def mk_steps(repos, ctmpl=None):
+    """
+    Make up a plan (steps) to update metadata of given repos.
+
+    :param repos: List of Repo instances
+    :param ctmpl: Command string template
+
+    :return: List of myrepo.plan.Step instances
+    """
+    return [MPL.Step(c, name="update:%s:%s" % (repo.dist, d)) for repo
+            in repos for c, d in zip(prepare_0(repo, ctmpl),
+                                     ["sources"] + repo.archs)]
+
+
+# Metadata of dirs on a server are updated in parallel in one invocation; N
+# dirs at once, N is given or (the number of CPUs of the server - 1), at low
+# CPU and IO priority not to starve other processes, e.g. the web server.
+_PARALLEL_TEMPLATE = """\
+n=%(jobs)s && { command -v ionice >/dev/null && i="ionice -c 2 -n 7" || i=; } \
+&& printf %%s\\\\n %(dirs)s \
+| nice -n 10 $i xargs -n 1 -P $n sh -c "%(cmd)s" sh"""
+
+_NPROC_1 = "$(($(nproc 2>/dev/null || echo 2) - 1)) && n=$((n > 0 ? n : 1))"
+
+
+def mk_parallel_cmd(repos, jobs=0, ctmpl=None):
+    """
+    Make up a command string to update metadata of all dirs of given repos
+    on a server in parallel at once.
+
+    :param repos: List of Repo instances on the same server
+    :param jobs: Max number of dirs updated at once, or 0 to decide it from
+        the number of CPUs of the server
+    :param ctmpl: Command string template or None to use the one of the
+        generator of repodata of the server
+
+    :return: Command string adjusted to run on the server
+    """
+    MCU.assert_repo(repos[0])
+
+    if ctmpl is None:
+        ctmpl = _cmd_template(repos[0])
+
+    dirs = [os.path.join(r.destdir, d) for r in repos for d in
+            ["sources"] + r.archs]
+    c = _PARALLEL_TEMPLATE % dict(jobs=jobs if jobs > 0 else _NPROC_1,
+                                  dirs=' '.join(dirs),
+                                  cmd=_dquote("cd $1 && " + ctmpl))
+
+    return repos[0].mk_cmd(c)[0]
+
+
+def mk_parallel_steps(repos, jobs=0, ctmpl=None):
+    """
+    Make up a plan (steps) to update metadata of given repos; a step for each
+    server to update metadata of all dirs on it in parallel.
+
+    :param repos: List of Repo instances
+    :param jobs: Max number of dirs updated at once on each server, see
+        ``mk_parallel_cmd``
+    :param ctmpl: Command string template
+
+    :return: List of myrepo.plan.Step instances
+    """
+    servers = []  # to keep the order of servers.
+    srepos = dict()  # (user, hostname) -> [repo]
+
+    for repo in repos:
+        k = (repo.server.user, repo.server.name)
+        if k not in srepos:
+            servers.append(k)
+
+        srepos.setdefault(k, []).append(repo)
+
+    return [MPL.Step(mk_parallel_cmd(srepos[k], jobs, ctmpl),
+                     name="update:%s@%s" % k) for k in servers]
+
+
+def mark_pending(repos, journal=None):
+    """
+    Mark all dirs of given repos dirty to update metadata of them later.
+
+    :param repos: List of Repo instances
+    :param journal: myrepo.journal.Journal instance or None to use the
+        default one
+    """
+    journal = MJ.Journal() if journal is None else journal
+    journal.mark([(s.name, s.cmd) for s in mk_steps(repos)])
+
+
+def spawn_pending_update(period, journal=None):
+    """
+    Run 'update --pending' to update metadata of dirs marked dirty after the
+    quiet period in background. Updates are coalesced as the ones run later
+    find no dirs marked.
+
+    :param period: Quiet period in seconds
+    :param journal: myrepo.journal.Journal instance or None to use the
+        default one
+
+    :return: subprocess.Popen instance
+    """
+    journal = MJ.Journal() if journal is None else journal
+    args = [sys.executable, "-m", "myrepo.cli", "update", "--pending",
+            "--quiet-period", str(period)]
+
+    logging.info("Update metadata of dirs marked dirty in %d seconds "
+                 "after deploys done" % period)
+    with open(journal.path + ".log", 'a') as log:
+        return subprocess.Popen(args, stdin=open(os.devnull),
+                                stdout=log, stderr=subprocess.STDOUT,
+                                close_fds=True, preexec_fn=os.setsid)
+
+
+def run_pending(ctx, journal=None):
+    """
+    Update metadata of dirs marked dirty, see ``mark_pending``.
+
+    :param ctx: Application context
+    :param journal: myrepo.journal.Journal instance or None to use the
+        default one
+
+    :return: True if commands run successfully else False
+    """
+    journal = MJ.Journal() if journal is None else journal
+
+    if ctx.get("dryrun", False):
+        for _name, c in journal.pending():
+            print c
+
+        return True
+
+    period = ctx.get("quiet_period", 0)
+    if period and not journal.wait_quiet(period):
+        return True
+
+    # Commands were made up for the servers already.
+    return journal.flush(lambda cs: MCU.prun(cs, dict(ctx, repos=[]),
+                                             logfile=False))
+
+
+def run(ctx, ctmpl=None):
     """
     :param repos: List of Repo instances
 
     :return: True if commands run successfully else False
     """
+    if ctx.get("pending", False):
+        return run_pending(ctx)
+
     MCU.assert_ctx_has_key(ctx, "repos")
 
-    cs = prepare(ctx["repos"])
+    if ctx.get("parallel_update", False):
+        steps = mk_parallel_steps(ctx["repos"], ctx.get("update_jobs", 0),
+                                  ctmpl)
+    else:
+        steps = mk_steps(ctx["repos"], ctmpl)
 
     if ctx.get("dryrun", False):
-        for c in cs:
-            print c
+        for s in steps:
+            print s.cmd
 
         return True
 
     logging.info("Run myrepo.commands.update.run...")
-    return all(MS.prun(cs, dict(logfile=False, )))
+    return MCU.run_steps(steps, ctx, logfile=False)
 
 
 # vim:sw=4:ts=4:et:
@@ -17,7 +17,14 @@
 #
 from pprint import pformat
 
+import myrepo.buildcache as MBC
+import myrepo.buildfarm as MBF
+import myrepo.eventloop as ME
+import myrepo.globals as G
+import myrepo.parser as MP
+import myrepo.plan as MPL
 import myrepo.repo as MR
+import myrepo.shell as MSH
 import myrepo.srpm as MS
 import logging
 import os.path
@@ -47,6 +54,57 @@ def assert_ctx_has_keys(ctx, keys):
         assert k in ctx, "No '%s' is defined in given ctx!" % k
 
 
+def get_srpms(ctx):
+    """
+    :param ctx: Application context has "srpms" or "srpm"
+    :return: List of myrepo.srpm.Srpm instances to process
+
+    >>> get_srpms(dict(srpm=1))
+    [1]
+    >>> get_srpms(dict(srpms=[1, 2], srpm=1))
+    [1, 2]
+    """
+    return ctx.get("srpms", None) or [ctx["srpm"]]
+
+
+def get_build_cache(ctx):
+    """
+    :param ctx: Application context
+    :return: myrepo.buildcache.BuildCache instance or None if the cache is
+        disabled, e.g. w/ --no-cache option
+
+    >>> get_build_cache(dict(build_cache=False))
+    >>> ctx = dict(build_cache=True, build_cache_dir="/tmp/x")
+    >>> get_build_cache(ctx).topdir
+    '/tmp/x'
+    """
+    if not ctx.get("build_cache", False):
+        return None
+
+    return MBC.BuildCache(ctx.get("build_cache_dir", G._BUILD_CACHE_DIR),
+                          ctx.get("build_cache_size", G._BUILD_CACHE_SIZE))
+
+
+def get_build_farm(ctx):
+    """
+    :param ctx: Application context
+    :return: myrepo.buildfarm.BuildFarm instance or None if no build workers
+        were given, e.g. w/ --worker option
+
+    >>> get_build_farm(dict(workers=[]))
+    >>> farm = get_build_farm(dict(workers=["localhost:x86_64:2:/tmp/w0"]))
+    >>> [(w.name, w.slots) for w in farm.workers]
+    [('localhost', 2)]
+    """
+    workers = ctx.get("workers", None)
+    if not workers:
+        return None
+
+    timeout = ctx.get("timeout", None) or G._CONN_TIMEOUT
+    return MBF.BuildFarm([MBF.mk_worker(w, timeout, ctx.get("ssh_mux", True))
+                          for w in workers])
+
+
 def setup_workdir(prefix="myrepo-workdir-", topdir=_TMPDIR):
     """
     Create temporal working dir to put data and log files.
@@ -79,4 +137,79 @@ def init_workdir(workdir):
     return workdir
 
 
+def prun(cs, ctx, deps=None, kinds=None, limits=None, **kwargs):
+    """
+    Run given commands in parallel under the limits of the number of jobs
+    specified in ``ctx``, and return results in the same order as ``cs``.
+
+    The engine to run commands is selected by ctx["engine"] (see
+    myrepo.globals._ENGINES).
+
+    :param cs: List of command strings
+    :param ctx: Application context
+    :param deps: List of lists of indices of commands each command depends
+        on, or None (see myrepo.shell.prun)
+    :param kinds: List of kinds of commands or None (see myrepo.shell.prun)
+    :param limits: A dict of (kind, max number of jobs of the kind) added to
+        the ones specified in ``ctx``, or None
+    :param kwargs: Keyword arguments passed to myrepo.shell.run_async
+
+    :return: List of result code of run commands
+    """
+    for repo in ctx.get("repos", []):
+        repo.server.connect()
+
+    engine = ME if ctx.get("engine", None) == "eventloop" else MSH
+    limits = dict(MP.parse_joblimits(ctx.get("joblimits", [])),
+                  **(limits or {}))
+
+    return engine.prun(cs, kwargs, maxjobs=ctx.get("maxjobs", None),
+                       limits=limits, deps=deps, kinds=kinds)
+
+
+def print_steps(steps, ctx):
+    """
+    Print the commands of given steps in the order ``run_steps`` would run
+    them, e.g. w/ --dryrun option.
+
+    :param steps: List of myrepo.plan.Step instances
+    :param ctx: Application context
+
+    >>> a = MPL.Step("ssh h0 'ls /a'"); b = MPL.Step("ls /b", [a])
+    >>> print_steps([b, MPL.Step("ssh h0 'ls /a'")], {})
+    ssh h0 'ls /a'
+    ls /b
+    """
+    if ctx.get("optimize", True):
+        steps = MPL.optimize(steps)
+
+    for c in MPL.linearize(steps)[0]:
+        print c
+
+
+def run_steps(steps, ctx, limits=None, **kwargs):
+    """
+    Run given steps (DAG of commands) in parallel; each step starts as soon as
+    all of the steps it depends on succeeded. The plan is optimized before run
+    (see myrepo.plan.optimize) unless ctx["optimize"] is False.
+
+    :param steps: List of myrepo.plan.Step instances
+    :param ctx: Application context
+    :param limits: A dict of (kind, max number of jobs of the kind) added to
+        the ones specified in ``ctx``, or None
+    :param kwargs: Keyword arguments passed to myrepo.shell.run_async
+
+    :return: True if all steps run successfully else False
+    """
+    if ctx.get("optimize", True):
+        steps = MPL.optimize(steps)
+
+    steps = MPL.toposort(steps)  # Keep the order same as linearize does.
+    kinds = [s.kind for s in steps]
+
+    (cs, deps) = MPL.linearize(steps)
+    return all(prun(cs, ctx, deps, kinds if any(kinds) else None, limits,
+                    **kwargs))
+
+
 # vim:sw=4:ts=4:et:
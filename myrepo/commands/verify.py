@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.commands.utils as MCUT
+import myrepo.globals as G
+import myrepo.utils as MU
+import myrepo.verify as MV
+import logging
+import os.path
+import subprocess
+
+
+def mk_cmd(dirs, check_sig=False, jobs=G._VERIFY_JOBS):
+    """
+    :param dirs: List of dirs to verify
+    :param check_sig: Check signatures of RPMs too if True
+    :param jobs: Number of threads to compute checksums in
+
+    >>> mk_cmd(["/y/19/sources", "/y/19/x86_64"])
+    'python -m myrepo.verify -j 4 /y/19/sources /y/19/x86_64'
+    >>> mk_cmd(["/y/19/x86_64"], True, 8)
+    'python -m myrepo.verify -s -j 8 /y/19/x86_64'
+    """
+    return "python -m myrepo.verify %s-j %d %s" % ("-s " if check_sig else '',
+                                                   jobs, ' '.join(dirs))
+
+
+def group_by_server(repos):
+    """
+    :param repos: List of Repo instances
+    :return: List of (list of repos on the same server) in the order of repos
+    """
+    servers = []  # to keep the order of servers.
+    srepos = dict()  # (user, hostname) -> [repo]
+
+    for repo in repos:
+        k = (repo.server.user, repo.server.name)
+        if k not in srepos:
+            servers.append(k)
+
+        srepos.setdefault(k, []).append(repo)
+
+    return [srepos[k] for k in servers]
+
+
+def verify_0(repos, check_sig=False, jobs=G._VERIFY_JOBS, cache=None,
+             dryrun=False):
+    """
+    Verify RPMs in dirs of given repos on a server. Dirs on the local host are
+    verified in this process, and the ones on remote hosts are verified by
+    running myrepo.verify on them.
+
+    :param repos: List of Repo instances on the same server
+    :param check_sig: Check signatures of RPMs too if True
+    :param jobs: Number of threads to compute checksums in
+    :param cache: myrepo.verify.ChecksumCache instance or None
+    :param dryrun: Only print the command to verify dirs on remote hosts
+
+    :return: True if no problems were found else False
+    """
+    server = repos[0].server
+    dirs = MU.concat(r.rpmdirs for r in repos)
+
+    if not server.is_local:
+        c = repos[0].mk_cmd(mk_cmd(dirs, check_sig, jobs))[0]
+        if dryrun:
+            print c
+            return True
+
+        server.connect()
+        return subprocess.call(c, shell=True) == 0
+
+    cache = MV.ChecksumCache() if cache is None else cache
+    nproblems = 0
+
+    for d in dirs:
+        if dryrun:
+            print "verify " + d
+            continue
+
+        try:
+            problems = MV.verify(os.path.expanduser(d), check_sig, jobs, cache)
+        except (IOError, OSError, IndexError, SyntaxError) as e:
+            problems = [("no valid metadata (%s)" % e, "repodata")]
+
+        for problem, f in problems:
+            print "%s: %s" % (os.path.join(d, f), problem)
+
+        nproblems += len(problems)
+
+    return nproblems == 0
+
+
+def run(ctx, cache=None):
+    """
+    Verify RPMs in the yum repos against their metadata and report problems
+    found, e.g. RPMs broken or missing and orphan RPMs not in the metadata.
+
+    :param ctx: Application context
+    :param cache: myrepo.verify.ChecksumCache instance or None to use the
+        default one
+
+    :return: True if no problems were found else False
+    """
+    MCUT.assert_ctx_has_key(ctx, "repos")
+
+    logging.info("Run myrepo.commands.verify.run...")
+    rcs = [verify_0(rs, ctx.get("check_sig", False),
+                    ctx.get("verify_jobs", G._VERIFY_JOBS), cache,
+                    ctx.get("dryrun", False))
+           for rs in group_by_server(ctx["repos"])]
+
+    return all(rcs)
+
+
+# vim:sw=4:ts=4:et:
@@ -31,7 +31,11 @@ import os.path
 
 
 _USAGE = """\
-%%prog COMMAND [OPTION ...] [SRPM]
+%%prog COMMAND [OPTION ...] [SRPM ...]
+
+SRPM may be a path of SRPM, a glob pattern of SRPM paths, e.g. 'out/*.src.rpm',
+or a path of a list file prefixed with '@', e.g. '@srpms.txt', which lists
+SRPM paths or glob patterns one per line.
 
 Commands:
 %s
@@ -47,6 +51,9 @@ Examples:
   %%prog deploy packagemaker-0.1-1.src.rpm
   %%prog d --dists rhel-6-x86_64,fedora-19-x86_64 packagemaker-0.1-1.src.rpm
 
+  # build many SRPMs in parallel and deploy them at once:
+  %%prog d 'out/*.src.rpm' @more-srpms.txt
+
   # build SRPM has build time dependencies to RPMs in the yum repo:
   %%prog b --dists fedora-19-x86_64 --selfref myrepo-0.1-1.src.rpm\
 """ % MC.mk_cmd_helps_text()
@@ -111,7 +118,19 @@ def _init_by_preset_defaults():
                genconf=True, deploy=True,
                fullname=E.get_fullname(), email=E.get_email(),
                keyid=False, repo_params=[], sign=False, selfref=False,
-               build=True)
+               build=True, maxjobs=G._MAXJOBS, joblimits=[G._JOBLIMITS],
+               ssh_mux=True, engine=G._ENGINES[0], optimize=True,
+               transfer=G._TRANSFERS[0], checksum=False,
+               compress=G._TAR_COMPRESS[0], bandwidth=None, pool=False,
+               repodata_generator=G._REPODATA_GENERATORS[0],
+               num_deltas=G._NUM_DELTAS,
+               max_delta_rpm_size=G._MAX_DELTA_RPM_SIZE,
+               chain=False, defer_update=False, pending=False,
+               quiet_period=0, parallel_update=False, update_jobs=0,
+               gc_keep=G._GC_KEEP, gc_archive=None, build_cache=True,
+               build_cache_dir=G._BUILD_CACHE_DIR, workers=[],
+               remote_build=False, check_sig=False,
+               verify_jobs=G._VERIFY_JOBS)
 
     # Overwrite some parameters:
     cfg["timeout"] = _get_timeout(cfg)
@@ -172,6 +191,24 @@ def init(config_path=None, profile=None):
     return cfg
 
 
+def _append_parsed(parse):
+    """
+    Make up a callback of optparse to append the value of the option given
+    multiple times, validated w/ ``parse``.
+
+    :param parse: Function to parse the value, raises ValueError if invalid
+    """
+    def callback(option, opt_str, value, parser):
+        try:
+            parse(value)
+        except ValueError as e:
+            raise optparse.OptionValueError("%s: %s" % (opt_str, e))
+
+        parser.values.ensure_value(option.dest, []).append(value)
+
+    return callback
+
+
 def opt_parser(usage=_USAGE, conf=None):
     """
     Make up an option parser object.
@@ -202,6 +239,72 @@ def opt_parser(usage=_USAGE, conf=None):
                    help="Working directory to save results and log files. "
                         "Dynamically generated dir will be used by default.")
     cog.add_option("", "--dryrun", action="store_true", help="Dryrun mode")
+    cog.add_option("-j", "--maxjobs", type="int",
+                   help="Max number of jobs (commands) run at once "
+                        "[%default]")
+    cog.add_option("", "--joblimit", action="callback", type="string",
+                   dest="joblimits",
+                   callback=_append_parsed(P.parse_joblimits),
+                   help="Max number of jobs of given kind run at once in the "
+                        "form of <kind>:<limit>, e.g. '--joblimit mock:2 "
+                        "--joblimit createrepo:4'. Kinds are mock, "
+                        "createrepo, rpmbuild, rsync, scp, tar and other. "
+                        "[%default]")
+    cog.add_option("", "--engine", choices=G._ENGINES,
+                   help="Engine to run commands; 'shell' runs and waits "
+                        "each command separately, and 'eventloop' "
+                        "supervises all of them in an event loop and "
+                        "streams their output. Choices: %s [%%default]" %
+                        ", ".join(G._ENGINES))
+    cog.add_option("", "--no-optimize", action="store_false",
+                   dest="optimize",
+                   help="Do not optimize the plan, i.e. do not remove "
+                        "duplicated commands and merge commands run on the "
+                        "same remote host into one ssh session")
+    cog.add_option("", "--no-ssh-mux", action="store_false", dest="ssh_mux",
+                   help="Do not share a multiplexed SSH connection to each "
+                        "remote server among commands")
+    cog.add_option("", "--transfer", choices=G._TRANSFERS,
+                   help="Backend to transfer files to servers; 'scp' "
+                        "copies all of the files always, and 'rsync' "
+                        "copies files missing or changed only, resumes "
+                        "partial transfers and reports bytes skipped, and "
+                        "'tar' streams all of the RPMs built from each SRPM "
+                        "as one tar archive over one SSH channel. "
+                        "Choices: %s [%%default]" % ", ".join(G._TRANSFERS))
+    cog.add_option("", "--checksum", action="store_true",
+                   help="Find files changed by their checksum instead of "
+                        "their size and mtime w/ --transfer=rsync")
+    cog.add_option("", "--compress", choices=G._TAR_COMPRESS,
+                   help="Compression of files transferred w/ "
+                        "--transfer=tar; 'auto' chooses it by the bandwidth "
+                        "of the link (see --bandwidth). Choices: %s "
+                        "[%%default]" % ", ".join(G._TAR_COMPRESS))
+    cog.add_option("", "--bandwidth", type="float",
+                   help="Bandwidth of the link to the server in MB/s, to "
+                        "choose the compression w/ --compress=auto")
+    cog.add_option("", "--pool", action="store_true",
+                   help="Upload files into the pool of files keyed by their "
+                        "checksum on servers only if the pool lacks them, "
+                        "and hardlink them into dirs of repos, to store the "
+                        "same files, e.g. noarch RPMs and SRPMs deployed "
+                        "into several repos, only once")
+    cog.add_option("", "--repodata-generator",
+                   choices=G._REPODATA_GENERATORS,
+                   help="Generator of repodata run on servers; 'myrepo' "
+                        "reads the headers of RPMs added only by keeping "
+                        "the index of RPMs, and needs myrepo installed on "
+                        "servers. Choices: %s [%%default]" %
+                        ", ".join(G._REPODATA_GENERATORS))
+    cog.add_option("", "--num-deltas", type="int",
+                   help="Max number of older versions of each RPM to make "
+                        "delta RPMs from w/ createrepo. Delta RPMs are made "
+                        "in background at low priority after metadata was "
+                        "updated, and metadata is updated again if new ones "
+                        "were made. 0 disables it [%default]")
+    cog.add_option("", "--max-delta-rpm-size", type="int",
+                   help="Max size of RPMs in bytes to make delta RPMs of "
+                        "[%default]")
     cog.add_option("-q", "--quiet", action="store_const", dest="verbosity",
                    const=0, help="Quiet mode")
     cog.add_option("-v", "--verbose", action="store_const", dest="verbosity",
@@ -272,14 +375,90 @@ def opt_parser(usage=_USAGE, conf=None):
                         "itself to satisfy a portion of buildtime "
                         "dependencies to RPMs available from this repo, "
                         "to build given target SRPM to build.")
+    bog.add_option("", "--no-cache", action="store_false",
+                   dest="build_cache",
+                   help="Do not use the cache of built RPMs, i.e. build "
+                        "all of given SRPMs even if RPMs built from the same "
+                        "SRPMs with the same mock.cfg were found in it")
+    bog.add_option("", "--cache-dir", dest="build_cache_dir",
+                   help="Specify the top dir of the cache of built RPMs "
+                        "[%default]")
+    bog.add_option("", "--worker", action="callback", type="string",
+                   dest="workers",
+                   callback=_append_parsed(P.parse_worker_option),
+                   help="Specify a build worker host to build RPMs on, in "
+                        "the form of [USER@]HOST[:ARCHS[:SLOTS[:TOPDIR]]], "
+                        "ex. '--worker jdoe@bld-1.example.com:x86_64,i386:4'"
+                        ". ARCHS are archs it can build for (default: "
+                        "x86_64,i386), SLOTS is the max number of builds "
+                        "run on it at once (default: 1) and TOPDIR is the "
+                        "dir to put SRPMs and built RPMs in. It can be "
+                        "given multiple times, and RPMs are built on this "
+                        "host if no workers were given.")
     p.add_option_group(bog)
 
     dog = optparse.OptionGroup(p, "Options for 'deploy' command")
     dog.add_option("", "--no-build", action="store_false", dest="build",
                    help="Do not build given srpm, i.e., the srpm was already "
                         "built and just deploy it")
+    dog.add_option("", "--chain", action="store_true",
+                   help="Chain build mode; Build given SRPMs in order of "
+                        "build time dependencies among them, and deploy "
+                        "built RPMs and refresh the yum repo metadata "
+                        "between them. Use it with --selfref.")
+    dog.add_option("", "--remote-build", action="store_true",
+                   help="Build RPMs on the server of yum repos itself; "
+                        "Only given SRPMs are uploaded to the server and "
+                        "built RPMs are moved into the repos there. "
+                        "--worker and the cache of built RPMs are not used "
+                        "in this mode.")
+    dog.add_option("", "--defer-update", action="store_true",
+                   help="Do not update metadata of the yum repos but mark "
+                        "the dirs RPMs were deployed into dirty, and update "
+                        "metadata of them at once later w/ 'update "
+                        "--pending', or after the quiet period if "
+                        "--quiet-period was given.")
     p.add_option_group(dog)
 
+    uog = optparse.OptionGroup(p, "Options for 'update' command")
+    uog.add_option("", "--pending", action="store_true",
+                   help="Update metadata of the dirs marked dirty w/ "
+                        "'deploy --defer-update' instead of the yum repos "
+                        "specified, once for each dir")
+    uog.add_option("", "--quiet-period", type="int",
+                   help="Wait until no dirs are marked dirty for this "
+                        "seconds before updating metadata of them w/ "
+                        "--pending. 'deploy --defer-update' runs it in "
+                        "background if it's greater than 0 [%default]")
+    uog.add_option("", "--parallel", action="store_true",
+                   dest="parallel_update",
+                   help="Update metadata of all dirs of the yum repos on "
+                        "each server in one invocation, in parallel at low "
+                        "CPU and IO priority")
+    uog.add_option("", "--update-jobs", type="int",
+                   help="Max number of dirs metadata of which is updated "
+                        "at once on each server w/ --parallel. The number "
+                        "of CPUs of the server - 1 is used if it's 0 "
+                        "[%default]")
+    p.add_option_group(uog)
+
+    gog = optparse.OptionGroup(p, "Options for 'gc' command")
+    gog.add_option("", "--keep", type="int", dest="gc_keep",
+                   help="Number of the newest builds of each package to "
+                        "keep in each dir of the yum repos [%default]")
+    gog.add_option("", "--archive", dest="gc_archive",
+                   help="Move old RPMs into this dir on the server instead "
+                        "of removing them")
+    p.add_option_group(gog)
+
+    vog = optparse.OptionGroup(p, "Options for 'verify' command")
+    vog.add_option("", "--check-sig", action="store_true",
+                   help="Check signatures of RPMs too")
+    vog.add_option("", "--verify-jobs", type="int",
+                   help="Number of threads to compute checksums of RPMs in "
+                        "on each server [%default]")
+    p.add_option_group(vog)
+
     return p
 
 
@@ -0,0 +1,441 @@
+#
+# An event loop based engine to run commands, alternative to myrepo.shell.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""A single thread in this process supervises all of the child processes
+running commands: It multiplexes their output with select(2) and streams it
+line by line, enforces per-command timeouts and cancels (kills) commands on
+errors or interruption. No helper python process is needed per command, so
+that hundreds of commands can run concurrently.
+"""
+import myrepo.shell as MS
+
+import errno
+import fcntl
+import logging
+import os
+import os.path
+import select
+import signal
+import subprocess
+import sys
+import time
+
+
+# Interval in seconds to reap children exited but their output pipes are
+# still held by their (daemonized) descendants.
+_REAP_INTERVAL = 0.05
+
+# Grace period in seconds after SIGTERM before SIGKILL.
+_KILL_GRACE = 1
+
+
+class Task(object):
+    """
+    A command supervised by ``Loop``.
+
+    >>> t = Task("echo OK")
+    >>> t.cmd, t.cwd, t.result, t.reason
+    ('echo OK', '.', None, None)
+    """
+
+    def __init__(self, cmd, workdir=os.curdir, rc_expected=0, logfile=False,
+                 timeout=None, prefix='', deps=[]):
+        """
+        :param cmd: Command string
+        :param workdir: Working dir
+        :param rc_expected: Expected return code of the command run
+        :param logfile: Dump log file if True (``<pid>.log`` in workdir), or
+            log file path is specified or logfile is callable which generate
+            log filename. Output goes to stdout of this process if False.
+        :param timeout: Command execution timeout in seconds or None
+        :param prefix: Prefix of each line of output to stdout
+        :param deps: List of Tasks must succeed before this task starts
+        """
+        self.cmd = cmd
+        self.cwd = workdir
+        self.rc_expected = rc_expected
+        self.logfile = logfile
+        self.timeout = timeout
+        self.prefix = prefix
+        self.kind = MS.cmd_kind(cmd)
+        self.deps = list(deps)
+
+        self.pid = None
+        self.returncode = None
+        self.result = None  # True, False or None (not finished yet).
+        self.reason = None  # Reason of failure.
+        self.deadline = None
+        self.eof = False  # Reached EOF of the output.
+
+        self._proc = None
+        self._fd = None
+        self._out = None
+        self._buf = ''
+
+    def start(self):
+        """
+        Spawn a child process to run the command. The child will be a leader
+        of new process group to make it possible to stop whole of it later.
+        """
+        assert os.path.isdir(self.cwd), \
+            "Working dir %s does not exist or not a dir!" % self.cwd
+
+        self._proc = subprocess.Popen(self.cmd, cwd=self.cwd, shell=True,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      close_fds=True, preexec_fn=os.setsid)
+        self.pid = self._proc.pid
+        self._fd = self._proc.stdout.fileno()
+        MS._spawned(self.cmd)
+
+        flags = fcntl.fcntl(self._fd, fcntl.F_GETFL)
+        fcntl.fcntl(self._fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        if self.timeout is not None:
+            self.deadline = time.time() + self.timeout
+
+        if self.logfile:
+            if isinstance(self.logfile, bool):
+                self.logfile = os.path.join(self.cwd, "%d.log" % self.pid)
+            elif callable(self.logfile):
+                self.logfile = self.logfile()
+
+            self._out = open(self.logfile, 'a')
+
+        logging.debug("cmd=%s, logfile=%s" % (self.cmd[:100], self.logfile))
+
+    def fileno(self):
+        return self._fd
+
+    def _write(self, lines):
+        if self._out is None:
+            sys.stdout.write(''.join(self.prefix + l for l in lines))
+            sys.stdout.flush()
+        else:
+            self._out.write(''.join(lines))
+
+    def read(self):
+        """
+        Read output available and stream it line by line.
+
+        :return: False if it reached EOF else True
+        """
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return True
+                raise
+
+            if not data:
+                self._flush()
+                self.eof = True
+                return False
+
+            lines = (self._buf + data).split('\n')
+            self._buf = lines.pop()
+            self._write([l + '\n' for l in lines])
+
+    def _flush(self):
+        if self._buf:
+            self._write([self._buf + '\n'])
+            self._buf = ''
+
+    def poll(self):
+        """
+        :return: True if the child exited and reaped else False
+        """
+        return self._proc.poll() is not None
+
+    def kill(self):
+        """
+        Terminate whole of the process group of the child.
+        """
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.pid, sig)
+            except OSError:  # ESRCH: No such process group any more.
+                return
+
+            limit = time.time() + _KILL_GRACE
+            while not self.poll() and time.time() < limit:
+                time.sleep(MS._MIN_POLL_INTERVAL)
+
+            if self.poll():
+                return
+
+    def finish(self, reason=None):
+        """
+        Finish this task; Stop the child if it's still running, reap it and
+        release resources. It must be called after the child exited unless
+        ``reason`` is given, not to block.
+
+        :param reason: Reason to stop the child or None
+        """
+        if reason is not None and not self.poll():
+            self.kill()
+            self.reason = reason
+
+        self._proc.wait()
+        self.read()
+        self._flush()
+
+        self._proc.stdout.close()
+        if self._out is not None:
+            self._out.close()
+
+        self.returncode = self._proc.returncode
+
+        if self.reason is None and self.returncode != self.rc_expected:
+            self.reason = "rc=%d" % self.returncode
+
+        self.result = self.reason is None
+
+
+class Loop(object):
+    """
+    An event loop to run Tasks. The number of Tasks run at once is limited by
+    ``maxjobs`` and ``limits`` like myrepo.shell.prun does, and Tasks are
+    started after all of Tasks they depend on succeeded.
+
+    >>> loop = Loop(maxjobs=2)
+    >>> ts = [loop.add(Task(c)) for c in ("true", "false", "true")]
+    >>> loop.run()
+    [True, False, True]
+    """
+
+    def __init__(self, maxjobs=None, limits={}, stop_on_error=False):
+        """
+        :param maxjobs: Max number of jobs run concurrently or None (unlimited)
+        :param limits: A dict of (kind, max number of jobs of the kind)
+        :param stop_on_error: Cancel all of the rest and raise RuntimeError if
+            any of tasks failed
+        """
+        self.maxjobs = maxjobs
+        self.limits = limits
+        self.stop_on_error = stop_on_error
+
+        self.tasks = []
+        self.pending = []
+        self.running = []  # Running tasks not reaped yet.
+
+    def add(self, task):
+        """
+        :param task: A Task object not started yet. Tasks it depends on must
+            be added before it.
+        :return: ``task`` itself
+        """
+        assert all(t in self.tasks for t in task.deps), \
+            "Tasks depended on must be added before: " + task.cmd
+
+        self.tasks.append(task)
+        self.pending.append(task)
+
+        return task
+
+    def cancel(self, task, reason="cancelled"):
+        """
+        Cancel given task; It will be never started if it's not started yet,
+        or will be stopped if it's running.
+        """
+        if task in self.pending:
+            self.pending.remove(task)
+            (task.result, task.reason) = (False, reason)
+
+        elif task in self.running:
+            self.running.remove(task)
+            task.finish(reason)
+            logging.warn("Failed (%s): %s" % (task.reason, task.cmd))
+
+    def cancel_all(self, reason="cancelled"):
+        for task in self.pending + self.running:
+            self.cancel(task, reason)
+
+    def _start_tasks(self):
+        for task in self.pending[:]:
+            if any(t.result is False for t in task.deps):
+                self.pending.remove(task)
+                (task.result, task.reason) = (False, "dependencies failed")
+                logging.warn("Skipped as dependencies failed: " + task.cmd)
+                continue
+
+            if not all(t.result for t in task.deps):
+                continue
+
+            if not MS._has_free_slot(task.kind,
+                                     [t.kind for t in self.running],
+                                     self.maxjobs, self.limits):
+                continue
+
+            self.pending.remove(task)
+            task.start()
+            self.running.append(task)
+
+    def _done(self, task, reason=None):
+        self.running.remove(task)
+        task.finish(reason)
+
+        if task.result:
+            return
+
+        m = "Failed (%s): %s" % (task.reason, task.cmd)
+        if self.stop_on_error:
+            self.cancel_all()
+            raise RuntimeError(m)
+
+        logging.warn(m)
+
+    def _wait(self):
+        """
+        Wait for any events; output, exit of children or timeout.
+        """
+        now = time.time()
+        deadlines = [t.deadline for t in self.running if t.deadline]
+        timeout = max(0, min(deadlines) - now) if deadlines else None
+
+        if any(t.poll() for t in self.running):
+            timeout = 0
+        elif timeout is None or timeout > _REAP_INTERVAL:
+            timeout = _REAP_INTERVAL
+
+        try:
+            (rs, _ws, _xs) = select.select([t for t in self.running if
+                                            not t.eof], [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            rs = []
+
+        return rs
+
+    def run_once(self):
+        """
+        Start tasks if slots are free, stream output from running tasks, and
+        finish tasks exited or timed out.
+        """
+        self._start_tasks()
+        if not self.running:
+            return
+
+        # Tasks reached EOF are kept until they exit or time out; they may
+        # close their output before exit.
+        for task in self._wait():
+            task.read()
+
+        now = time.time()
+        for task in self.running[:]:
+            if task.poll():  # Exited but its descendants may hold its output.
+                self._done(task)
+
+            elif task.deadline is not None and now >= task.deadline:
+                self._done(task, "timeout")
+
+    def run(self):
+        """
+        Run all of the tasks added until all of them finish.
+
+        :return: List of result code of tasks in the order added
+        """
+        try:
+            while self.pending or self.running:
+                self.run_once()
+        except (KeyboardInterrupt, SystemExit):
+            self.cancel_all("interrupted")
+            raise
+        except:
+            self.cancel_all()
+            raise
+
+        return [t.result for t in self.tasks]
+
+
+def run_async(cmd, user=None, host="localhost", workdir=os.curdir,
+              rc_expected=0, logfile=False, conn_timeout=MS._CONN_TO,
+              timeout=MS._RUN_TO, prefix='', **kwargs):
+    """
+    Make a Task to run command ``cmd`` in ``Loop``. Its arguments are same as
+    myrepo.shell.run_async.
+
+    :return: Task instance not started yet
+    """
+    MS._validate_timeouts(conn_timeout, timeout)
+    (cmd, workdir) = MS.adjust_cmd(cmd, user, host, workdir, conn_timeout)
+
+    return Task(cmd, workdir, rc_expected, logfile, timeout, prefix)
+
+
+def run(cmd, user=None, host="localhost", workdir=os.curdir, rc_expected=0,
+        logfile=False, timeout=MS._RUN_TO, conn_timeout=MS._CONN_TO,
+        stop_on_error=False, **kwargs):
+    """
+    Run command ``cmd``. Its arguments are same as myrepo.shell.run.
+
+    >>> run("true")
+    True
+    >>> run("false")
+    False
+    >>> run("sleep 10", timeout=1)
+    False
+    """
+    loop = Loop(stop_on_error=stop_on_error)
+    loop.add(run_async(cmd, user, host, workdir, rc_expected, logfile,
+                       conn_timeout, timeout))
+
+    return loop.run()[0]
+
+
+def prun(cs, kwargs1={}, kwargs2={}, maxjobs=None, limits={}, deps=None,
+         kinds=None):
+    """
+    Run commands ``cs`` in parallel in an event loop. Its arguments are same
+    as myrepo.shell.prun.
+
+    >>> prun(["true", "false", "true"], maxjobs=2, limits=dict(other=1))
+    [True, False, True]
+    >>> prun(["sleep 10", "true"], kwargs2=dict(timeout=1))
+    [False, True]
+    >>> prun(["false", "true"], deps=[[], [0]])
+    [False, False]
+    >>> prun(["true", "true"], limits={"w0": 1}, kinds=["w0", "w0"])
+    [True, True]
+
+    :return: List of result code of run commands in the same order as ``cs``
+    """
+    loop = Loop(maxjobs, limits, kwargs2.get("stop_on_error", False))
+    timeout = kwargs2.get("timeout", MS._RUN_TO)
+
+    if deps:
+        MS._validate_deps(deps, len(cs))
+
+    for i, c in enumerate(cs):
+        kwargs = dict(timeout=timeout, prefix="[%d] " % i)
+        kwargs.update(kwargs1)
+        task = loop.add(run_async(c, **kwargs))
+
+        if deps:
+            task.deps = [loop.tasks[d] for d in deps[i]]
+
+        if kinds and kinds[i]:
+            task.kind = kinds[i]
+
+    return loop.run()
+
+
+# vim:sw=4:ts=4:et:
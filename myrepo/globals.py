@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import multiprocessing
 import os.path
 import os
 
@@ -25,6 +26,12 @@ MYREPO_TEMPLATE_PATH = "/usr/share/myrepo/templates"
 _TEMPLATE_PATHS = [os.path.join(MYREPO_TEMPLATE_PATH, "2"),
                    os.path.join(os.curdir, "templates", "2")]
 
+# Cache dir of templates compiled, and max number of results of rendering
+# templates to memoize (see myrepo.utils.compile_template).
+_TEMPLATE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "myrepo",
+                                   "templates")
+_TEMPLATE_MEMO_SIZE = 1024
+
 # Logging:
 _LOG_FMT = "%(asctime)s [%(levelname)-4s] myrepo: %(message)s"
 _LOG_DFMT = "%H:%M:%S"  # too much? "%a, %d %b %Y %H:%M:%S"
@@ -38,11 +45,85 @@ _RPM_ARCHS = ("i386", "i586", "i686", "x86_64", "ppc", "ia64", "s390",
 _CONN_LOCAL_TIMEOUT = 3
 _CONN_REMOTE_TIMEOUT = 10
 
+# Job scheduling; max number of jobs run at once, and the ones for each kinds
+# of jobs (see also myrepo.shell.cmd_kind):
+_MAXJOBS = multiprocessing.cpu_count() * 2
+_JOBLIMITS = "mock:%d" % max(1, multiprocessing.cpu_count() / 2)
+
+# Engines to run commands: "shell" (myrepo.shell) or "eventloop"
+# (myrepo.eventloop). The first one is the default.
+_ENGINES = ("shell", "eventloop")
+
 # RepoServer defaults:
 _CONN_TIMEOUT = 10  # Timeout in seconds to connect to hosts w/ ssh.
 _SERVER_TOPDIR = "~%(user)s/public_html/yum"  # Top dir of yum repos.
 _SERVER_BASEURL = "http://%(altname)s/~%(user)s/yum"  # Base URL of yum repos.
 
+# SSH connection multiplexing: Dir to put control sockets in, only the user
+# can access, and time in seconds the master connection stays after the last
+# session closed.
+_SSH_CONTROL_DIR = os.path.join(os.path.expanduser("~"), ".ssh", "myrepo")
+_SSH_CONTROL_PERSIST = 600
+
+# Backends to transfer files to servers (see myrepo.transfer). The first one
+# is the default.
+_TRANSFERS = ("scp", "rsync", "tar")
+
+# Compression of the 'tar' backend; 'auto' chooses xz if the bandwidth of the
+# link in MB/s is less than _TAR_XZ_BELOW, gzip if less than _TAR_GZIP_BELOW
+# or it's unknown, or no compression if the link is fast or local.
+_TAR_COMPRESS = ("auto", "none", "gzip", "xz")
+_TAR_XZ_BELOW = 2
+_TAR_GZIP_BELOW = 50
+
+# Pool of files keyed by their checksum on servers, relative to the top dir of
+# yum repos on them (see myrepo.transfer.pool_cmd).
+_POOL_SUBDIR = ".pool"
+
+# Generations of repodata: Dir in each dir of repos to keep them in, and time
+# in minutes the previous generations are kept after they were replaced, to
+# let clients fetching them finish (see myrepo.commands.update).
+_REPODATA_GENS = ".repodata.gens"
+_REPODATA_GRACE = 30
+
+# Generators of repodata: "createrepo" or "myrepo" (myrepo.repodata), and the
+# index file of the latter in each dir of repos. The first one is the default.
+_REPODATA_GENERATORS = ("createrepo", "myrepo")
+_REPODATA_INDEX = ".repodata.index"
+
+# Journal of dirs of yum repos metadata of which is to be updated later.
+_PENDING_UPDATES = os.path.join(os.path.expanduser("~"), ".myrepo",
+                                "pending_updates")
+
+# Delta RPMs: Max number of older versions of each RPM to make delta RPMs
+# from, and max size of RPMs to make delta RPMs of in bytes.
+_NUM_DELTAS = 1
+_MAX_DELTA_RPM_SIZE = 100000000
+
+# GC: Number of the newest builds of each package to keep in each dir of yum
+# repos; the newest and the previous one to make delta RPMs from by default.
+_GC_KEEP = 2
+
+# Header cache: sqlite database file caches headers of RPMs read.
+_HEADER_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "myrepo",
+                             "headers.sqlite")
+
+# Verify: sqlite database file caches checksums of files verified, and the
+# number of threads to compute checksums of files in parallel.
+_VERIFY_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "myrepo",
+                             "verify.sqlite")
+_VERIFY_JOBS = 4
+
+# Build cache: Dir to cache built RPMs in and max size of it in bytes.
+_BUILD_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "myrepo",
+                                "builds")
+_BUILD_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Build farm: Top dir on build workers to put SRPMs and built RPMs in, and
+# archs each worker can build RPMs for by default.
+_WORKER_TOPDIR = "~%(user)s/.myrepo/worker"
+_WORKER_ARCHS = ("x86_64", "i386")
+
 # Repo defaults:
 #   alternatives: "custom-%(name)s"
 _REPONAME = "%(name)s-%(server_shortaltname)s-%(server_user)s"
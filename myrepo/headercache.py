@@ -0,0 +1,255 @@
+#
+# Persistent cache of RPM headers.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Entries of the cache are kept in a sqlite database keyed by the absolute
+path of the RPM, and are valid while the size, the mtime and the inode number
+of the file are same as the ones when it was read. Each entry has NEVRA,
+sourcerpm, provides and requires in the header and the checksum of the file.
+
+Entries of RPMs removed or changed are only removed w/ ``prune``.
+"""
+import myrepo.globals as G
+import rpmkit.rpmutils as RU
+
+import hashlib
+import logging
+import os.path
+import os
+import sqlite3
+
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS headers (
+ path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER,
+ name TEXT, epoch TEXT, version TEXT, release TEXT, arch TEXT,
+ sourcerpm TEXT, is_srpm INTEGER, provides TEXT, requires TEXT,
+ checksum TEXT)"""
+
+_KEYS = ("name", "epoch", "version", "release", "arch", "sourcerpm",
+         "is_srpm", "provides", "requires", "checksum")
+
+_SUMTYPE = "sha256"
+
+
+def _checksum(path, bufsize=1024 * 1024):
+    h = hashlib.new(_SUMTYPE)
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(bufsize), ''):
+            h.update(data)
+
+    return h.hexdigest()
+
+
+def _stat(path):
+    """
+    :return: (size, mtime, inode) of the file
+    """
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime, st.st_ino)
+
+
+def mk_entry(h, path):
+    """
+    Make up an entry of the cache from the header of the RPM.
+
+    :param h: RPM header object or a dict has the same keys
+    :param path: RPM file path
+
+    :return: A dict of the entry
+    """
+    epoch = h["epoch"]
+
+    return dict(name=h["name"], version=h["version"], release=h["release"],
+                epoch='0' if epoch is None else str(epoch), arch=h["arch"],
+                sourcerpm=h["sourcerpm"] or '',
+                is_srpm=bool(h["sourcepackage"]),
+                provides=list(h["provides"] or []),
+                requires=list(h["requires"] or []),
+                checksum=_checksum(path))
+
+
+def read_entry(path):
+    """
+    :param path: RPM file path
+    :return: A dict of the entry made up from the header of the RPM
+    """
+    return mk_entry(RU.rpm_header_from_rpmfile(path), path)
+
+
+class HeaderCache(object):
+    """
+    >>> import tempfile, shutil
+    >>> topdir = tempfile.mkdtemp()
+    >>> cache = HeaderCache(os.path.join(topdir, "headers.sqlite"))
+    >>> cache.lookup("/not/exist.rpm")
+    >>> cache.hits, cache.misses
+    (0, 1)
+    >>> cache.hit_rate()
+    0.0
+    >>> shutil.rmtree(topdir)
+    """
+
+    def __init__(self, path=G._HEADER_CACHE, read=read_entry):
+        """
+        :param path: Path of the sqlite database file of the cache
+        :param read: Function to read the entry of the RPM on cache misses
+        """
+        self.path = path
+        self.read = read
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._pid = None  # Connections must not be shared w/ child processes.
+
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            topdir = os.path.dirname(self.path)
+            if topdir and not os.path.isdir(topdir):
+                os.makedirs(topdir)
+
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.text_factory = str
+            self._conn.execute(_SCHEMA)
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def lookup(self, path, count=True):
+        """
+        Look up the entry of given RPM.
+
+        :param path: RPM file path
+        :param count: Count up hits or misses if True
+
+        :return: A dict of the entry if found and valid else None
+        """
+        path = os.path.abspath(path)
+        ret = None
+
+        if os.path.exists(path):
+            row = self.conn().execute("SELECT size, mtime, inode, %s FROM "
+                                      "headers WHERE path = ?" %
+                                      ", ".join(_KEYS), (path, )).fetchone()
+
+            if row is not None and tuple(row[:3]) == _stat(path):
+                ret = dict(zip(_KEYS, row[3:]))
+                ret["is_srpm"] = bool(ret["is_srpm"])
+                for k in ("provides", "requires"):
+                    ret[k] = ret[k].split('\n') if ret[k] else []
+
+        if count:
+            if ret is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        logging.debug("Header cache %s: %s" % ("miss" if ret is None
+                                               else "hit", path))
+        return ret
+
+    def store(self, path, entry):
+        """
+        Store the entry of given RPM. Failures to write are not fatal as it's
+        just a cache, e.g. while other processes lock the database too long.
+
+        :param path: RPM file path
+        :param entry: A dict of the entry, see ``mk_entry``
+
+        :return: ``entry``
+        """
+        path = os.path.abspath(path)
+        vals = [entry[k] for k in _KEYS]
+        vals[_KEYS.index("is_srpm")] = int(entry["is_srpm"])
+        for k in ("provides", "requires"):
+            vals[_KEYS.index(k)] = '\n'.join(entry[k])
+
+        try:
+            conn = self.conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO headers VALUES (%s)" %
+                             ", ".join('?' * (4 + len(_KEYS))),
+                             [path] + list(_stat(path)) + vals)
+        except sqlite3.Error as e:
+            logging.warn("Could not store the header of %s: %s" % (path, e))
+
+        return entry
+
+    def get(self, path):
+        """
+        Get the entry of given RPM from the cache, or read and store it if
+        it's not in the cache.
+
+        :param path: RPM file path
+        :return: A dict of the entry
+        """
+        ret = self.lookup(path)
+        if ret is None:
+            ret = self.store(path, self.read(path))
+
+        return ret
+
+    def prune(self):
+        """
+        Remove entries of RPMs removed or changed after they were read.
+
+        :return: Number of entries removed
+        """
+        conn = self.conn()
+        paths = [p for p, size, mtime, inode in
+                 conn.execute("SELECT path, size, mtime, inode FROM headers")
+                 if not os.path.exists(p) or _stat(p) != (size, mtime, inode)]
+
+        with conn:
+            conn.executemany("DELETE FROM headers WHERE path = ?",
+                             [(p, ) for p in paths])
+        conn.execute("VACUUM")
+
+        return len(paths)
+
+    def __len__(self):
+        return self.conn().execute("SELECT COUNT(*) FROM headers"
+                                   ).fetchone()[0]
+
+    def hit_rate(self):
+        """
+        :return: Ratio of hits to lookups in percent
+        """
+        n = self.hits + self.misses
+        return 100.0 * self.hits / n if n else 0.0
+
+    def report(self):
+        logging.info("Header cache: hits=%d, misses=%d, hit rate=%.1f%%" %
+                     (self.hits, self.misses, self.hit_rate()))
+
+
+_SHARED = []
+
+
+def shared():
+    """
+    :return: The HeaderCache instance shared by modules in the process
+    """
+    if not _SHARED:
+        _SHARED.append(HeaderCache())
+
+    return _SHARED[0]
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,180 @@
+#
+# Journal of dirs of yum repos metadata of which is to be updated.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Dirs RPMs were deployed into are marked dirty by appending lines of the
+name and the command to update metadata of each dir to the journal file, and
+metadata of them is updated later at once; each command runs once even if
+the dir was marked many times.
+
+The journal file is locked while it's written, and is renamed to a snapshot
+file before the commands in it run, so that dirs marked while running them
+are kept for the next time.
+"""
+import myrepo.globals as G
+
+import fcntl
+import logging
+import os.path
+import os
+import time
+
+
+def _open_locked(path):
+    """
+    Open the file to append lines and lock it. The file is opened again if it
+    was renamed by others before it's locked.
+
+    :param path: File path
+    :return: A file object
+    """
+    while True:
+        f = open(path, 'a')
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+        if os.path.exists(path) and \
+                os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+            return f
+
+        f.close()
+
+
+class Journal(object):
+    """
+    >>> import tempfile, shutil
+    >>> topdir = tempfile.mkdtemp()
+    >>> journal = Journal(os.path.join(topdir, "pending"))
+    >>> journal.mark([("update:a", "true"), ("update:b", "false")])
+    >>> journal.mark([("update:a", "true")])
+    >>> journal.pending()
+    [('update:a', 'true'), ('update:b', 'false')]
+    >>> journal.flush(lambda cs: [c == "true" for c in cs])
+    False
+    >>> journal.pending()
+    [('update:b', 'false')]
+    >>> shutil.rmtree(topdir)
+    """
+
+    def __init__(self, path=G._PENDING_UPDATES):
+        """
+        :param path: Path of the journal file
+        """
+        self.path = path
+
+    def mark(self, entries):
+        """
+        Mark dirs dirty.
+
+        :param entries: List of (name, command string to update metadata of
+            the dir). Command strings must not contain new lines.
+        """
+        topdir = os.path.dirname(self.path)
+        if topdir and not os.path.isdir(topdir):
+            os.makedirs(topdir)
+
+        f = _open_locked(self.path)
+        try:
+            f.write(''.join("%s\t%s\n" % e for e in entries))
+        finally:
+            f.close()
+
+    def _load(self, path):
+        ret = []
+        if os.path.exists(path):
+            for l in open(path).read().splitlines():
+                e = tuple(l.split('\t', 1))
+                if len(e) == 2 and e not in ret:
+                    ret.append(e)
+
+        return ret
+
+    def pending(self):
+        """
+        :return: List of (name, command string) of dirs marked dirty w/o
+            duplicates
+        """
+        return self._load(self.path)
+
+    def quiet_for(self):
+        """
+        :return: Seconds passed since dirs were marked last, or None if no
+            dirs are marked
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        return max(0, time.time() - os.path.getmtime(self.path))
+
+    def flush(self, prun):
+        """
+        Run commands to update metadata of dirs marked dirty. Dirs of which
+        commands failed are marked again.
+
+        :param prun: Function to run commands in parallel, takes a list of
+            command strings and returns a list of results (True if succeeded)
+
+        :return: True if all commands succeeded or no dirs were marked
+        """
+        snapshot = "%s.%d" % (self.path, os.getpid())
+        try:
+            f = _open_locked(self.path)
+        except IOError:
+            return True  # The dir of the journal does not exist yet.
+
+        try:
+            if os.path.getsize(self.path) == 0:
+                os.remove(self.path)
+                return True
+
+            os.rename(self.path, snapshot)
+        finally:
+            f.close()
+
+        entries = self._load(snapshot)
+        logging.info("Update metadata of %d dirs: %s" %
+                     (len(entries), ", ".join(n for n, _c in entries)))
+
+        rcs = prun([c for _n, c in entries])
+        failed = [e for e, rc in zip(entries, rcs) if not rc]
+        if failed:
+            logging.warn("Failed to update metadata and keep them marked: " +
+                         ", ".join(n for n, _c in failed))
+            self.mark(failed)
+
+        os.remove(snapshot)
+        return not failed
+
+    def wait_quiet(self, period, sleep=time.sleep):
+        """
+        Wait until no dirs are marked for ``period`` seconds.
+
+        :param period: Quiet period in seconds
+        :return: True if some dirs are marked, or False if there are none
+        """
+        while True:
+            quiet = self.quiet_for()
+            if quiet is None:
+                return False
+
+            if quiet >= period:
+                return True
+
+            sleep(period - quiet)
+
+
+# vim:sw=4:ts=4:et:
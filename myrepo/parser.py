@@ -140,4 +140,75 @@ def parse_dists_option(dists, sep=","):
     return [parse_dist_option(dist) for dist in dists.split(sep)]
 
 
+def parse_joblimits(limits, sep=",", ksep=":"):
+    """Parse --joblimit options and returns a dict of (kind, limit).
+
+    >>> parse_joblimits([])
+    {}
+    >>> parse_joblimits("mock:2")
+    {'mock': 2}
+    >>> ls = parse_joblimits(["mock:2,createrepo:4", "scp:8"])
+    >>> sorted(ls.items())
+    [('createrepo', 4), ('mock', 2), ('scp', 8)]
+    >>> parse_joblimits("mock:-1")
+    Traceback (most recent call last):
+    ValueError: Invalid job limit, it must be <kind>:<limit> > 0: mock:-1
+
+    :param limits: A string or a list of strings of "<kind>:<limit>[,...]"
+    :return: A dict of (kind, limit) where limit :: int
+    :raises: ValueError if any of them is invalid
+    """
+    if isinstance(limits, basestring):
+        limits = [limits]
+
+    ret = dict()
+    for kl in (kl for ls in limits for kl in ls.split(sep) if kl.strip()):
+        kv = kl.strip().split(ksep)
+        if len(kv) != 2 or not kv[0] or not re.match(r"^[0-9]+$", kv[1]) \
+                or int(kv[1]) == 0:
+            raise ValueError("Invalid job limit, it must be <kind>:<limit> "
+                             "> 0: " + kl)
+
+        ret[kv[0]] = int(kv[1])
+
+    return ret
+
+
+def parse_worker_option(worker, sep=":", asep=","):
+    """Parse --worker option and returns (user, host, archs, slots, topdir).
+
+    >>> parse_worker_option("bld-1.example.com")
+    (None, 'bld-1.example.com', None, 1, None)
+    >>> parse_worker_option("jdoe@bld-1.example.com:x86_64,i386:4")
+    ('jdoe', 'bld-1.example.com', ['x86_64', 'i386'], 4, None)
+    >>> parse_worker_option("localhost::2:/tmp/w0")
+    (None, 'localhost', None, 2, '/tmp/w0')
+    >>> parse_worker_option("localhost:x86_64:0")
+    Traceback (most recent call last):
+    ValueError: Invalid build worker, slots must be > 0: localhost:x86_64:0
+
+    :param worker: A string of "[<user>@]<host>[:<archs>[:<slots>[:<topdir>]]]"
+        where <archs> is a list of archs separated by ``asep``
+    :return: A tuple of (user, host, archs, slots, topdir); user, archs and
+        topdir may be None (not specified)
+    :raises: ValueError if it's invalid
+    """
+    tpl = worker.split(sep, 3)
+    tpl += [''] * (4 - len(tpl))
+    (target, archs, slots, topdir) = tpl
+
+    (user, host) = target.split('@', 1) if '@' in target else (None, target)
+    archs = [a.strip() for a in archs.split(asep) if a.strip()] or None
+
+    if not host:
+        raise ValueError("Invalid build worker, no host: " + worker)
+
+    if slots and (not re.match(r"^[0-9]+$", slots) or int(slots) == 0):
+        raise ValueError("Invalid build worker, slots must be > 0: " + worker)
+
+    slots = int(slots) if slots else 1
+
+    return (user, host, archs, slots, topdir or None)
+
+
 # vim:sw=4:ts=4:et:
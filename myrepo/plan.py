@@ -0,0 +1,301 @@
+#
+# Plan, DAG of commands (steps) to run.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import re
+
+
+class Step(object):
+    """
+    A step of the plan, that is, a command string which will run after all of
+    the steps it depends on succeeded.
+
+    >>> s0 = Step("mock -r fedora-19-x86_64 a.src.rpm", name="build")
+    >>> s1 = Step("cp -a /var/lib/mock/fedora-19-x86_64/result/*.rpm /tmp",
+    ...           [s0], "copy")
+    >>> s1
+    Step(copy)
+    >>> s1.deps
+    [Step(build)]
+    """
+
+    def __init__(self, cmd, deps=[], name=None, kind=None):
+        """
+        :param cmd: Command string (adjusted to run on the host already)
+        :param deps: List of Steps this step depends on
+        :param name: Name of this step used in logs
+        :param kind: Kind of the command to limit the number of jobs of the
+            kind run at once, or None (see myrepo.shell.cmd_kind)
+        """
+        self.cmd = cmd
+        self.deps = list(deps)
+        self.name = cmd[:60] if name is None else name
+        self.kind = kind
+
+    def __repr__(self):
+        return "Step(%s)" % self.name
+
+
+def toposort(steps):
+    """
+    Sort steps topologically; steps depend on others come after them. Steps
+    not in ``steps`` but depended on are included also.
+
+    >>> a = Step("a"); b = Step("b", [a]); c = Step("c", [a, b])
+    >>> toposort([c, b])
+    [Step(a), Step(b), Step(c)]
+    >>> a.deps = [c]
+    >>> try:
+    ...     toposort([c])
+    ... except ValueError:
+    ...     pass
+
+    :param steps: List of Steps
+    :return: List of Steps sorted
+    """
+    ret = []
+    visiting = set()
+    visited = set()
+
+    def visit(step):
+        if id(step) in visited:
+            return
+
+        if id(step) in visiting:
+            raise ValueError("Circular dependency found: %r" % step)
+
+        visiting.add(id(step))
+        for dep in step.deps:
+            visit(dep)
+
+        visiting.remove(id(step))
+        visited.add(id(step))
+        ret.append(step)
+
+    for step in steps:
+        visit(step)
+
+    return ret
+
+
+def linearize(steps):
+    """
+    Make up a list of command strings and a list of lists of indices of
+    commands each command depends on, to pass to myrepo.shell.prun.
+
+    >>> a = Step("a"); b = Step("b", [a]); c = Step("c", [a, b])
+    >>> linearize([c])
+    (['a', 'b', 'c'], [[], [0], [0, 1]])
+
+    :param steps: List of Steps
+    :return: A tuple of (command_strings, deps)
+    """
+    steps = toposort(steps)
+    indices = dict((id(s), i) for i, s in enumerate(steps))
+
+    cs = [s.cmd for s in steps]
+    deps = [[indices[id(d)] for d in s.deps] for s in steps]
+
+    logging.debug("Plan: %d steps: %s" % (len(steps), steps))
+    return (cs, deps)
+
+
+def _uniq(steps):
+    """
+    :param steps: List of Steps
+    :return: List of Steps w/o duplicates keeping its order
+    """
+    ret = []
+    for step in steps:
+        if not any(s is step for s in ret):
+            ret.append(step)
+
+    return ret
+
+
+def _reaches(steps, other):
+    """
+    :param steps: List of Steps
+    :param other: A Step
+
+    :return: True if ``other`` is one of ``steps`` or any of them depends on
+        ``other`` directly or indirectly
+
+    >>> a = Step("a"); b = Step("b", [a]); c = Step("c", [b, a])
+    >>> _reaches([c], a), _reaches([a], c)
+    (True, False)
+    """
+    visited = set()
+    todo = list(steps)
+
+    while todo:
+        step = todo.pop()
+        if step is other:
+            return True
+
+        if id(step) not in visited:  # Visit each step once.
+            visited.add(id(step))
+            todo.extend(step.deps)
+
+    return False
+
+
+def dedupe(steps):
+    """
+    Remove steps duplicated, that is, steps of the same command string. The
+    step remains will depend on all of the ones depended on by duplicates.
+
+    >>> a = Step("a"); b = Step("b", [a]); c = Step("c")
+    >>> steps = dedupe([b, Step("b", [c]), Step("a"), c])
+    >>> steps
+    [Step(a), Step(c), Step(b)]
+    >>> steps[-1].deps
+    [Step(a), Step(c)]
+
+    :param steps: List of Steps
+    :return: List of Steps deduped and sorted topologically
+    """
+    ret = []
+    found = dict()  # cmd :: str -> Step
+    steps_map = dict()  # id(step) -> Step in ret
+
+    for step in toposort(steps):
+        deps = _uniq(steps_map[id(d)] for d in step.deps)
+        other = found.get(step.cmd, None)
+
+        if other is None or _reaches(deps, other):
+            other = Step(step.cmd, deps, step.name, step.kind)
+            found[step.cmd] = other
+            ret.append(other)
+        else:
+            other.deps = _uniq(other.deps + deps)
+
+        steps_map[id(step)] = other
+
+    return toposort(ret)
+
+
+_REMOTE_CMD_RE = re.compile(r"^(ssh [^']*) '([^']*)'$")
+
+
+def _split_remote_cmd(cmd):
+    """
+    >>> _split_remote_cmd("ssh -o ConnectTimeout=10 jdoe@a.example.com 'ls'")
+    ('ssh -o ConnectTimeout=10 jdoe@a.example.com', 'ls')
+    >>> _split_remote_cmd("ls")
+    (None, 'ls')
+    """
+    m = _REMOTE_CMD_RE.match(cmd)
+    return m.groups() if m else (None, cmd)
+
+
+def _merge_remote_cmds(prefix, cs):
+    """
+    Make up a command to run given remote commands in one ssh session. All of
+    the commands run even if some of them failed, and it fails if any of them
+    failed as they were run separately.
+
+    >>> _merge_remote_cmds("ssh h0", ["ls", "cd /tmp && ls"])
+    "ssh h0 'rc=0; (ls) || rc=1; (cd /tmp && ls) || rc=1; exit $rc'"
+    """
+    return "%s 'rc=0; %s; exit $rc'" % (prefix, "; ".join("(%s) || rc=1" % c
+                                                          for c in cs))
+
+
+def merge_remote_steps(steps):
+    """
+    Merge steps run on the same remote host (w/ same ssh options) and depend
+    on the same steps into one step to run them in one ssh session. Steps of
+    explicit kinds are not merged as the number of them run at once is
+    limited by the kinds.
+
+    >>> a = Step("ssh h0 'ls /a'"); b = Step("ssh h0 'ls /b'")
+    >>> c = Step("ssh h1 'ls /c'"); d = Step("true", [b])
+    >>> steps = merge_remote_steps([a, b, c, d])
+    >>> [s.cmd for s in steps]  # doctest: +NORMALIZE_WHITESPACE
+    ["ssh h0 'rc=0; (ls /a) || rc=1; (ls /b) || rc=1; exit $rc'",
+     "ssh h1 'ls /c'", 'true']
+    >>> steps[-1].deps == [steps[0]]
+    True
+
+    :param steps: List of Steps
+    :return: List of Steps merged and sorted topologically
+    """
+    steps = toposort(steps)
+    groups = dict()  # (prefix, ids of deps) -> [(step, remote_cmd)]
+
+    for step in steps:
+        (prefix, rcmd) = _split_remote_cmd(step.cmd)
+        if prefix is not None and step.kind is None:
+            key = (prefix, tuple(sorted(id(d) for d in step.deps)))
+            groups.setdefault(key, []).append((step, rcmd))
+
+    steps_map = dict()  # id(step) -> Step merged or copied
+    for (prefix, _ds), members in groups.iteritems():
+        if len(members) < 2:
+            continue
+
+        s0 = members[0][0]
+        merged = Step(_merge_remote_cmds(prefix, [c for _s, c in members]),
+                      s0.deps, '+'.join(s.name for s, _c in members))
+
+        for s, _c in members:
+            steps_map[id(s)] = merged
+
+    for step in steps:
+        if id(step) not in steps_map:
+            steps_map[id(step)] = Step(step.cmd, step.deps, step.name,
+                                       step.kind)
+
+    ret = _uniq(steps_map[id(s)] for s in steps)
+    for step in ret:
+        step.deps = _uniq(steps_map[id(d)] for d in step.deps)
+
+    return toposort(ret)
+
+
+def optimize(steps, merge=True):
+    """
+    Optimize the plan; remove duplicated steps and merge steps run on the
+    same remote host into one.
+
+    >>> a = Step("ssh h0 'ls /a'"); b = Step("ssh h0 'ls /b'")
+    >>> len(optimize([a, b, Step("ssh h0 'ls /a'")]))
+    1
+    >>> len(optimize([a, b], False))
+    2
+
+    :param steps: List of Steps
+    :param merge: Merge remote steps also if True
+
+    :return: List of Steps optimized and sorted topologically
+    """
+    steps = toposort(steps)
+    nsteps = len(steps)
+
+    ret = dedupe(steps)
+    if merge:
+        ret = merge_remote_steps(ret)
+
+    logging.info("Optimized the plan: %d -> %d commands" %
+                 (nsteps, len(ret)))
+    return ret
+
+
+# vim:sw=4:ts=4:et:
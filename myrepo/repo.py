@@ -18,6 +18,8 @@
 import myrepo.globals as G
 import myrepo.srpm as MS
 import myrepo.shell as SH
+import myrepo.sshmux as SM
+import myrepo.transfer as MT
 import myrepo.utils as U
 import rpmkit.rpmutils as RU
 import rpmkit.environ as E
@@ -26,6 +28,10 @@ import glob
 import locale
 import logging
 import os.path
+import re
+
+
+_BUILD_ID_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._+-]")
 
 
 def _format(fmt_or_val, ctx={}):
@@ -76,10 +82,27 @@ class Server(object):
     'file:///tmp'
     >>> s.is_local
     True
+
+    >>> s = Server("yumrepos.local", "jdoe", mux=False)
+    >>> s.deploy_cmd("/a/b/*.rpm", "/c/d")
+    'scp -p /a/b/*.rpm jdoe@yumrepos.local:/c/d'
+    >>> s = Server("yumrepos.local", "jdoe", mux=False, transfer="rsync")
+    >>> s.deploy_cmd("/a/b/*.rpm", "/c/d").split(')')[0]
+    'out=$(rsync -a --partial --stats /a/b/*.rpm jdoe@yumrepos.local:/c/d/'
+    >>> s = Server("yumrepos.local", "jdoe", mux=False, pool=True)
+    >>> s._pool
+    '~jdoe/public_html/yum/.pool'
+    >>> s.deploy_cmd("/a/b/*.rpm", "/c/d").split(';')[0]
+    '(l=$(for f in /a/b/*.rpm'
     """
 
     def __init__(self, name, user=None, altname=None, topdir=G._SERVER_TOPDIR,
-                 baseurl=G._SERVER_BASEURL, timeout=G._CONN_TIMEOUT):
+                 baseurl=G._SERVER_BASEURL, timeout=G._CONN_TIMEOUT,
+                 mux=True, transfer=G._TRANSFERS[0], checksum=False,
+                 compress=G._TAR_COMPRESS[0], bandwidth=None, pool=False,
+                 repodata_generator=G._REPODATA_GENERATORS[0],
+                 num_deltas=G._NUM_DELTAS,
+                 max_delta_rpm_size=G._MAX_DELTA_RPM_SIZE):
         """
         :param name: FQDN or hostname of the server provides yum repos
         :param user: User name on the server to provide yum repos
@@ -87,7 +110,30 @@ class Server(object):
         :param topdir: Top dir or its format string of yum repos to serve RPMs.
         :param baseurl: Base url or its format string of yum repos
         :param timeout: SSH connection timeout to this server
+        :param mux: Share a multiplexed SSH connection to this server among
+            commands if True. It will be ignored if this host is localhost.
+        :param transfer: Backend to transfer files to this server, one of
+            G._TRANSFERS (see myrepo.transfer)
+        :param checksum: Compare files by their checksum instead of their size
+            and mtime to find files to transfer, if the backend is 'rsync'
+        :param compress: Compression of files transferred if the backend is
+            'tar', one of G._TAR_COMPRESS
+        :param bandwidth: Bandwidth of the link to this server in MB/s or
+            None (unknown), to choose the compression automatically
+        :param pool: Upload files into the pool of files keyed by their
+            checksum under ``topdir`` only if the pool lacks them and hardlink
+            them into dirs of repos, instead of copying them into the dirs,
+            if True. The backend is used only to list files and 'tar' is not
+            used in this mode.
+        :param repodata_generator: Generator of repodata run on this server,
+            one of G._REPODATA_GENERATORS (see myrepo.commands.update)
+        :param num_deltas: Max number of older versions of each RPM to make
+            delta RPMs from in background after metadata was updated, or 0
+            not to make delta RPMs
+        :param max_delta_rpm_size: Max size of RPMs to make delta RPMs of
         """
+        assert transfer in G._TRANSFERS, "Invalid transfer: " + transfer
+
         self.name = name
         self.user = E.get_username() if user is None else user
         self.altname = name if altname is None else altname
@@ -105,6 +151,21 @@ class Server(object):
         self.baseurl = _format(baseurl, ctx)
 
         self.is_local = SH.is_local(self.name)
+        self.repodata_generator = repodata_generator
+        self.num_deltas = num_deltas
+        self.max_delta_rpm_size = max_delta_rpm_size
+
+        if mux and not self.is_local:
+            self._mux = SM.get_mux(self.name, self.user, self.timeout)
+        else:
+            self._mux = None
+
+        self._transfer = transfer
+        self._checksum = checksum
+        self._compressor = MT.choose_compressor(compress, self.is_local,
+                                                bandwidth)
+        self._pool = os.path.join(self.topdir, G._POOL_SUBDIR) if pool \
+            else None
 
     def __repr__(self):
         return repr(self.__dict__)
@@ -115,6 +176,18 @@ class Server(object):
     def _mk_shortname(self, name, sep='.'):
         return name.split(sep)[0] if sep in name else name
 
+    def _ssh_opts(self):
+        return None if self._mux is None else self._mux.options()
+
+    def connect(self):
+        """
+        Open the multiplexed SSH connection to this server if it's needed and
+        not opened yet. It will be closed automatically at exit.
+
+        :return: False if it's needed but could not be opened else True
+        """
+        return True if self._mux is None else self._mux.open()
+
     def adjust_cmd(self, cmd, workdir=os.curdir):
         """
         :param cmd: Command string
@@ -122,26 +195,114 @@ class Server(object):
 
         :return: A tuple of (command_string, workdir)
         """
-        return SH.adjust_cmd(cmd, self.user, self.name, workdir)
+        return SH.adjust_cmd(cmd, self.user, self.name, workdir,
+                             opts=self._ssh_opts())
 
     def deploy_cmd(self, src, dst):
         """
         Make up and and return command strings to deploy objects from ``src``
         to ``dst`` on the server.
 
-        :param src: Copying source (path) :: str
+        :param src: Copying source (path or glob), or a list of them
         :param dst: Copying destination (path) :: str
 
         :return: command string to deploy objects :: str
         """
+        if self._pool is not None:
+            return self.pool_deploy_cmd(src, [dst])
+
         if self.is_local:
             if "~" in dst:
                 dst = os.path.expanduser(dst)
 
-            return "cp -a %s %s" % (src, dst)
+            (host, opts) = (None, None)
         else:
-            h = "%s@%s" % (self.user, self.name) if self.user else self.name
-            return "scp -p %s %s:%s" % (src, h, dst)
+            (host, opts) = (self.name, self._ssh_opts())
+
+        if self._transfer == "rsync":
+            return MT.rsync_cmd(src, dst, host, self.user or None, opts,
+                                self._checksum)
+
+        if self._transfer == "tar":
+            return self.bulk_deploy_cmd(src, dst)
+
+        return MT.scp_cmd(src, dst, host, self.user or None, opts)
+
+    def bulk_deploy_cmd(self, files, dst, post=None):
+        """
+        Make up a command string to deploy files into sub dirs of ``dst`` on
+        the server at once in one stream, if the backend is 'tar'.
+
+        :param files: List of tuples of (source path or glob, sub dir of
+            ``dst``), or a source path or glob
+        :param dst: Copying destination dir
+        :param post: Command string run in ``dst`` on the server after the
+            files were deployed, or None
+
+        :return: Command string, or None if the backend is not 'tar'
+        """
+        if self._transfer != "tar" or self._pool is not None:
+            return None
+
+        if self.is_local:
+            return MT.tar_cmd(files, os.path.expanduser(dst),
+                              compressor=self._compressor, post=post)
+
+        return MT.tar_cmd(files, dst, self.name, self.user or None,
+                          self._ssh_opts(), self._compressor, post)
+
+    def pool_deploy_cmd(self, src, dsts):
+        """
+        Make up a command string to deploy files into the pool on the server
+        and to hardlink them into each dir of ``dsts``.
+
+        :param src: Copying source (path or glob), or a list of them
+        :param dsts: List of copying destination dirs
+
+        :return: Command string, or None if the pool is not used
+        """
+        if self._pool is None:
+            return None
+
+        if self.is_local:
+            return MT.pool_cmd(src, [os.path.expanduser(d) for d in dsts],
+                               os.path.expanduser(self._pool))
+
+        return MT.pool_cmd(src, dsts, self._pool, self.name,
+                           self.user or None, self._ssh_opts())
+
+    def pool_gc_cmd(self):
+        """
+        Make up a command string to run on the server to remove files in the
+        pool not linked from any dirs of repos any more.
+
+        :return: Command string, or None if the pool is not used
+        """
+        if self._pool is None:
+            return None
+
+        return "{ test ! -d %s || find %s -type f -links 1 -delete; }" % \
+            (self._pool, self._pool)
+
+
+def build_id(srpm):
+    """
+    Make up an ID of the build of given SRPM, used to isolate the build from
+    others run at the same time.
+
+    >>> build_id(MS.Srpm("/a/b/foo-0.1-1.fc19.src.rpm"))
+    'foo-0.1-1.fc19'
+    >>> build_id(MS.Srpm("/a/b/foo bar~1.src.rpm"))
+    'foo_bar_1'
+
+    :param srpm: myrepo.srpm.Srpm instance
+    :return: Build ID :: str
+    """
+    bid = os.path.basename(srpm.path)
+    if bid.endswith(".src.rpm"):
+        bid = bid[:-len(".src.rpm")]
+
+    return _BUILD_ID_UNSAFE_CHARS.sub('_', bid)
 
 
 class Dist(object):
@@ -151,6 +312,12 @@ class Dist(object):
     ('fedora-19', 'x86_64', 'fedora-19-x86_64')
     >>> d.mockcfg
     'fedora-19-x86_64.cfg'
+    >>> srpm = MS.Srpm("/a/b/foo-0.1-1.src.rpm")
+    >>> d.rpmdir(srpm)
+    '/var/lib/mock/fedora-19-x86_64-foo-0.1-1/result'
+    >>> d.mock_opts(srpm)  # doctest: +NORMALIZE_WHITESPACE
+    '--uniqueext=foo-0.1-1
+     --resultdir=/var/lib/mock/fedora-19-x86_64-foo-0.1-1/result'
     """
 
     def __init__(self, dist, arch):
@@ -170,10 +337,28 @@ class Dist(object):
     def __eq__(self, other):
         return repr(self) == repr(other)
 
-    def rpmdir(self):
+    def rpmdir(self, srpm=None):
         """Dir to save built RPMs.
+
+        :param srpm: myrepo.srpm.Srpm instance or None. Each build of SRPMs
+            has its own dir if given.
         """
-        return "/var/lib/mock/%s/result" % self.label
+        if srpm is None:
+            return "/var/lib/mock/%s/result" % self.label
+
+        return "/var/lib/mock/%s-%s/result" % (self.label, build_id(srpm))
+
+    def mock_opts(self, srpm):
+        """
+        Options of mock to build given SRPM in its own chroot and to save
+        built RPMs into its own dir, so that builds of different SRPMs for
+        the same dist can run at the same time.
+
+        :param srpm: myrepo.srpm.Srpm instance
+        :return: Options string
+        """
+        return "--uniqueext=%s --resultdir=%s" % (build_id(srpm),
+                                                  self.rpmdir(srpm))
 
 
 class MaybeMultiarchDist(object):
@@ -252,14 +437,14 @@ class Repo(object):
     >>> repo.reponame
     'fedora-yumrepos'
 
-    >>> srpm = MS.Srpm("/dummy/path/src.rpm"); srpm.noarch = False
+    >>> srpm = MS.Srpm("/dummy/path/foo.src.rpm"); srpm.noarch = False
     >>> repo.list_build_labels(srpm)
     ['fedora-19-x86_64', 'fedora-19-i386']
     >>> repo.mockcfg_files(srpm)
     ['fedora-19-x86_64.cfg', 'fedora-19-i386.cfg']
     >>> repo.mockdirs(srpm)  # doctest: +NORMALIZE_WHITESPACE
-    ['/var/lib/mock/fedora-19-x86_64/result',
-     '/var/lib/mock/fedora-19-i386/result']
+    ['/var/lib/mock/fedora-19-x86_64-foo/result',
+     '/var/lib/mock/fedora-19-i386-foo/result']
     """
 
     def __init__(self, name, version, archs, server, reponame=G._REPONAME,
@@ -351,14 +536,21 @@ class Repo(object):
         """
         return [d.mockcfg for d in self.list_dists(srpm)]
 
-    def mockdirs(self, srpm):
+    def mockdirs(self, srpm, cache=None):
         """
         Return dirs where built RPMs are.
 
         :param srpm: "resolved" myrepo.srpm.Srpm instance
+        :param cache: myrepo.buildcache.BuildCache instance or None. The
+            entry of the cache is used instead if RPMs were found in it.
+
         :return: List of paths to dirs in which built RPMs are
         """
-        return [d.rpmdir() for d in self.list_dists(srpm)]
+        if cache is None:
+            return [d.rpmdir(srpm) for d in self.list_dists(srpm)]
+
+        return [cache.lookup(srpm.path, d.label, False) or d.rpmdir(srpm)
+                for d in self.list_dists(srpm)]
 
     def adjust_cmd(self, cmd, workdir=os.curdir):
         """
@@ -0,0 +1,815 @@
+#
+# Native incremental repodata generator.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Generate yum repo metadata, primary, filelists and other in XML and in
+sqlite databases, and repomd.xml of RPMs in a dir like createrepo does.
+
+The index of RPMs, the elements of each RPM in XML files keyed by its size
+and mtime, and the sqlite databases of metadata of them are kept in the dir.
+The header of each RPM is read only if it was not in the index or it was
+changed, and the databases are updated by removing rows of RPMs removed and
+inserting ones of RPMs added, so that only the headers of RPMs added are read
+when the metadata is updated.
+
+Usage: python -m myrepo.repodata [-o OUTPUTDIR] DIR
+"""
+import myrepo.globals as G
+import myrepo.headercache as MHC
+import rpmkit.rpmutils as RU
+
+import bz2
+import cPickle as pickle
+import gzip
+import hashlib
+import logging
+import optparse
+import os.path
+import os
+import re
+import shutil
+import sqlite3
+import stat
+import struct
+import sys
+import tempfile
+import time
+
+from xml.sax.saxutils import escape, quoteattr
+
+
+_INDEX_VERSION = 1
+_DB_VERSION = 10
+_SUMTYPE = "sha256"
+
+_RPMSENSE_FLAGS = {2: "LT", 4: "GT", 8: "EQ", 10: "LE", 12: "GE"}
+_RPMSENSE_PRE = 64 | 512 | 1024  # PREREQ | SCRIPT_PRE | SCRIPT_POST
+_RPMFILE_GHOST = 64
+
+# Files listed in primary metadata as well as filelists.
+_PRIMARY_FILES_RE = re.compile(r".*bin/.*|^/etc/.*|^/usr/lib/sendmail$")
+
+_INVALID_XML_CHARS_RE = re.compile(u"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_NS_COMMON = "http://linux.duke.edu/metadata/common"
+_NS_FILELISTS = "http://linux.duke.edu/metadata/filelists"
+_NS_OTHER = "http://linux.duke.edu/metadata/other"
+_NS_REPO = "http://linux.duke.edu/metadata/repo"
+_NS_RPM = "http://linux.duke.edu/metadata/rpm"
+
+# Tables of sqlite databases of yum (see yum-metadata-parser).
+_PRIMARY_DB_SCHEMA = """\
+CREATE TABLE db_info (dbversion INTEGER, checksum TEXT);
+CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT, name TEXT,
+ arch TEXT, version TEXT, epoch TEXT, release TEXT, summary TEXT,
+ description TEXT, url TEXT, time_file INTEGER, time_build INTEGER,
+ rpm_license TEXT, rpm_vendor TEXT, rpm_group TEXT, rpm_buildhost TEXT,
+ rpm_sourcerpm TEXT, rpm_header_start INTEGER, rpm_header_end INTEGER,
+ rpm_packager TEXT, size_package INTEGER, size_installed INTEGER,
+ size_archive INTEGER, location_href TEXT, location_base TEXT,
+ checksum_type TEXT);
+CREATE TABLE files (name TEXT, type TEXT, pkgKey INTEGER);
+CREATE TABLE requires (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+ release TEXT, pkgKey INTEGER, pre BOOLEAN DEFAULT FALSE);
+CREATE TABLE provides (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+ release TEXT, pkgKey INTEGER);
+CREATE TABLE conflicts (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+ release TEXT, pkgKey INTEGER);
+CREATE TABLE obsoletes (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+ release TEXT, pkgKey INTEGER);
+CREATE INDEX packagename ON packages (name);
+CREATE INDEX packageId ON packages (pkgId);
+CREATE INDEX filenames ON files (name);
+CREATE INDEX pkgfiles ON files (pkgKey);
+CREATE INDEX pkgrequires ON requires (pkgKey);
+CREATE INDEX requiresname ON requires (name);
+CREATE INDEX pkgprovides ON provides (pkgKey);
+CREATE INDEX providesname ON provides (name);
+CREATE INDEX pkgconflicts ON conflicts (pkgKey);
+CREATE INDEX pkgobsoletes ON obsoletes (pkgKey);
+CREATE TRIGGER removals AFTER DELETE ON packages BEGIN
+ DELETE FROM files WHERE pkgKey = old.pkgKey;
+ DELETE FROM requires WHERE pkgKey = old.pkgKey;
+ DELETE FROM provides WHERE pkgKey = old.pkgKey;
+ DELETE FROM conflicts WHERE pkgKey = old.pkgKey;
+ DELETE FROM obsoletes WHERE pkgKey = old.pkgKey;
+END;
+"""
+
+_FILELISTS_DB_SCHEMA = """\
+CREATE TABLE db_info (dbversion INTEGER, checksum TEXT);
+CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT);
+CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT, filenames TEXT,
+ filetypes TEXT);
+CREATE INDEX keyfile ON filelist (pkgKey);
+CREATE INDEX pkgId ON packages (pkgId);
+CREATE INDEX dirnames ON filelist (dirname);
+CREATE TRIGGER remove_filelist AFTER DELETE ON packages BEGIN
+ DELETE FROM filelist WHERE pkgKey = old.pkgKey;
+END;
+"""
+
+_OTHER_DB_SCHEMA = """\
+CREATE TABLE db_info (dbversion INTEGER, checksum TEXT);
+CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT);
+CREATE TABLE changelog (pkgKey INTEGER, author TEXT, date INTEGER,
+ changelog TEXT);
+CREATE INDEX keychange ON changelog (pkgKey);
+CREATE INDEX pkgId ON packages (pkgId);
+CREATE TRIGGER remove_changelogs AFTER DELETE ON packages BEGIN
+ DELETE FROM changelog WHERE pkgKey = old.pkgKey;
+END;
+"""
+
+
+def _u(s):
+    """
+    >>> _u("abc"), _u(None), _u("\\xe9")
+    (u'abc', u'', u'\\xe9')
+    >>> _u("a\\x01b")
+    u'ab'
+    """
+    if s is None:
+        return u''
+
+    if not isinstance(s, unicode):
+        try:
+            s = s.decode("utf-8")
+        except UnicodeDecodeError:
+            s = s.decode("latin-1")
+
+    return _INVALID_XML_CHARS_RE.sub(u'', s)
+
+
+def _evr(version):
+    """
+    Split the version string of a dependency into (epoch, version, release).
+
+    >>> _evr("1:0.1-1"), _evr("0.1-1")
+    (('1', '0.1', '1'), ('0', '0.1', '1'))
+    >>> _evr("0.1"), _evr("")
+    (('0', '0.1', None), (None, None, None))
+    """
+    if not version:
+        return (None, None, None)
+
+    (epoch, vr) = version.split(':', 1) if ':' in version else ('0', version)
+    (ver, rel) = vr.rsplit('-', 1) if '-' in vr else (vr, None)
+
+    return (epoch, ver, rel)
+
+
+def _deps(names, flags, versions, requires=False):
+    """
+    :return: List of tuples of (name, flags, epoch, version, release, pre)
+    """
+    ret = []
+    for name, flag, version in zip(names or [], flags or [], versions or []):
+        if requires and name.startswith("rpmlib("):
+            continue
+
+        dep = (_u(name), _RPMSENSE_FLAGS.get(flag & 0xf)) + \
+            tuple(x if x is None else _u(x) for x in _evr(version)) + \
+            (bool(requires and flag & _RPMSENSE_PRE), )
+
+        if dep not in ret:
+            ret.append(dep)
+
+    return ret
+
+
+def _header_range(path):
+    """
+    :return: A tuple of (start, end) offsets of the header in the RPM file
+    """
+    def header_size(f):
+        (il, dl) = struct.unpack(">8xii", f.read(16))
+        return 16 + 16 * il + dl
+
+    with open(path, 'rb') as f:
+        f.seek(96)  # Skip the lead.
+        sigsize = header_size(f)
+        start = 96 + sigsize + (8 - sigsize % 8) % 8
+
+        f.seek(start)
+        return (start, start + header_size(f))
+
+
+def _checksum(path, bufsize=1024 * 1024):
+    h = hashlib.new(_SUMTYPE)
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(bufsize), ''):
+            h.update(data)
+
+    return h.hexdigest()
+
+
+def read_package(path, href=None):
+    """
+    Read metadata of the RPM from its header.
+
+    :param path: RPM file path
+    :param href: Location of the RPM relative to the top dir of the repo
+
+    :return: A dict of metadata of the RPM
+    """
+    h = RU.rpm_header_from_rpmfile(path)
+    st = os.stat(path)
+
+    # The checksum is shared w/ other repos through the header cache.
+    cache = MHC.shared()
+    entry = cache.lookup(path) or cache.store(path, MHC.mk_entry(h, path))
+
+    (start, end) = _header_range(path)
+
+    files = []
+    for f, mode, flags in zip(h["filenames"] or [], h["filemodes"] or [],
+                              h["fileflags"] or []):
+        ftype = "ghost" if flags & _RPMFILE_GHOST else \
+            ("dir" if stat.S_ISDIR(mode & 0xffff) else '')
+        files.append((_u(f), ftype))
+
+    changelogs = [(_u(a), t, _u(x)) for a, t, x in
+                  zip(h["changelogname"] or [], h["changelogtime"] or [],
+                      h["changelogtext"] or [])]
+    changelogs.reverse()  # Older ones first.
+
+    epoch = h["epoch"]
+
+    return dict(pkgid=entry["checksum"], name=_u(h["name"]),
+                arch=u"src" if h["sourcepackage"] else _u(h["arch"]),
+                epoch=u'0' if epoch is None else unicode(epoch),
+                version=_u(h["version"]), release=_u(h["release"]),
+                summary=_u(h["summary"]), description=_u(h["description"]),
+                url=_u(h["url"]), packager=_u(h["packager"]),
+                time_file=int(st.st_mtime), time_build=h["buildtime"] or 0,
+                license=_u(h["license"]), vendor=_u(h["vendor"]),
+                group=_u(h["group"]), buildhost=_u(h["buildhost"]),
+                sourcerpm=_u(h["sourcerpm"]), header_start=start,
+                header_end=end, size_package=st.st_size,
+                size_installed=h["size"] or 0,
+                size_archive=h["archivesize"] or 0,
+                location=_u(href or os.path.basename(path)),
+                provides=_deps(h["providename"], h["provideflags"],
+                               h["provideversion"]),
+                requires=_deps(h["requirename"], h["requireflags"],
+                               h["requireversion"], True),
+                conflicts=_deps(h["conflictname"], h["conflictflags"],
+                                h["conflictversion"]),
+                obsoletes=_deps(h["obsoletename"], h["obsoleteflags"],
+                                h["obsoleteversion"]),
+                files=files, changelogs=changelogs)
+
+
+class _ChecksumWriter(object):
+    """
+    File object wrapper computes the checksum and the size of data written.
+    """
+
+    def __init__(self, fobj):
+        self.fobj = fobj
+        self.hash = hashlib.new(_SUMTYPE)
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+
+        self.hash.update(data)
+        self.size += len(data)
+        self.fobj.write(data)
+
+
+def _a(s):
+    return quoteattr(s)
+
+
+def _t(s):
+    return escape(s)
+
+
+def _version_xml(p):
+    return u"<version epoch=%s ver=%s rel=%s/>" % \
+        (_a(p["epoch"]), _a(p["version"]), _a(p["release"]))
+
+
+def _file_xml(path, ftype):
+    """
+    >>> _file_xml(u"/etc/a", u"dir"), _file_xml(u"/a&b", u"")
+    (u'<file type="dir">/etc/a</file>', u'<file>/a&amp;b</file>')
+    """
+    return u"<file%s>%s</file>" % (u" type=%s" % _a(ftype) if ftype else u'',
+                                   _t(path))
+
+
+def _deps_xml(tag, deps):
+    """
+    >>> _deps_xml("provides", [(u"a", "EQ", u"0", u"1", u"2", False)])
+    ... # doctest: +NORMALIZE_WHITESPACE
+    u'<rpm:provides><rpm:entry name="a" flags="EQ" epoch="0" ver="1"
+      rel="2"/></rpm:provides>'
+    >>> _deps_xml("requires", [(u"/bin/sh", None, None, None, None, True)])
+    u'<rpm:requires><rpm:entry name="/bin/sh" pre="1"/></rpm:requires>'
+    """
+    if not deps:
+        return u"<rpm:%s/>" % tag
+
+    es = []
+    for name, flags, epoch, ver, rel, pre in deps:
+        attrs = u''.join(u" %s=%s" % (k, _a(v)) for k, v in
+                         (("name", name), ("flags", flags), ("epoch", epoch),
+                          ("ver", ver), ("rel", rel)) if v is not None)
+        es.append(u"<rpm:entry%s%s/>" % (attrs, u' pre="1"' if pre else u''))
+
+    return u"<rpm:%s>%s</rpm:%s>" % (tag, u''.join(es), tag)
+
+
+def _primary_files(p):
+    return [(f, t) for f, t in p["files"] if _PRIMARY_FILES_RE.match(f)]
+
+
+def primary_xml(p):
+    """
+    :param p: A dict of metadata of an RPM
+    :return: <package> element of the RPM in primary.xml
+    """
+    return u"""<package type="rpm">
+  <name>%s</name>
+  <arch>%s</arch>
+  %s
+  <checksum type="%s" pkgid="YES">%s</checksum>
+  <summary>%s</summary>
+  <description>%s</description>
+  <packager>%s</packager>
+  <url>%s</url>
+  <time file="%d" build="%d"/>
+  <size package="%d" installed="%d" archive="%d"/>
+  <location href=%s/>
+  <format>
+    <rpm:license>%s</rpm:license>
+    <rpm:vendor>%s</rpm:vendor>
+    <rpm:group>%s</rpm:group>
+    <rpm:buildhost>%s</rpm:buildhost>
+    <rpm:sourcerpm>%s</rpm:sourcerpm>
+    <rpm:header-range start="%d" end="%d"/>
+    %s
+    %s
+    %s
+    %s
+    %s
+  </format>
+</package>
+""" % (_t(p["name"]), _t(p["arch"]), _version_xml(p), _SUMTYPE, p["pkgid"],
+       _t(p["summary"]), _t(p["description"]), _t(p["packager"]),
+       _t(p["url"]), p["time_file"], p["time_build"], p["size_package"],
+       p["size_installed"], p["size_archive"], _a(p["location"]),
+       _t(p["license"]), _t(p["vendor"]), _t(p["group"]), _t(p["buildhost"]),
+       _t(p["sourcerpm"]), p["header_start"], p["header_end"],
+       _deps_xml("provides", p["provides"]),
+       _deps_xml("requires", p["requires"]),
+       _deps_xml("conflicts", p["conflicts"]),
+       _deps_xml("obsoletes", p["obsoletes"]),
+       u''.join(_file_xml(*f) for f in _primary_files(p)))
+
+
+def filelists_xml(p):
+    """
+    :param p: A dict of metadata of an RPM
+    :return: <package> element of the RPM in filelists.xml
+    """
+    return u"<package pkgid=%s name=%s arch=%s>\n  %s\n  %s\n</package>\n" % \
+        (_a(p["pkgid"]), _a(p["name"]), _a(p["arch"]), _version_xml(p),
+         u''.join(_file_xml(*f) for f in p["files"]))
+
+
+def other_xml(p):
+    """
+    :param p: A dict of metadata of an RPM
+    :return: <package> element of the RPM in other.xml
+    """
+    return u"<package pkgid=%s name=%s arch=%s>\n  %s\n%s</package>\n" % \
+        (_a(p["pkgid"]), _a(p["name"]), _a(p["arch"]), _version_xml(p),
+         u''.join(u"  <changelog author=%s date=\"%d\">%s</changelog>\n" %
+                  (_a(a), t, _t(x)) for a, t, x in p["changelogs"]))
+
+
+def render_xml(p):
+    """
+    :param p: A dict of metadata of an RPM
+    :return: A tuple of <package> elements of the RPM in primary, filelists
+        and other XML files encoded in UTF-8
+    """
+    return tuple(fn(p).encode("utf-8") for fn in (primary_xml, filelists_xml,
+                                                  other_xml))
+
+
+_XML_FILES = (("primary", u'<metadata xmlns="%s" xmlns:rpm="%s" '
+               u'packages="%%d">\n' % (_NS_COMMON, _NS_RPM), u"</metadata>\n"),
+              ("filelists", u'<filelists xmlns="%s" packages="%%d">\n' %
+               _NS_FILELISTS, u"</filelists>\n"),
+              ("other", u'<otherdata xmlns="%s" packages="%%d">\n' %
+               _NS_OTHER, u"</otherdata>\n"))
+
+
+def _db_rows(mdtype, packages):
+    """
+    :return: List of tuples of (table, list of rows) to insert into the
+        sqlite database of the type of metadata
+    """
+    if mdtype == "primary":
+        cols = ("pkgid", "name", "arch", "version", "epoch", "release",
+                "summary", "description", "url", "time_file", "time_build",
+                "license", "vendor", "group", "buildhost", "sourcerpm",
+                "header_start", "header_end", "packager", "size_package",
+                "size_installed", "size_archive", "location")
+        rows = [("packages", [(k, ) + tuple(p[c] for c in cols) +
+                              (None, _SUMTYPE) for k, p in packages])]
+        rows.append(("files", [(f, t or u"file", k) for k, p in packages
+                               for f, t in _primary_files(p)]))
+        rows.append(("requires", [d[:5] + (k, "TRUE" if d[5] else "FALSE")
+                                  for k, p in packages
+                                  for d in p["requires"]]))
+        for t in ("provides", "conflicts", "obsoletes"):
+            rows.append((t, [d[:5] + (k, ) for k, p in packages
+                             for d in p[t]]))
+        return rows
+
+    rows = [("packages", [(k, p["pkgid"]) for k, p in packages])]
+
+    if mdtype == "filelists":
+        fl = []
+        for k, p in packages:
+            dirs = dict()
+            for f, t in p["files"]:
+                (d, b) = os.path.split(f)
+                (names, types) = dirs.setdefault(d, ([], []))
+                names.append(b)
+                types.append({u"dir": u'd', u"ghost": u'g'}.get(t, u'f'))
+
+            fl += [(k, d, u'/'.join(ns), u''.join(ts)) for d, (ns, ts)
+                   in sorted(dirs.iteritems())]
+        rows.append(("filelist", fl))
+    else:
+        rows.append(("changelog", [(k, a, t, x) for k, p in packages
+                                   for a, t, x in p["changelogs"]]))
+    return rows
+
+
+_DB_SCHEMAS = dict(primary=_PRIMARY_DB_SCHEMA,
+                   filelists=_FILELISTS_DB_SCHEMA, other=_OTHER_DB_SCHEMA)
+
+
+class Index(object):
+    """
+    Index of RPMs in a dir. It's kept in the dir G._REPODATA_INDEX in the dir
+    together with the sqlite databases of metadata of the RPMs.
+
+    >>> import tempfile
+    >>> topdir = tempfile.mkdtemp()
+    >>> for f in ("a.rpm", "b.rpm"):
+    ...     open(os.path.join(topdir, f), 'w').write(f)
+    >>> read = lambda path, href: dict(location=href)
+    >>> render = lambda p: ()
+    >>> index = Index(topdir)
+    >>> index.update(read, render)
+    ([(1, {'location': 'a.rpm'}), (2, {'location': 'b.rpm'})], [])
+    >>> index.nread, index.nreused, index.loaded
+    (2, 0, False)
+    >>> os.remove(os.path.join(topdir, "b.rpm"))
+    >>> index.update(read, render)
+    ([], [2])
+    >>> shutil.rmtree(topdir)
+    """
+
+    def __init__(self, topdir):
+        """
+        :param topdir: Dir in which RPMs are
+        """
+        self.topdir = topdir
+        self.path = os.path.join(topdir, G._REPODATA_INDEX)
+        self.loaded = False
+
+        self.nread = 0
+        self.nreused = 0
+
+        # href -> ((size, mtime), pkgKey, elements in XML files)
+        self._packages = dict()
+        self._nextkey = 1
+
+        if not all(os.path.exists(self.dbpath(t)) for t in _DB_SCHEMAS):
+            return
+
+        try:
+            with open(os.path.join(self.path, "index"), 'rb') as f:
+                data = pickle.load(f)
+
+            if data.get("version") == _INDEX_VERSION:
+                (self._packages, self._nextkey) = (data["packages"],
+                                                   data["nextkey"])
+                self.loaded = True
+        except (IOError, EOFError, pickle.UnpicklingError) as e:
+            logging.debug("Could not load the index %s: %s" % (self.path, e))
+
+    def dbpath(self, mdtype, dbdir=None):
+        """
+        :param mdtype: Type of metadata, primary, filelists or other
+        :param dbdir: Dir in which databases are, or None (the index dir)
+
+        :return: The path of the sqlite database of the type of metadata
+        """
+        return os.path.join(dbdir or self.path, mdtype + ".sqlite")
+
+    def list_rpms(self):
+        """
+        :return: List of hrefs of RPMs in ``topdir``, not recursively
+        """
+        return sorted(f for f in os.listdir(self.topdir) if
+                      f.endswith(".rpm") and not f.startswith('.') and
+                      os.path.isfile(os.path.join(self.topdir, f)))
+
+    def update(self, read=read_package, render=None):
+        """
+        Update the index; read metadata of RPMs added or changed and remove
+        ones of RPMs removed.
+
+        :param read: Function to read metadata of an RPM, takes the path and
+            the href of it
+        :param render: Function to render elements of an RPM in XML files
+            from its metadata, or None (``render_xml``)
+
+        :return: A tuple of (list of tuples of (pkgKey, metadata) of RPMs
+            added, list of pkgKeys of RPMs removed)
+        """
+        (packages, added) = (dict(), [])
+        for href in self.list_rpms():
+            path = os.path.join(self.topdir, href)
+            st = os.stat(path)
+            key = (st.st_size, int(st.st_mtime))
+
+            entry = self._packages.pop(href, None)
+            if entry is not None and entry[0] == key:
+                self.nreused += 1
+            else:
+                if entry is not None:  # Changed.
+                    self._packages[href] = entry
+
+                logging.debug("Read the header: " + path)
+                p = read(path, href)
+                entry = (key, self._nextkey, (render or render_xml)(p))
+                added.append((self._nextkey, p))
+
+                self._nextkey += 1
+                self.nread += 1
+
+            packages[href] = entry
+
+        removed = sorted(e[1] for e in self._packages.values())
+        self._packages = packages
+
+        return (added, removed)
+
+    def fragments(self):
+        """
+        :return: List of tuples of <package> elements in primary, filelists
+            and other XML files of RPMs sorted by href
+        """
+        return [self._packages[href][2] for href in sorted(self._packages)]
+
+    def update_dbs(self, dbdir, added, removed):
+        """
+        Make up the sqlite databases updated in ``dbdir``.
+
+        :param dbdir: Dir to make up databases in
+        :param added: List of tuples of (pkgKey, metadata) of RPMs added
+        :param removed: List of pkgKeys of RPMs removed
+        """
+        for mdtype in _DB_SCHEMAS:
+            path = self.dbpath(mdtype, dbdir)
+            if self.loaded:
+                shutil.copy2(self.dbpath(mdtype), path)
+
+            conn = sqlite3.connect(path)
+            try:
+                if not self.loaded:
+                    conn.executescript(_DB_SCHEMAS[mdtype])
+
+                conn.executemany("DELETE FROM packages WHERE pkgKey = ?",
+                                 [(k, ) for k in removed])
+
+                for table, rows in _db_rows(mdtype, added):
+                    if rows:
+                        conn.executemany("INSERT INTO %s VALUES (%s)" %
+                                         (table, ", ".join('?' *
+                                                           len(rows[0]))),
+                                         rows)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def save(self, dbdir):
+        """
+        Save the index into ``dbdir`` in which updated databases are, and
+        replace the index dir with it.
+        """
+        with open(os.path.join(dbdir, "index"), 'wb') as f:
+            pickle.dump(dict(version=_INDEX_VERSION, packages=self._packages,
+                             nextkey=self._nextkey), f,
+                        pickle.HIGHEST_PROTOCOL)
+
+        old = "%s.%d.old" % (self.path, os.getpid())
+        if os.path.exists(self.path):
+            os.rename(self.path, old)
+
+        os.rename(dbdir, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _publish(tmp, repodir, mdtype, opensum, opensize, dbversion=None):
+    """
+    Rename the metadata file to the one its checksum is prefixed to.
+
+    :return: A dict of the entry of the file in repomd.xml
+    """
+    checksum = _checksum(tmp)
+    name = "%s-%s%s" % (checksum, mdtype.replace("_db", ''),
+                        ".sqlite.bz2" if dbversion else ".xml.gz")
+    path = os.path.join(repodir, name)
+    os.rename(tmp, path)
+
+    return dict(type=mdtype, checksum=checksum, opensum=opensum,
+                href="repodata/" + name, timestamp=int(os.stat(path).st_mtime),
+                size=os.stat(path).st_size, opensize=opensize,
+                dbversion=dbversion)
+
+
+def _repomd_xml(entries, revision):
+    """
+    :param entries: List of dicts of entries in repomd.xml
+    :param revision: Revision of the metadata
+    """
+    def data(e):
+        db = "  <database_version>%d</database_version>\n" % e["dbversion"] \
+            if e["dbversion"] else ''
+        return """<data type="%(type)s">
+  <checksum type="%(sumtype)s">%(checksum)s</checksum>
+  <open-checksum type="%(sumtype)s">%(opensum)s</open-checksum>
+  <location href="%(href)s"/>
+  <timestamp>%(timestamp)d</timestamp>
+  <size>%(size)d</size>
+  <open-size>%(opensize)d</open-size>
+""" % dict(e, sumtype=_SUMTYPE) + db + "</data>\n"
+
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="%s" xmlns:rpm="%s">
+  <revision>%d</revision>
+%s</repomd>
+""" % (_NS_REPO, _NS_RPM, revision, ''.join(data(e) for e in entries))
+
+
+def _compress_db(path, tmp, checksum):
+    """
+    Set the checksum of the XML file into the sqlite database and compress
+    it into ``tmp``.
+
+    :return: A tuple of (checksum, size) of the database
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("DELETE FROM db_info")
+        conn.execute("INSERT INTO db_info VALUES (?, ?)",
+                     (_DB_VERSION, checksum))
+        conn.commit()
+    finally:
+        conn.close()
+
+    with open(path, 'rb') as f:
+        out = _ChecksumWriter(bz2.BZ2File(tmp, 'wb'))
+        for data in iter(lambda: f.read(1024 * 1024), ''):
+            out.write(data)
+        out.fobj.close()
+
+    return (out.hash.hexdigest(), out.size)
+
+
+def write_repodata(fragments, outputdir, dbdir=None):
+    """
+    Write metadata of RPMs into repodata/ in ``outputdir``.
+
+    :param fragments: List of tuples of <package> elements of RPMs in XML
+        files (see ``render_xml``)
+    :param outputdir: Dir to write repodata/ in
+    :param dbdir: Dir in which the sqlite databases of metadata of the RPMs
+        are (see Index.update_dbs), or None not to write databases
+
+    :return: The path of repomd.xml written
+    """
+    repodir = os.path.join(outputdir, "repodata")
+    if not os.path.exists(repodir):
+        os.makedirs(repodir)
+
+    entries = []
+    for i, (mdtype, header, footer) in enumerate(_XML_FILES):
+        tmp = os.path.join(repodir, ".%s.xml.gz.tmp" % mdtype)
+
+        gz = gzip.GzipFile(tmp, 'wb', 6)
+        out = _ChecksumWriter(gz)
+        out.write(u'<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(header % len(fragments))
+        for fs in fragments:
+            out.write(fs[i])
+        out.write(footer)
+        gz.close()
+
+        entries.append(_publish(tmp, repodir, mdtype, out.hash.hexdigest(),
+                                out.size))
+
+    if dbdir is not None:
+        for e in entries[:3]:
+            tmp = os.path.join(repodir, ".%s.sqlite.bz2.tmp" % e["type"])
+            (opensum, opensize) = \
+                _compress_db(os.path.join(dbdir, e["type"] + ".sqlite"), tmp,
+                             e["checksum"])
+
+            entries.append(_publish(tmp, repodir, e["type"] + "_db", opensum,
+                                    opensize, _DB_VERSION))
+
+    repomd = os.path.join(repodir, "repomd.xml")
+    tmp = repomd + ".tmp"
+    open(tmp, 'w').write(_repomd_xml(entries, int(time.time())))
+    os.rename(tmp, repomd)
+
+    return repomd
+
+
+def generate(topdir, outputdir=None, database=True, read=read_package):
+    """
+    Generate or update repodata of RPMs in ``topdir``.
+
+    :param topdir: Dir in which RPMs are
+    :param outputdir: Dir to write repodata/ in, or None (``topdir``)
+    :param database: Write sqlite databases too if True
+    :param read: Function to read metadata of an RPM (see Index.update)
+
+    :return: Index instance
+    """
+    start = time.time()
+
+    index = Index(topdir)
+    (added, removed) = index.update(read)
+
+    dbdir = tempfile.mkdtemp(dir=topdir, prefix=G._REPODATA_INDEX + '.')
+    try:
+        index.update_dbs(dbdir, added, removed)
+        write_repodata(index.fragments(), outputdir or topdir,
+                       dbdir if database else None)
+        index.save(dbdir)
+    finally:
+        shutil.rmtree(dbdir, ignore_errors=True)
+
+    logging.info("Generated repodata of %d RPMs in %.2f sec, read the "
+                 "headers of %d RPMs: %s" % (index.nread + index.nreused,
+                                             time.time() - start, index.nread,
+                                             topdir))
+    return index
+
+
+def main(argv=sys.argv):
+    p = optparse.OptionParser("%prog [OPTION ...] DIR")
+    p.add_option("-o", "--outputdir",
+                 help="Dir to write repodata/ in [DIR]")
+    p.add_option("", "--no-database", action="store_false", dest="database",
+                 default=True, help="Do not write sqlite databases")
+    p.add_option("-v", "--verbose", action="store_true", default=False)
+
+    (options, args) = p.parse_args(argv[1:])
+    if len(args) != 1:
+        p.print_usage()
+        return 1
+
+    logging.basicConfig(format=G._LOG_FMT, datefmt=G._LOG_DFMT,
+                        level=logging.DEBUG if options.verbose else
+                        logging.INFO)
+
+    generate(args[0], options.outputdir, options.database)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et:
@@ -15,13 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import errno
 import multiprocessing
 import logging
 import os
 import os.path
+import re
 import signal
 import subprocess
-import sys
+import tempfile
+import time
 
 
 def is_local(fqdn_or_hostname):
@@ -70,74 +73,193 @@ def _killpg(pgid, sig=signal.SIGKILL):
     return os.killpg(pgid, sig)
 
 
-def _run(cmd, workdir, rc_expected=0, logfile=False, **kwargs):
-    """
-    subprocess.Popen wrapper to run command ``cmd``. It will be blocked.
+# Max and min interval in seconds to poll running jobs in the schedulers.
+_POLL_INTERVAL = 0.05
+_MIN_POLL_INTERVAL = 0.001
+
+
+# Functions called w/ the command string of each child process spawned, e.g.
+# to count SSH sessions (see myrepo.sshmux).
+_SPAWN_CALLBACKS = []
+
+
+def _spawned(cmd):
+    for f in _SPAWN_CALLBACKS:
+        f(cmd)
+
+
+_POPEN_NG_KEYS = ("cwd", "shell", "stdout", "stderr", "close_fds",
+                  "preexec_fn")
+
+
+class Job(object):
+    """
+    A command run with ``sh -c`` in a child process, which is spawned and
+    waited directly from this process (w/o any intermediate python processes).
+
+    It has some methods and attributes compatible with multiprocessing.Process
+    (start, is_alive, join, terminate, pid) to make it work w/ the functions
+    below like ``stop_async_run``.
+
+    >>> job = Job("true")
+    >>> job.start()
+    >>> job.join()
+    >>> job.is_alive(), job.returncode, job.successful()
+    (False, 0, True)
+    """
+
+    def __init__(self, cmd, workdir=os.curdir, rc_expected=0, logfile=False,
+                 **kwargs):
+        """
+        :param cmd: Command string
+        :param workdir: Working dir
+        :param rc_expected: Expected return code of the command run
+        :param logfile: Dump log file if True or log file path is specified or
+            logfile is callable which generate log filename.
+        :param kwargs: Extra keyword arguments for subprocess.Popen
+        """
+        self.cmd = cmd
+        self.cwd = workdir
+        self.rc_expected = rc_expected
+        self.logfile = logfile
+        self.kwargs = dict((k, v) for k, v in kwargs.iteritems() if k not in
+                           _POPEN_NG_KEYS)
+        self.pid = None
+        self.returncode = None
+        self.rusage = None  # resource usage of the child (see os.wait4).
+        self._lost = False  # Its exit status was lost (reaped elsewhere).
+        self._proc = None
+        self._tmplog = False
+
+    def _open_logfile(self):
+        """
+        :return: A file object to dump output of the command or None, that is,
+            output will go to stdout of this process.
+        """
+        if not self.logfile:
+            return None
+
+        if isinstance(self.logfile, bool):
+            # The log file will be renamed to "<pid>.log" after spawned.
+            (fd, self.logfile) = tempfile.mkstemp(".log", dir=self.cwd)
+            self._tmplog = True
+            return os.fdopen(fd, 'w')
+
+        if callable(self.logfile):
+            self.logfile = self.logfile()
+
+        return open(self.logfile, 'a')
+
+    def start(self):
+        """
+        Spawn a child process to run the command. The child will be a leader
+        of new process group to make it possible to stop whole of it later.
+        """
+        assert os.path.exists(self.cwd), \
+            "Working dir %s does not exist!" % self.cwd
+        assert os.path.isdir(self.cwd), \
+            "Working dir %s is not a dir!" % self.cwd
+
+        out = self._open_logfile()
+        try:
+            self._proc = subprocess.Popen(self.cmd, cwd=self.cwd, shell=True,
+                                          stdout=out,
+                                          stderr=subprocess.STDOUT,
+                                          close_fds=True,
+                                          preexec_fn=os.setsid,
+                                          **self.kwargs)
+            self.pid = self._proc.pid
+        finally:
+            if out is not None:
+                out.close()  # The child has its own copy of it.
+
+        _spawned(self.cmd)
+
+        if out is not None:
+            if self._tmplog:
+                logfile = os.path.join(self.cwd, "%d.log" % self.pid)
+                os.rename(self.logfile, logfile)
+                self.logfile = logfile
+
+            logging.debug("cmd=%s, logfile=%s" % (self.cmd[:100],
+                                                  self.logfile))
+
+    def _wait(self, flags=0):
+        """
+        :param flags: Flags passed to os.wait4, e.g. os.WNOHANG
+        :return: True if the child exited (was reaped) else False
+        """
+        if self.returncode is not None:
+            return True
+
+        try:
+            (pid, status, rusage) = os.wait4(self.pid, flags)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                return False
+
+            # ECHILD: It was already reaped somewhere and we do not know how
+            # it exited, so that it must not be regarded as successful.
+            logging.warn("Could not get the exit status of %d: %s" %
+                         (self.pid, self.cmd[:100]))
+            (pid, status, rusage) = (self.pid, None, None)
+            self._lost = True
+
+        if not pid:
+            return False
+
+        if status is None:
+            self.returncode = -1
+        elif os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
 
-    An exception subprocess.CalledProcessError will be raised if
-    the rc does not equal to the expected rc.
+        self.rusage = rusage
+        self._proc.returncode = self.returncode  # Avoid waiting it again.
 
-    :param cmd: Command string
-    :param workdir: Working dir
-    :param rc_expected: Expected return code of the command run
-    :param logfile: Dump log file if True or log file path is specified or
-        logfile is callable which generate log filename.
-    :param kwargs: Extra keyword arguments for subprocess.Popen
-    """
-    assert os.path.exists(workdir), "Working dir %s does not exist!" % workdir
-    assert os.path.isdir(workdir), "Working dir %s is not a dir!" % workdir
+        return True
 
-    ng_keys = ("cwd", "shell", "stdout", "stderr", "close_fds")
-    kwargs = dict(((k, v) for k, v in kwargs.iteritems() if k not in ng_keys))
+    def is_alive(self):
+        return self.pid is not None and not self._wait(os.WNOHANG)
 
-    rc = None
-    try:
-        proc = subprocess.Popen(cmd, cwd=workdir, shell=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                close_fds=True,
-                                **kwargs)
-
-        if logfile:
-            if isinstance(logfile, bool):
-                logfile = os.path.join(workdir, "%d.log" % proc.pid)
-            elif callable(logfile):
-                logfile = logfile()
-
-            logging.debug("cmd=%s, logfile=%s" % (cmd[:100], logfile))
-
-            flag = 'a' if os.path.exists(logfile) else 'w'
-            with open(logfile, flag) as f:
-                for line in iter(proc.stdout.readline, b''):
-                    f.write(line)
-        else:
-            for line in iter(proc.stdout.readline, b''):
-                sys.stdout.write(line)
+    def join(self, timeout=None, interval=_MIN_POLL_INTERVAL,
+             max_interval=_POLL_INTERVAL):
+        """
+        Wait for the completion of the child.
 
-        if proc.wait() == rc_expected:
+        :param timeout: Time to wait in seconds or None (wait forever)
+        :param interval: Initial interval in seconds to poll the child
+        :param max_interval: Max interval in seconds to poll the child
+        """
+        if timeout is None:
+            while not self._wait():
+                pass
             return
 
-        m = "Failed to run command: %s [%s]" % (cmd, workdir)
-        raise RuntimeError(m)
+        deadline = time.time() + timeout
+        while not self._wait(os.WNOHANG):
+            rest = deadline - time.time()
+            if rest <= 0:
+                return
 
-    except subprocess.CalledProcessError as e:
-        if rc and rc == rc_expected:
-            return  # Not an error.
+            time.sleep(min(interval, rest))
+            interval = min(interval * 2, max_interval)
 
-        raise RuntimeError(str(e))  # Raise ex again.
+    def terminate(self, sig=signal.SIGTERM):
+        """
+        Send signal ``sig`` to the process group of the child.
+        """
+        try:
+            os.killpg(self.pid, sig)
+        except OSError:  # ESRCH: No such process group any more.
+            pass
 
+    def kill(self):
+        self.terminate(signal.SIGKILL)
 
-def _spawn(cmd, workdir, rc_expected=0, logfile=True, **kwargs):
-    """
-    :param cmd: Command string
-    :param workdir: Working dir
-    :param rc_expected: Expected return code of the command run
-    :param logfile: Dump log file if True or its log file path
-    :param kwargs: Extra keyword arguments for subprocess.Popen
-    """
-    return multiprocessing.Process(target=_run,
-                                   args=(cmd, workdir, rc_expected, logfile),
-                                   kwargs=kwargs)
+    def successful(self):
+        return not self._lost and self.returncode == self.rc_expected
 
 
 # Connection timeout and Timeout to wait completion of runnign command in
@@ -147,7 +269,7 @@ _CONN_TO = 10
 
 
 def adjust_cmd(cmd, user=None, host="localhost", workdir=None,
-               conn_timeout=_CONN_TO):
+               conn_timeout=_CONN_TO, opts=None):
     """
     >>> adjust_cmd("true")
     ('true', '.')
@@ -175,11 +297,17 @@ def adjust_cmd(cmd, user=None, host="localhost", workdir=None,
     >>> workdir == os.curdir
     True
 
+    >>> (cmd, workdir) = adjust_cmd("true", host="repo.example.com",
+    ...                             conn_timeout=10, opts="-o Compression=yes")
+    >>> cmd
+    "ssh -o ConnectTimeout=10 -o Compression=yes repo.example.com 'true'"
+
     :param cmd: Command string
     :param user: Run command as this user
     :param host: Host on which command runs
     :param workdir: Working directory in which command runs
     :param conn_timeout: Connection timeout in seconds or None
+    :param opts: Extra ssh options string or None
 
     :return: A tuple of (command_string, workdir)
     """
@@ -196,6 +324,9 @@ def adjust_cmd(cmd, user=None, host="localhost", workdir=None,
         workdir = os.curdir
     else:
         top = "-o ConnectTimeout=%d" % conn_timeout if conn_timeout else ''
+        if opts:
+            top = (top + ' ' + opts).strip()
+
         h = host if user is None else "%s@%s" % (user, host)
         w = '' if workdir in (os.curdir, None) else "cd %s && " % workdir
 
@@ -248,19 +379,15 @@ def run_async(cmd, user=None, host="localhost", workdir=os.curdir,
     :param logfile: Dump log file if True or its log file path
     :param conn_timeout: Connection timeout in seconds or None
 
-    :return: multiprocessing.Process instance
+    :return: Job instance
     """
     _validate_timeout(conn_timeout)
     (cmd, workdir) = adjust_cmd(cmd, user, host, workdir, conn_timeout)
 
     logging.debug("Run: cmd=%s, cwd=%s" % (cmd[:100], workdir))
-    proc = _spawn(cmd, workdir, rc_expected, logfile, **kwargs)
+    proc = Job(cmd, workdir, rc_expected, logfile, **kwargs)
     proc.start()
 
-    # Hacks:
-    setattr(proc, "cmd", cmd)
-    setattr(proc, "cwd", workdir)
-
     return proc
 
 
@@ -269,7 +396,7 @@ def _force_stop_proc(proc, val0=True, val1=False):
     Force stopping the given process ``proc`` and return termination was
     success or not.
 
-    :param proc: An instance of multiprocessing.Process.
+    :param proc: An instance of Job
     :param val0: Return value if the process was successfully terminated.
     :param val1: Return value if the process was failed to be terminated
         and then killed.
@@ -290,7 +417,9 @@ def _force_stop_proc(proc, val0=True, val1=False):
     if not proc.is_alive():
         return val0
 
-    os.kill(proc.pid, signal.SIGKILL)
+    proc.kill()
+    proc.join()  # Reap it.
+
     return val1
 
 
@@ -298,30 +427,32 @@ def stop_async_run(proc, timeout=_RUN_TO, stop_on_error=False):
     """
     Stop the given process ``proc`` spawned from function ``run_async``.
 
-    :param proc: An instance of multiprocessing.Process
+    :param proc: An instance of Job
     :param timeout: Command execution timeout in seconds or None
     :param stop_on_error: Stop and raise exception if any error occurs
 
     :return: True if job was sucessful else False or RuntimeError exception
-        raised if stop_on_error is True
+        raised if stop_on_error is True. KeyboardInterrupt and SystemExit
+        are raised again after ``proc`` was stopped.
     """
     _validate_timeout(timeout)
-    assert isinstance(proc, multiprocessing.Process), \
+    assert isinstance(proc, Job), \
         "Invalid type of 'proc' parameter was given!"
 
     try:
         proc.join(timeout)
+    except (KeyboardInterrupt, SystemExit):
+        reason = _force_stop_proc(proc, "interrupted", "interrupt-and-killed")
+        logging.warn("Stopped (%s): %s" % (reason, proc.cmd))
+        raise
 
-        if proc.is_alive():
-            reason = _force_stop_proc(proc, "timeout", "timeout-and-killed")
-        else:
-            if proc.exitcode == 0:
-                return True  # Exit at once w/ successful status code.
-
-            reason = "other"
+    if proc.is_alive():
+        reason = _force_stop_proc(proc, "timeout", "timeout-and-killed")
+    else:
+        if proc.successful():
+            return True  # Exit at once w/ successful status code.
 
-    except (KeyboardInterrupt, SystemExit) as e:
-        reason = _force_stop_proc(proc, "interrupted", "interrupt-and-killed")
+        reason = "rc=%d" % proc.returncode
 
     m = "Failed (%s): %s" % (reason, proc.cmd)
 
@@ -379,81 +510,315 @@ def pmap(f, largs, nproc=_NPROC):
         multiprocessing.Pool.map.
     :param nproc: Number of process to run in the pool
 
-    :return: List of results of processes
+    :return: List of results of processes. Processes in the pool are always
+        stopped and reaped before it returns.
 
     >>> import operator
     >>> pmap(operator.abs, [0, -1, 2, -3, -4], 3)
     [0, 1, 2, 3, 4]
     """
     assert callable(f), "``f`` must be any callable object!"
-    return multiprocessing.Pool(processes=nproc).map(f, largs)
+    pool = multiprocessing.Pool(processes=nproc)
+    try:
+        return pool.map(f, largs)
+    except (KeyboardInterrupt, SystemExit):
+        pool.terminate()  # Do not wait for the rest.
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+def pstop_async_run(ps, timeout=_RUN_TO, stop_on_error=False,
+                    interval=_POLL_INTERVAL):
+    """
+    Stop the given processes ``ps`` spawned from function ``run_async`` or
+    ``prun_async``. The timeout is applied to all of them at once.
+
+    :param ps: List of Job instances previously started
+    :param timeout: Command execution timeout in seconds or None
+    :param stop_on_error: Stop and raise exception if any error occurs
+    :param interval: Interval in seconds to poll running jobs
+
+    :return: List of result codes
+
+    >>> pstop_async_run([run_async("true") for _ in range(4)], 2)
+    [True, True, True, True]
+    >>> pstop_async_run([run_async("sleep 10"), run_async("true")], 1)
+    [False, True]
+    """
+    _validate_timeout(timeout)
+    started = time.time()
+
+    try:
+        while any(p.is_alive() for p in ps):
+            if timeout is not None and time.time() - started >= timeout:
+                break
+
+            time.sleep(interval)
+    except (KeyboardInterrupt, SystemExit):
+        _stop_all(ps)
+        raise
+
+    return [stop_async_run(p, 0, stop_on_error) for p in ps]
+
+
+def _stop_all(ps):
+    """
+    Stop (kill the process groups of) all of the jobs ``ps``, e.g. on
+    interrupt; children lead their own sessions and do not get signals sent
+    from the terminal.
+
+    :param ps: List of Job instances
+    """
+    for p in ps:
+        _force_stop_proc(p, "interrupted", "interrupt-and-killed")
+
+
+def prun_async(cs, **kwargs):
+    """
+    :param cs: List of command strings
+    :return: List of Job instances
+    """
+    ps = []
+    try:
+        for c in cs:
+            ps.append(run_async(c, **kwargs))
+    except (KeyboardInterrupt, SystemExit):
+        _stop_all(ps)
+        raise
 
+    return ps
 
-def _stop_async_run(pts):
+
+# Kinds of commands (programs) to limit the number of concurrent jobs by.
+_CMD_KINDS = ("mock", "createrepo", "rpmbuild", "rsync", "scp", "tar")
+_CMD_KIND_OTHER = "other"
+
+
+def cmd_kind(cmd, kinds=_CMD_KINDS):
+    """
+    Find the kind of given command string ``cmd``, that is, the first program
+    of ``kinds`` appears at command position in it.
+
+    >>> cmd_kind("mock -r fedora-19-x86_64 a.src.rpm && createrepo .")
+    'mock'
+    >>> cmd_kind("cp -a /var/lib/mock/fedora-19-x86_64/result/*.rpm /tmp")
+    'other'
+    >>> cmd_kind("ssh  repo.example.com 'cd /tmp && createrepo --update .'")
+    'createrepo'
+    >>> cmd_kind("scp -p /a/b/*.rpm jdoe@repo.example.com:/c/d")
+    'scp'
+    >>> cmd_kind("/usr/bin/rsync -a /a/b /c/d")
+    'rsync'
+    >>> cmd_kind("true")
+    'other'
+
+    :param cmd: Command string
+    :param kinds: List of kinds of commands (program names)
+
+    :return: The kind of the command :: str
     """
-    Just an wrapper for ``stop_async_run`` to make it work w/
-    multiprocessing.Pool.map.
+    reg = r"(?:^|[;&|('\"])\s*(?:\S*/)?(%s)(?=\s|$)" % '|'.join(kinds)
+    m = re.search(reg, cmd)
+
+    return m.groups()[0] if m else _CMD_KIND_OTHER
 
-    :param pts: A tuple of (proc, **kwargs) where kwargs is keyword arguments
-        for ``stop_async_run``
-    :return: Same as ``stop_async_run``
 
-    >>> _stop_async_run((run_async("true"), dict(timeout=2, )))
+def _has_free_slot(kind, running, maxjobs=None, limits={}):
+    """
+    :param kind: The kind of the command to start
+    :param running: List of kinds of commands running
+    :param maxjobs: Max number of jobs run concurrently or None (unlimited)
+    :param limits: A dict of (kind, max number of jobs of the kind)
+
+    >>> _has_free_slot("mock", [], 1)
     True
-    >>> _stop_async_run((run_async("sleep 10"), dict(timeout=1, )))
+    >>> _has_free_slot("mock", ["other"], 1)
     False
+    >>> _has_free_slot("mock", ["mock", "other"], 4, dict(mock=1))
+    False
+    >>> _has_free_slot("scp", ["mock", "other"], 4, dict(mock=1))
+    True
     """
-    (proc, kwargs) = pts if len(pts) > 1 else (pts[0], {})
-    return stop_async_run(proc, **kwargs)
+    if maxjobs and len(running) >= maxjobs:
+        return False
+
+    limit = limits.get(kind, None)
+    if limit and len([k for k in running if k == kind]) >= limit:
+        return False
 
+    return True
 
-def pstop_async_run(ps, timeout=_RUN_TO, stop_on_error=False):
+
+def _validate_deps(deps, n):
     """
-    Stop the given processes ``ps`` spawned from function ``run_async`` or
-    ``prun_async``.
+    :param deps: List of lists of indices of commands each command depends on
+    :param n: Number of commands
 
-    :param ps: List of multiprocessing.Process instances previously started
-    :param timeout: Command execution timeout in seconds or None
-    :param stop_on_error: Stop and raise exception if any error occurs
+    >>> _validate_deps([[], [0], [0, 1]], 3)
+    >>> try:
+    ...     _validate_deps([[1], []], 2)
+    ... except AssertionError:
+    ...     pass
+    """
+    assert len(deps) == n, "Number of deps and commands do not match!"
+
+    for i, ds in enumerate(deps):
+        assert all(0 <= d < i for d in ds), \
+            "Commands must depend on the ones before: %d -> %s" % (i, ds)
 
-    :return: List of result codes
 
-    # TODO:
-    #>>> pstop_async_run([run_async("true") for _ in range(4)], 2)
-    #[True, True]
+def _dep_results(i, deps, results):
     """
-    kwargs = dict(timeout=timeout, stop_on_error=stop_on_error)
-    return pmap(_stop_async_run, ((p, kwargs) for p in ps))
+    :param i: Index of the command
+    :param deps: List of lists of indices of commands each command depends on
+        or None
+    :param results: List of results of commands, None if not finished yet
 
+    :return: True if all of the dependencies of the command succeeded, False
+        if any of them failed, or None if some of them are not finished yet.
 
-def prun_async(cs, **kwargs):
+    >>> _dep_results(2, [[], [], [0, 1]], [True, None, None])
+    >>> _dep_results(2, [[], [], [0, 1]], [True, False, None])
+    False
+    >>> _dep_results(2, [[], [], [0, 1]], [True, True, None])
+    True
+    >>> _dep_results(0, None, [None])
+    True
     """
+    rs = [results[d] for d in deps[i]] if deps else []
+
+    if False in rs:
+        return False
+
+    return None if None in rs else True
+
+
+def _prun_bounded(cs, kwargs1={}, kwargs2={}, maxjobs=None, limits={},
+                  interval=_POLL_INTERVAL, deps=None, kinds=None):
+    """
+    Run commands ``cs`` in parallel but the number of commands run at once is
+    limited by ``maxjobs`` and ``limits``, and the rest are queued and started
+    as slots free up. Commands which depend on others are started after all of
+    them succeeded, or skipped (failed) if any of them failed.
+
     :param cs: List of command strings
-    :return: List of multiprocessing.Process instances
+    :param kwargs1: Keyword arguments passed to run_async
+    :param kwargs2: Keyword arguments passed to stop_async_run
+    :param maxjobs: Max number of jobs run concurrently or None (unlimited)
+    :param limits: A dict of (kind, max number of jobs of the kind)
+    :param interval: Interval in seconds to poll running jobs
+    :param deps: List of lists of indices of commands each command depends
+        on, or None (no dependencies)
+    :param kinds: List of kinds of commands or None; the kind of each
+        command is found by ``cmd_kind`` if it's None
+
+    :return: List of result code of run commands in the same order as ``cs``
+
+    >>> _prun_bounded(["true", "false", "true"], maxjobs=1)
+    [True, False, True]
+    >>> _prun_bounded(["true", "false", "true"], deps=[[], [], [1]])
+    [True, False, False]
     """
-    return [run_async(c, **kwargs) for c in cs]
+    _validate_timeout(kwargs2.get("timeout", _RUN_TO))
+    timeout = kwargs2.get("timeout", _RUN_TO)
+    stop_on_error = kwargs2.get("stop_on_error", False)
+
+    if deps:
+        _validate_deps(deps, len(cs))
 
+    if kinds:
+        assert len(kinds) == len(cs), "Number of kinds and commands differ!"
+
+    pending = [(i, c, kinds and kinds[i] or cmd_kind(c)) for i, c
+               in enumerate(cs)]
+    running = []  # [(index, kind, proc, started)]
+    results = [None] * len(cs)
+    delay = _MIN_POLL_INTERVAL
+
+    try:
+        while pending or running:
+            for job in pending[:]:
+                (i, c, kind) = job
+                ready = _dep_results(i, deps, results)
 
-def prun(cs, kwargs1={}, kwargs2={}, safer=True):
+                if ready is False:
+                    pending.remove(job)
+                    results[i] = False
+                    logging.warn("Skipped as dependencies failed: " + c)
+                    continue
+
+                if ready is None:
+                    continue
+
+                if not _has_free_slot(kind, [r[1] for r in running], maxjobs,
+                                      limits):
+                    continue
+
+                pending.remove(job)
+                running.append((i, kind, run_async(c, **kwargs1),
+                                time.time()))
+
+            for job in running[:]:
+                (i, _kind, proc, started) = job
+                if proc.is_alive() and (timeout is None or
+                                        time.time() - started < timeout):
+                    continue
+
+                running.remove(job)
+                results[i] = stop_async_run(proc, 0, stop_on_error)
+                delay = _MIN_POLL_INTERVAL  # Some slots became free.
+
+            if running:
+                time.sleep(delay)
+                delay = min(delay * 2, interval)
+    except:
+        for job in running:
+            _force_stop_proc(job[2])
+        raise
+
+    return results
+
+
+def prun(cs, kwargs1={}, kwargs2={}, safer=True, maxjobs=None, limits={},
+         deps=None, kinds=None):
     """
     :param cs: List of command strings
     :param kwargs1: Keyword arguments passed to prun_async (run_async)
     :param kwargs2: Keyword arguments passed to stop_async_run
     :param safer: Do not use pstop_async_run if True (it would be slower but
         safer I guess).
-    :param logdir: Logging dir. Each process will dump log files with
-        dynamically generated filenames.
+    :param maxjobs: Max number of jobs run concurrently or None (unlimited)
+    :param limits: A dict of (kind, max number of jobs of the kind) to limit
+        the number of jobs of each kind (see ``cmd_kind``) run at once.
+    :param deps: List of lists of indices of commands each command depends
+        on, or None. Each command must depend on only the ones before it.
+    :param kinds: List of kinds of commands to override the ones found by
+        ``cmd_kind``, or None
 
     :return: List of result code of run commands
 
     >>> prun(["true" for _ in range(3)], safer=True)
     [True, True, True]
+    >>> prun(["true", "false", "true"], maxjobs=2, limits=dict(other=1))
+    [True, False, True]
+    >>> prun(["false", "true"], deps=[[], [0]])
+    [False, False]
     """
-    if safer:
-        return [stop_async_run(p, **kwargs2) for p in
-                prun_async(cs, **kwargs1)]
-    else:
-        return pstop_async_run(prun_async(cs, **kwargs1), **kwargs2)
+    if maxjobs or limits or deps or kinds:
+        return _prun_bounded(cs, kwargs1, kwargs2, maxjobs, limits,
+                             deps=deps, kinds=kinds)
+
+    ps = prun_async(cs, **kwargs1)
+    if not safer:
+        return pstop_async_run(ps, **kwargs2)
+
+    try:
+        return [stop_async_run(p, **kwargs2) for p in ps]
+    except (KeyboardInterrupt, SystemExit):
+        _stop_all(ps)
+        raise
 
 
 # vim:sw=4:ts=4:et:
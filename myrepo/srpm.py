@@ -15,13 +15,33 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import rpmkit.rpmutils as RU
+import myrepo.headercache as MHC
+
+
+def _dep_names(deps):
+    """
+    :param deps: List of dependencies (names) in rpm header
+    :return: List of package names w/o rpmlib and file dependencies
+
+    >>> _dep_names(["rpmlib(CompressedFileNames)", "/bin/sh", "foo-devel",
+    ...             "foo-devel", "python"])
+    ['foo-devel', 'python']
+    """
+    ret = []
+    for d in deps:
+        if d.startswith("rpmlib(") or d.startswith('/') or d in ret:
+            continue
+
+        ret.append(d)
+
+    return ret
 
 
 class Srpm(object):
 
     def __init__(self, path, name=None, version=None, release=None,
-                 noarch=None, is_srpm=None, resolved=False):
+                 noarch=None, is_srpm=None, resolved=False, buildrequires=[],
+                 provides=[]):
         self.path = path
 
         self.name = name
@@ -32,22 +52,122 @@ class Srpm(object):
         self.is_srpm = is_srpm
         self.resolved = resolved
 
-    def resolve(self):
+        self.buildrequires = list(buildrequires)
+        self.provides = list(provides)
+
+    def __repr__(self):
+        return "Srpm(%s)" % (self.path if self.name is None else self.name)
+
+    def resolve(self, cache=None):
+        """
+        Resolve the name, the version and so on of the SRPM from its header.
+
+        :param cache: myrepo.headercache.HeaderCache instance to get the
+            header through, or None to use the shared one
+        """
         if self.resolved:
             return  # Nothing to do.
 
+        if cache is None:
+            cache = MHC.shared()
+
         try:
-            h = RU.rpm_header_from_rpmfile(self.path)
+            self.resolve_by_header(cache.get(self.path))
+        except:
+            raise RuntimeError("Failed to get rpm header from: " + self.path)
 
-            self.is_srpm = bool(h["sourcepackage"])
-            self.noarch = h["arch"] == "noarch"
+    def resolve_by_header(self, h):
+        """
+        :param h: Header of the SRPM, an entry of the header cache
+        """
+        self.is_srpm = h["is_srpm"]
+        self.noarch = h["arch"] == "noarch"
 
-            for k in ("name", "version", "release"):
-                setattr(self, k, h[k])
+        for k in ("name", "version", "release"):
+            setattr(self, k, h[k])
 
-            self.resolved = True
-        except:
-            raise RuntimeError("Failed to get rpm header from: " + self.path)
+        # Requires in the header of SRPM are BuildRequires.
+        self.buildrequires = _dep_names(h["requires"])
+        self.provides = _dep_names(h["provides"])
+
+        self.resolved = True
+
+
+def _find_providers(dep, srpms):
+    """
+    Find SRPMs provide the package ``dep`` on build. Binary packages built
+    from each SRPM are not known until it's built, so it's approximated:
+    SRPMs named or provide ``dep`` exactly, or SRPM has the longest name
+    ``dep`` starts with, e.g. 'foo' for 'foo-devel', are the ones.
+
+    >>> foo = Srpm("foo.src.rpm", "foo"); foox = Srpm("foox.src.rpm", "foox")
+    >>> foo_bar = Srpm("foo-bar.src.rpm", "foo-bar", provides=["libbar"])
+    >>> srpms = [foo, foox, foo_bar]
+    >>> _find_providers("foo", srpms)
+    [Srpm(foo)]
+    >>> _find_providers("foo-bar-devel", srpms)
+    [Srpm(foo-bar)]
+    >>> _find_providers("libbar", srpms)
+    [Srpm(foo-bar)]
+    >>> _find_providers("baz", srpms)
+    []
+
+    :param dep: Package name
+    :param srpms: List of resolved Srpm instances
+    """
+    ret = [s for s in srpms if s.name == dep or dep in s.provides]
+    if ret:
+        return ret
+
+    ss = [s for s in srpms if dep.startswith(s.name + '-')]
+    if not ss:
+        return []
+
+    longest = max(len(s.name) for s in ss)
+    return [s for s in ss if len(s.name) == longest]
+
+
+def toposort_layers(srpms):
+    """
+    Sort SRPMs topologically by build time dependencies among them, and group
+    them into layers; SRPMs in each layer only depend on ones in the previous
+    layers and can be built in parallel.
+
+    >>> a = Srpm("a.src.rpm", "a")
+    >>> b = Srpm("b.src.rpm", "b", buildrequires=["a-devel"])
+    >>> c = Srpm("c.src.rpm", "c", buildrequires=["gcc"])
+    >>> d = Srpm("d.src.rpm", "d", buildrequires=["b", "a"])
+    >>> toposort_layers([d, c, b, a])
+    [[Srpm(c), Srpm(a)], [Srpm(b)], [Srpm(d)]]
+
+    >>> a.buildrequires = ["d"]
+    >>> try:
+    ...     toposort_layers([d, c, b, a])
+    ... except ValueError:
+    ...     pass
+
+    :param srpms: List of resolved Srpm instances
+    :return: List of lists of Srpm instances
+    """
+    deps = dict((id(s), set(id(p) for br in s.buildrequires for p
+                            in _find_providers(br, srpms) if p is not s))
+                for s in srpms)
+
+    layers = []
+    done = set()
+    rest = list(srpms)
+
+    while rest:
+        layer = [s for s in rest if deps[id(s)] <= done]
+        if not layer:
+            raise ValueError("Circular build dependencies found among: " +
+                             ", ".join(s.name for s in rest))
+
+        layers.append(layer)
+        done.update(id(s) for s in layer)
+        rest = [s for s in rest if id(s) not in done]
+
+    return layers
 
 
 # vim:sw=4:ts=4:et:
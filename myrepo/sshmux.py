@@ -0,0 +1,241 @@
+#
+# SSH connection multiplexing (ControlMaster) to share a connection to each
+# remote server among commands run.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.globals as G
+import myrepo.shell as MS
+
+import atexit
+import logging
+import os.path
+import os
+import re
+import stat
+
+
+# SSH options of sessions share the connection in command strings.
+_SESSION_RE = re.compile(r"-o ControlMaster=auto -o ControlPath=(\S+)")
+
+# Control socket path -> Mux
+_BY_PATH = dict()
+
+
+def _count_sessions(cmd):
+    """
+    Count up sessions of the connections shared in the command spawned.
+
+    :param cmd: Command string
+    """
+    for path in _SESSION_RE.findall(cmd):
+        mux = _BY_PATH.get(path, None)
+        if mux is not None:
+            mux.spawned()
+
+
+MS._SPAWN_CALLBACKS.append(_count_sessions)
+
+
+def _is_safe_dir(path):
+    """
+    :return: True if ``path`` is a dir (not a symlink) owned by the user and
+        only the user can access, so others cannot hijack control sockets
+
+    >>> import tempfile
+    >>> d = tempfile.mkdtemp()  # Mode is 0700.
+    >>> _is_safe_dir(d)
+    True
+    >>> os.chmod(d, 0777); _is_safe_dir(d)
+    False
+    >>> os.rmdir(d)
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and \
+        not st.st_mode & 077
+
+
+class Mux(object):
+    """
+    A multiplexed SSH connection to a host, that is, a master connection
+    listening on the control socket and shared by ssh and scp sessions.
+
+    >>> import tempfile
+    >>> d = tempfile.mkdtemp()
+    >>> mux = Mux("repo.example.com", "jdoe", controldir=d)
+    >>> mux.target, mux.path == os.path.join(d, "jdoe@repo.example.com")
+    ('jdoe@repo.example.com', True)
+    >>> mux.options() == "-o ControlMaster=auto -o ControlPath=%s " \\
+    ...                  "-o ControlPersist=600" % mux.path
+    True
+    >>> mux.sessions, mux.handshakes, mux.handshakes_avoided
+    (0, 0, 0)
+    >>> os.rmdir(d)
+    """
+
+    def __init__(self, host, user=None, timeout=G._CONN_TIMEOUT,
+                 controldir=G._SSH_CONTROL_DIR,
+                 persist=G._SSH_CONTROL_PERSIST):
+        """
+        :param host: FQDN or hostname of the remote server
+        :param user: User name on the server or None
+        :param timeout: SSH connection timeout in seconds
+        :param controldir: Dir to put control sockets in
+        :param persist: Time in seconds the master connection stays after
+            the last session closed, to clean it up even if myrepo could
+            not close it.
+        """
+        self.host = host
+        self.user = user
+        self.timeout = timeout
+        self.target = host if user is None else "%s@%s" % (user, host)
+        self.path = os.path.join(controldir, self.target)
+        self.persist = persist
+
+        self.sessions = 0  # Number of sessions shared this connection.
+        self.handshakes = 0  # Number of connections made to the host.
+        self._session_handshakes = 0  # Sessions made connections by itself.
+        self._safe = None  # The control dir is safe to use or not.
+
+        _BY_PATH[self.path] = self
+
+    def __repr__(self):
+        return "Mux(%s)" % self.target
+
+    @property
+    def handshakes_avoided(self):
+        return self.sessions - self._session_handshakes
+
+    def spawned(self):
+        """
+        Count up a session spawned. It makes a connection to the host by
+        itself, and may become the master, if the master connection is not
+        open yet.
+        """
+        self.sessions += 1
+        if not os.path.exists(self.path):
+            self.handshakes += 1
+            self._session_handshakes += 1
+
+    def is_safe(self):
+        """
+        Make the dir to put the control socket in if it does not exist, and
+        check if it's safe to use.
+
+        :return: True if it's safe to use
+        """
+        if self._safe is None:
+            controldir = os.path.dirname(self.path)
+            if not os.path.exists(controldir):
+                os.makedirs(controldir, 0700)
+
+            self._safe = _is_safe_dir(controldir)
+            if not self._safe:
+                logging.warn("Do not share SSH connections to %s as the dir "
+                             "%s is not owned by the user or others can "
+                             "access it" % (self.target, controldir))
+
+        return self._safe
+
+    def options(self):
+        """
+        SSH options to make ssh and scp sessions share this connection.
+        Sessions are counted when they're spawned.
+
+        :return: Options string or None if the control dir is not safe
+        """
+        if not self.is_safe():
+            return None
+
+        return "-o ControlMaster=auto -o ControlPath=%s " \
+               "-o ControlPersist=%d" % (self.path, self.persist)
+
+    def _ctl_cmd(self, ctl):
+        return "ssh -o ControlPath=%s -O %s %s" % (self.path, ctl,
+                                                   self.target)
+
+    def is_open(self):
+        return os.path.exists(self.path) and \
+            MS.run(self._ctl_cmd("check") + " 2>/dev/null",
+                   timeout=self.timeout)
+
+    def open(self):
+        """
+        Open the master connection if it's not open yet.
+
+        :return: True if the connection is ready
+        """
+        if not self.is_safe():
+            return False
+
+        if self.is_open():
+            return True
+
+        c = "ssh -o ConnectTimeout=%d -o ControlMaster=yes " \
+            "-o ControlPath=%s -o ControlPersist=%d -fN %s" % \
+            (self.timeout, self.path, self.persist, self.target)
+
+        logging.info("Open SSH master connection to " + self.target)
+        if not MS.run(c, timeout=self.timeout * 2):
+            logging.warn("Could not open SSH master connection to " +
+                         self.target)
+            return False
+
+        self.handshakes += 1
+        atexit.register(self.close)
+
+        return True
+
+    def close(self):
+        """
+        Stop the master connection accepting new sessions if it's open, and
+        report stats. Sessions of other processes sharing it, e.g. 'update
+        --pending' run in background, are not killed, and it exits after the
+        last session closed (and ControlPersist seconds passed).
+        """
+        if not self.is_open():
+            return
+
+        logging.info("Close SSH master connection to %s: sessions=%d, "
+                     "handshakes avoided=%d" % (self.target, self.sessions,
+                                                self.handshakes_avoided))
+        MS.run(self._ctl_cmd("stop") + " 2>/dev/null", timeout=self.timeout)
+
+
+_MUXES = dict()
+
+
+def get_mux(host, user=None, timeout=G._CONN_TIMEOUT):
+    """
+    Get the multiplexed connection to the host shared in this process.
+
+    >>> get_mux("repo.example.com", "jdoe") is get_mux("repo.example.com",
+    ...                                                "jdoe")
+    True
+    """
+    key = (host, user)
+    if key not in _MUXES:
+        _MUXES[key] = Mux(host, user, timeout)
+
+    return _MUXES[key]
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,124 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.buildcache as TT
+import myrepo.shell as MS
+import myrepo.tests.common as C
+
+import os.path
+import os
+import time
+import unittest
+
+
+_LABEL = "fedora-19-x86_64"
+
+
+class Test_10_BuildCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.topdir = os.path.join(self.workdir, "cache")
+        self.rpmdir = os.path.join(self.workdir, "result")
+        self.srpm = os.path.join(self.workdir, "a-0.1-1.src.rpm")
+
+        os.makedirs(self.rpmdir)
+        for f in (self.srpm, os.path.join(self.workdir, _LABEL + ".cfg")):
+            open(f, 'w').write("dummy content of " + f)
+
+        for rpm in ("a-0.1-1.src.rpm", "a-0.1-1.x86_64.rpm"):
+            open(os.path.join(self.rpmdir, rpm), 'w').write("0" * 1024)
+
+        self.cache = TT.BuildCache(self.topdir, mockcfgdir=self.workdir)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def store(self, srpm=None, label=_LABEL):
+        srpm = self.srpm if srpm is None else srpm
+        c = self.cache.store_cmd(srpm, label, self.rpmdir)
+        self.assertTrue(MS.run(c, workdir=self.workdir))
+
+    def test_10_key(self):
+        k = self.cache.key(self.srpm, _LABEL)
+
+        self.assertEquals(k, TT.BuildCache(self.topdir,
+                                           mockcfgdir=self.workdir).key(
+                                               self.srpm, _LABEL))
+        self.assertNotEquals(k, self.cache.key(self.srpm, "fedora-19-i386"))
+
+        # The key depends on the content of the mock.cfg.
+        open(os.path.join(self.workdir, _LABEL + ".cfg"), 'a').write("\n")
+        self.assertNotEquals(k, TT.BuildCache(self.topdir,
+                                              mockcfgdir=self.workdir).key(
+                                                  self.srpm, _LABEL))
+
+    def test_12_key__depends_on_cfgs_included(self):
+        def key():
+            return TT.BuildCache(self.topdir, mockcfgdir=self.workdir).key(
+                self.srpm, _LABEL)
+
+        open(os.path.join(self.workdir, _LABEL + ".cfg"), 'a').write(
+            "\ninclude('templates/fedora.tpl')\n")
+        os.makedirs(os.path.join(self.workdir, "templates"))
+        keys = [key()]
+
+        for f in ("site-defaults.cfg", "templates/fedora.tpl"):
+            open(os.path.join(self.workdir, f), 'w').write("# changed")
+            keys.append(key())
+
+        self.assertEquals(len(set(keys)), 3)
+
+    def test_20_lookup__miss_and_hit(self):
+        self.assertTrue(self.cache.lookup(self.srpm, _LABEL) is None)
+        self.store()
+
+        path = self.cache.lookup(self.srpm, _LABEL)
+        self.assertEquals(path, self.cache.path(self.srpm, _LABEL))
+        self.assertTrue(os.path.exists(os.path.join(path,
+                                                    "a-0.1-1.x86_64.rpm")))
+        self.assertEquals((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_22_store_cmd__twice(self):
+        self.store()
+        self.store()
+
+        self.assertEquals(os.listdir(self.topdir),
+                          [self.cache.key(self.srpm, _LABEL)])
+
+    def test_30_evict__lru(self):
+        srpm2 = os.path.join(self.workdir, "b-0.1-1.src.rpm")
+        open(srpm2, 'w').write("dummy")
+
+        self.store()
+        self.store(srpm2)
+
+        # Make the entry of srpm2 older than the other.
+        stamp = os.path.join(self.cache.path(srpm2, _LABEL), TT._STAMP)
+        t = time.time() - 3600
+        os.utime(stamp, (t, t))
+
+        self.cache.maxsize = 3 * 1024
+        self.assertEquals(self.cache.evict(), 1)
+        self.assertTrue(self.cache.lookup(srpm2, _LABEL) is None)
+        self.assertFalse(self.cache.lookup(self.srpm, _LABEL) is None)
+
+        self.cache.maxsize = 10 * 1024
+        self.assertEquals(self.cache.evict(), 0)
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.buildfarm as TT
+import myrepo.commands.build as MCB
+import myrepo.repo as MR
+import myrepo.shell as MS
+import myrepo.srpm as MSR
+import myrepo.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_Worker(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.workers = [TT.Worker("localhost", archs=["x86_64"], slots=2,
+                                  topdir=os.path.join(self.workdir, "w0")),
+                        TT.Worker("localhost", archs=["x86_64", "i386"],
+                                  topdir=os.path.join(self.workdir, "w1"))]
+
+        self.srpm = MSR.Srpm(os.path.join(self.workdir, "foo-0.1-1.src.rpm"),
+                             "foo", noarch=False)
+        open(self.srpm.path, 'w').write("dummy")
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_ship_cmd__only_if_worker_lacks_it_or_changed(self):
+        w = self.workers[0]
+        c = w.ship_cmd(self.srpm)
+
+        self.assertTrue(MS.run(c, workdir=self.workdir))
+        self.assertEquals(open(w.srpm_path(self.srpm)).read(), "dummy")
+
+        # It's not shipped again if not changed.
+        mtime = os.path.getmtime(w.srpm_path(self.srpm))
+        self.assertEquals(w.ship_cmd(self.srpm), c)
+        self.assertTrue(MS.run(c, workdir=self.workdir))
+        self.assertEquals(os.path.getmtime(w.srpm_path(self.srpm)), mtime)
+
+        # SRPM rebuilt w/ the same NVR is shipped again.
+        open(self.srpm.path, 'w').write("changed")
+        self.assertTrue(MS.run(w.ship_cmd(self.srpm), workdir=self.workdir))
+        self.assertEquals(open(w.srpm_path(self.srpm)).read(), "changed")
+
+    def test_20_fetch_cmd(self):
+        (w, d) = (self.workers[1], MR.Dist("fedora-19", "i386"))
+        rpmdir = w.rpmdir(d, self.srpm)
+        dst = os.path.join(self.workdir, "result")
+
+        os.makedirs(rpmdir)
+        for rpm in ("foo-0.1-1.src.rpm", "foo-0.1-1.i386.rpm"):
+            open(os.path.join(rpmdir, rpm), 'w').write(rpm)
+
+        self.assertTrue(MS.run(w.fetch_cmd(d, self.srpm, dst),
+                               workdir=self.workdir))
+        self.assertEquals(sorted(os.listdir(dst)),
+                          ["foo-0.1-1.i386.rpm", "foo-0.1-1.src.rpm"])
+
+    def test_30_BuildFarm_assign(self):
+        farm = TT.BuildFarm(self.workers)
+        (d0, d1) = (MR.Dist("fedora-19", "x86_64"),
+                    MR.Dist("fedora-19", "i386"))
+
+        # w0 has two slots, and only w1 can build for i386.
+        ws = [farm.assign(d) for d in (d0, d0, d0, d1)]
+        self.assertEquals([self.workers.index(w) for w in ws], [0, 1, 0, 1])
+
+        farm = TT.BuildFarm(self.workers[:1])
+        self.assertRaises(RuntimeError, farm.assign, d1)
+
+    def test_40_build_mk_steps_0__w_farm(self):
+        farm = TT.BuildFarm(self.workers)
+        repo = MR.Repo("fedora", 19, ["x86_64", "i386"],
+                       MR.Server("localhost"))
+
+        steps = MCB.mk_steps_0(repo, self.srpm, farm=farm)
+        (w0, w1) = self.workers
+
+        self.assertEquals([s.kind for s in steps], [w0.kind, w1.kind])
+        self.assertTrue(w0.rpmdir(repo.dists[0], self.srpm) in steps[0].cmd)
+        self.assertTrue(repo.dists[0].rpmdir(self.srpm) in steps[0].cmd)
+
+        # The SRPM is shipped once to each worker.
+        ships = [s.deps[0] for s in steps]
+        self.assertEquals([s.cmd for s in ships],
+                          [w.ship_cmd(self.srpm) for w in (w0, w1)])
+        self.assertTrue(farm.ship_step(w0, self.srpm) is ships[0])
+
+
+# vim:sw=4:ts=4:et:
@@ -48,6 +48,43 @@ class Test_00_functions(unittest.TestCase):
         for r, e in itertools.izip_longest(repos, expected):
             self.assertEquals(r, e, C.diff(f(r), f(e)))
 
+    def test_12_mk_repos__dists_not_sorted(self):
+        ctx = MC._init_by_preset_defaults()
+        ctx["dists"] = "fedora-19-x86_64,rhel-6-x86_64,fedora-19-i386"
+
+        repos = list(TT.mk_repos(ctx))
+
+        self.assertEquals([(r.name, r.version, r.archs) for r in repos],
+                          [("fedora", "19", ["x86_64", "i386"]),
+                           ("rhel", "6", ["x86_64"])])
+
+
+class Test_10_effectful_functions(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_expand_srpm_paths(self):
+        srpms = [os.path.join(self.workdir, "%s-1.0-1.src.rpm" % n) for n
+                 in ("bar", "foo", "baz")]
+        for srpm in srpms:
+            open(srpm, 'w').write('')
+
+        listfile = os.path.join(self.workdir, "srpms.txt")
+        open(listfile, 'w').write("# comment\n\n%s\n" % srpms[2])
+
+        paths = TT.expand_srpm_paths([srpms[1],
+                                      os.path.join(self.workdir, "ba*.rpm"),
+                                      '@' + listfile])
+        self.assertEquals(paths, [srpms[1], srpms[0], srpms[2]])
+
+        self.assertEquals(TT.resolve_srpms([os.path.join(self.workdir,
+                                                         "not_exist")]),
+                          None)
+
 
 _CONF_0 = """[DEFAULT]
 hostname: localhost
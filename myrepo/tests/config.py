@@ -106,4 +106,23 @@ class Test_10(unittest.TestCase):
         p = TT.opt_parser(self.conf)
         self.assertTrue(isinstance(p, TT.optparse.OptionParser))
 
+    def test_40_opt_parser__joblimits(self):
+        p = TT.opt_parser()
+        (options, _args) = p.parse_args(["--joblimit", "mock:2,scp:4"])
+        self.assertTrue("mock:2,scp:4" in options.joblimits)
+
+        for limit in ("mock:x", "mock"):
+            with self.assertRaises(SystemExit):
+                TT.opt_parser().parse_args(["--joblimit", limit])
+
+    def test_42_opt_parser__workers(self):
+        p = TT.opt_parser()
+        (options, _args) = p.parse_args(["--worker", "bld-1:x86_64:2",
+                                         "--worker", "bld-2"])
+        self.assertEquals(options.workers, ["bld-1:x86_64:2", "bld-2"])
+
+        for worker in ("bld-1:x86_64:x", "bld-1:x86_64:0", ":x86_64"):
+            with self.assertRaises(SystemExit):
+                TT.opt_parser().parse_args(["--worker", worker])
+
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,99 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.eventloop as TT
+import myrepo.tests.common as C
+
+import os.path
+import os
+import time
+import unittest
+
+
+class Test_10_Loop(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.logfile = os.path.join(self.workdir, "%d.log" % os.getpid())
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run__logfile(self):
+        self.assertTrue(TT.run("echo OK && echo -n NG", workdir=self.workdir,
+                               logfile=self.logfile))
+        self.assertEquals(open(self.logfile).read(), "OK\nNG\n")
+
+    def test_12_run__logfile_named_by_pid(self):
+        loop = TT.Loop()
+        task = loop.add(TT.Task("echo OK", self.workdir, logfile=True))
+
+        self.assertEquals(loop.run(), [True])
+        self.assertEquals(task.logfile,
+                          os.path.join(self.workdir, "%d.log" % task.pid))
+
+    def test_20_run__timeout_kills_process_group(self):
+        mark = os.path.join(self.workdir, "mark")
+        loop = TT.Loop()
+        task = loop.add(TT.Task("(sleep 2 && touch %s) & wait" % mark,
+                                timeout=1))
+
+        self.assertEquals(loop.run(), [False])
+        self.assertEquals(task.reason, "timeout")
+
+        time.sleep(2)
+        self.assertFalse(os.path.exists(mark))
+
+    def test_22_run__exited_but_output_held_by_descendant(self):
+        # The daemonized descendant keeps the output pipe open.
+        started = time.time()
+        self.assertTrue(TT.run("(sleep 5 &) ; true"))
+        self.assertTrue(time.time() - started < 5)
+
+    def test_24_run__output_closed_but_not_exited(self):
+        # Other tasks must not be blocked, and timeout must be still
+        # enforced after the output was closed.
+        started = time.time()
+        cs = ["exec sleep 6 >/dev/null 2>&1", "true"]
+
+        self.assertEquals(TT.prun(cs, kwargs2=dict(timeout=1)),
+                          [False, True])
+        self.assertTrue(time.time() - started < 4)
+
+    def test_30_run__stop_on_error_cancels_the_rest(self):
+        loop = TT.Loop(maxjobs=2, stop_on_error=True)
+        ts = [loop.add(TT.Task(c)) for c in ("sleep 10", "false", "true")]
+
+        self.assertRaises(RuntimeError, loop.run)
+        self.assertEquals([t.result for t in ts], [False, False, False])
+        self.assertEquals([t.reason for t in ts],
+                          ["cancelled", "rc=1", "cancelled"])
+
+    def test_40_prun__many_commands_at_once(self):
+        n = 200
+        started = time.time()
+
+        self.assertEquals(TT.prun(["sleep 1" for _ in range(n)]), [True] * n)
+        self.assertTrue(time.time() - started < 10)
+
+    def test_42_prun__bounded_w_timeout(self):
+        cs = ["sleep 10", "true"]
+        self.assertEquals(TT.prun(cs, kwargs2=dict(timeout=1), maxjobs=1),
+                          [False, True])
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.headercache as TT
+import myrepo.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+def read_entry(path):
+    """
+    Fake of myrepo.headercache.read_entry makes up the entry from the name.
+    """
+    (name, ver, rel_arch) = os.path.basename(path)[:-len(".rpm")].rsplit('-',
+                                                                         2)
+    (rel, arch) = rel_arch.split('.', 1)
+
+    return dict(name=name, epoch='0', version=ver, release=rel, arch=arch,
+                sourcerpm='', is_srpm=arch == "src", provides=[name],
+                requires=["%s-devel" % name, "/bin/sh"], checksum=name)
+
+
+class Test_10_HeaderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.rpm = os.path.join(self.workdir, "a-0.1-1.src.rpm")
+        open(self.rpm, 'w').write("a")
+
+        self.dbpath = os.path.join(self.workdir, "cache", "headers.sqlite")
+        self.cache = TT.HeaderCache(self.dbpath, read_entry)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_get(self):
+        entry = self.cache.get(self.rpm)
+        self.assertEquals(entry, read_entry(self.rpm))
+        self.assertEquals((self.cache.hits, self.cache.misses), (0, 1))
+
+        # Another instance, e.g. in the next run, finds it.
+        cache = TT.HeaderCache(self.dbpath, None)
+        self.assertEquals(cache.get(self.rpm), entry)
+        self.assertEquals(cache.lookup(os.path.relpath(self.rpm)), entry)
+        self.assertEquals((cache.hits, cache.misses), (2, 0))
+        self.assertEquals(cache.hit_rate(), 100.0)
+
+    def test_20_lookup__changed(self):
+        self.cache.get(self.rpm)
+
+        open(self.rpm, 'w').write("ab")
+        self.assertEquals(self.cache.lookup(self.rpm), None)
+
+        self.cache.get(self.rpm)
+        self.assertEquals(len(self.cache), 1)
+        self.assertNotEquals(self.cache.lookup(self.rpm), None)
+
+    def test_30_prune(self):
+        rpm = os.path.join(self.workdir, "b-0.2-1.noarch.rpm")
+        open(rpm, 'w').write("b")
+
+        for path in (self.rpm, rpm):
+            self.cache.get(path)
+
+        open(self.rpm, 'w').write("ab")
+        self.assertEquals(self.cache.prune(), 1)
+        self.assertEquals(len(self.cache), 1)
+
+        os.remove(rpm)
+        self.assertEquals(self.cache.prune(), 1)
+        self.assertEquals(len(self.cache), 0)
+
+
+# vim:sw=4:ts=4:et:
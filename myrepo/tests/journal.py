@@ -0,0 +1,65 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.journal as TT
+import myrepo.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_Journal(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.journal = TT.Journal(os.path.join(self.workdir, "a", "pending"))
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_flush__nothing_marked(self):
+        self.assertEquals(self.journal.pending(), [])
+        self.assertEquals(self.journal.quiet_for(), None)
+        self.assertTrue(self.journal.flush(lambda cs: self.fail(cs)))
+        self.assertFalse(self.journal.wait_quiet(10, self.fail))
+
+    def test_20_flush__marked_while_running(self):
+        self.journal.mark([("update:a", "true")])
+
+        def prun(cs):
+            self.journal.mark([("update:b", "true")])
+            return [True for _c in cs]
+
+        self.assertTrue(self.journal.flush(prun))
+        self.assertEquals(self.journal.pending(), [("update:b", "true")])
+
+    def test_30_wait_quiet(self):
+        self.journal.mark([("update:a", "true")])
+        os.utime(self.journal.path, (0, 0))
+        self.assertTrue(self.journal.wait_quiet(10, self.fail))
+
+        self.journal.mark([("update:a", "true")])
+        slept = []
+        self.journal.wait_quiet(10, lambda t: (slept.append(t),
+                                               os.utime(self.journal.path,
+                                                        (0, 0))))
+        self.assertEquals(len(slept), 1)
+        self.assertTrue(0 < slept[0] <= 10)
+
+
+# vim:sw=4:ts=4:et:
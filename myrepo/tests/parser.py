@@ -124,4 +124,22 @@ class Test_20_parse_dists_option(unittest.TestCase):
         )
 
 
+class Test_30_parse_joblimits(unittest.TestCase):
+
+    def test_00_empty(self):
+        self.assertEquals(P.parse_joblimits([]), {})
+
+    def test_10_single_limit(self):
+        self.assertEquals(P.parse_joblimits("mock:2"), dict(mock=2))
+
+    def test_20_multi_limits(self):
+        self.assertEquals(P.parse_joblimits(["mock:2,scp:4", "mock:1"]),
+                          dict(mock=1, scp=4))
+
+    def test_30_invalid_limit(self):
+        for ls in ("mock:0", "mock:x", "mock", ":2", "mock:2:3"):
+            with self.assertRaises(ValueError):
+                P.parse_joblimits(ls)
+
+
 # vim:sw=4:ts=4:et:
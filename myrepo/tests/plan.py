@@ -0,0 +1,113 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.plan as TT
+import myrepo.eventloop as ME
+import myrepo.shell as MS
+import myrepo.tests.common as C
+
+import os.path
+import time
+import unittest
+
+
+class Test_00_functions(unittest.TestCase):
+
+    def test_10_linearize__shared_deps(self):
+        a = TT.Step("a")
+        (b, c) = (TT.Step("b", [a]), TT.Step("c", [a]))
+        d = TT.Step("d", [b, c])
+
+        self.assertEquals(TT.linearize([d, c]),
+                          (["a", "b", "c", "d"], [[], [0], [0], [1, 2]]))
+
+    def test_20_optimize__dedupe_and_merge(self):
+        (r0, r1) = ("ssh h0 'createrepo /a'", "ssh h0 'createrepo /b'")
+        b = TT.Step("mock -r fedora-19-x86_64 a.src.rpm")
+        steps = [b, TT.Step(r0), TT.Step(r1), TT.Step(r0),
+                 TT.Step("mock -r fedora-19-x86_64 a.src.rpm"),
+                 TT.Step("cp a b", [b])]
+
+        (cs, deps) = TT.linearize(TT.optimize(steps))
+
+        self.assertEquals(len(cs), 3)
+        self.assertTrue("ssh h0 'rc=0; (createrepo /a) || rc=1; "
+                        "(createrepo /b) || rc=1; exit $rc'" in cs)
+        self.assertEquals(deps[cs.index("cp a b")],
+                          [cs.index(b.cmd)])
+
+    def test_21_dedupe__depends_on_same_cmd_directly(self):
+        # Steps of the same command run twice if one depends on the other.
+        x = TT.Step('x')
+        steps = TT.dedupe([TT.Step('x', [x])])
+
+        self.assertEquals([s.cmd for s in steps], ['x', 'x'])
+        self.assertEquals(steps[1].deps, [steps[0]])
+
+    def test_22_merged_remote_cmd__fails_if_any_failed(self):
+        workdir = C.setup_workdir()
+        mark = os.path.join(workdir, "mark")
+
+        # "sh -c" instead of "ssh <host>" to run it locally.
+        cmd = TT._merge_remote_cmds("sh -c", ["false", "touch " + mark])
+        self.assertFalse(MS.run(cmd))
+        self.assertTrue(os.path.exists(mark))
+
+        C.cleanup_workdir(workdir)
+
+    def test_23_dedupe__deep_diamond_chain(self):
+        # Layers of two steps, each depends on both of the previous layer,
+        # as chain builds make up, and duplicates depend on the last layer.
+        layer = [TT.Step("a"), TT.Step("b")]
+        for i in range(40):
+            layer = [TT.Step("a%d" % i, layer), TT.Step("b%d" % i, layer)]
+
+        start = time.time()
+        steps = TT.dedupe([TT.Step("x", layer), TT.Step("x", layer)])
+
+        self.assertTrue(time.time() - start < 1)
+        self.assertEquals(len(steps), 2 * 41 + 1)
+
+
+class Test_10_run(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_20_run__independent_steps_run_in_parallel(self):
+        mark = os.path.join(self.workdir, "mark")
+
+        # 'c' can only succeed if it runs while 'a' is running.
+        a = TT.Step("touch %s && sleep 2 && rm -f %s" % (mark, mark))
+        b = TT.Step("false", [a])
+        c = TT.Step("sleep 1 && test -f " + mark)
+        d = TT.Step("true", [b])
+
+        for prun in (MS.prun, ME.prun):
+            (cs, deps) = TT.linearize([d, c])
+            rs = dict(zip(cs, prun(cs, deps=deps)))
+
+            self.assertTrue(rs[a.cmd])
+            self.assertFalse(rs[b.cmd])
+            self.assertTrue(rs[c.cmd])
+            self.assertFalse(rs[d.cmd])  # Skipped as 'b' failed.
+
+
+# vim:sw=4:ts=4:et:
@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.repo as TT
+import myrepo.srpm as MS
 import unittest
 
 
@@ -37,7 +38,7 @@ class Test_30_classes(unittest.TestCase):
                           "cp -a /tmp/a /b/c/d")
 
     def test_12__Server__init___remotehost_minimal_args(self):
-        s = TT.Server("yumrepos-1.local")
+        s = TT.Server("yumrepos-1.local", mux=False)
 
         self.assertEquals(s.name, "yumrepos-1.local")
         self.assertEquals(s.altname, "yumrepos-1.local")
@@ -54,7 +55,8 @@ class Test_30_classes(unittest.TestCase):
                           "scp -p /tmp/a %s@yumrepos-1.local:/b/c/d" % s.user)
 
     def test_14__Server__init___remotehost(self):
-        s = TT.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com")
+        s = TT.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com",
+                      mux=False)
 
         self.assertEquals(s.name, "yumrepos-1.local")
         self.assertEquals(s.altname, "yumrepos.example.com")
@@ -68,6 +70,22 @@ class Test_30_classes(unittest.TestCase):
         self.assertEquals(s.deploy_cmd("/tmp/a", "/b/c/d"),
                           "scp -p /tmp/a jdoe@yumrepos-1.local:/b/c/d")
 
+    def test_16__Server__init___remotehost_w_mux(self):
+        s = TT.Server("yumrepos-1.local", "jdoe")
+        opts = "-o ControlMaster=auto -o ControlPath=%s " \
+               "-o ControlPersist=%d" % (s._mux.path, s._mux.persist)
+
+        self.assertEquals(s.adjust_cmd("true", "/tmp")[0],
+                          "ssh -o ConnectTimeout=%d %s jdoe@yumrepos-1.local "
+                          "'cd /tmp && true'" % (s.timeout, opts))
+        self.assertEquals(s.deploy_cmd("/tmp/a", "/b/c/d"),
+                          "scp -p %s /tmp/a jdoe@yumrepos-1.local:/b/c/d" %
+                          opts)
+
+        # Servers to the same host share the same connection.
+        s2 = TT.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com")
+        self.assertTrue(s2._mux is s._mux)
+
     def test_20__Dict__init__(self):
         d = TT.Dist("fedora-19", "x86_64")
 
@@ -79,6 +97,14 @@ class Test_30_classes(unittest.TestCase):
         self.assertEquals(d.mockcfg, "fedora-19-x86_64.cfg")
         self.assertEquals(d.rpmdir(), "/var/lib/mock/fedora-19-x86_64/result")
 
+    def test_22__Dist_rpmdir__per_build(self):
+        d = TT.Dist("fedora-19", "x86_64")
+        (s0, s1) = [MS.Srpm("/a/%s-0.1-1.src.rpm" % n) for n in ("foo", "bar")]
+
+        self.assertNotEquals(d.rpmdir(s0), d.rpmdir(s1))
+        self.assertTrue(d.rpmdir(s0) in d.mock_opts(s0))
+        self.assertTrue("--uniqueext=foo-0.1-1" in d.mock_opts(s0))
+
     def test_30__Repo__init___minimal_args(self):
         server = TT.Server("yumrepos-1.local", "jdoe", "yumrepos.example.com")
         repo = TT.Repo("fedora", 19, ["x86_64", "i386"], server)
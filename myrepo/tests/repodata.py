@@ -0,0 +1,174 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.repodata as TT
+import myrepo.tests.common as C
+
+import bz2
+import gzip
+import hashlib
+import os.path
+import os
+import sqlite3
+import unittest
+import xml.etree.cElementTree as ET
+
+
+def mk_package(path, href):
+    """
+    Fake of myrepo.repodata.read_package makes up metadata from the name.
+    """
+    (name, ver, rel_arch) = href[:-len(".rpm")].rsplit('-', 2)
+    (rel, arch) = rel_arch.split('.', 1)
+
+    return dict(pkgid=hashlib.sha256(href).hexdigest(), name=name,
+                arch=arch, epoch=u'0', version=ver, release=rel,
+                summary=u"Summary of " + name, description=u"<&> \xe9",
+                url=u'', packager=u'', time_file=1, time_build=2,
+                license=u"GPLv3+", vendor=u'', group=u"System/Tools",
+                buildhost=u"localhost", sourcerpm=u"%s-%s-%s.src.rpm" %
+                (name, ver, rel), header_start=280, header_end=1234,
+                size_package=os.path.getsize(path), size_installed=10,
+                size_archive=20, location=href,
+                provides=[(name, "EQ", u'0', ver, rel, False)],
+                requires=[(u"/bin/sh", None, None, None, None, True)],
+                conflicts=[], obsoletes=[],
+                files=[(u"/usr/bin/" + name, u''), (u"/etc/" + name, u"dir"),
+                       (u"/usr/share/doc/%s/README" % name, u'')],
+                changelogs=[(u"John Doe <jdoe@example.com>", 3, u"- init")])
+
+
+class Test_00_generate(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+        for rpm in ("a-0.1-1.noarch.rpm", "b-0.2-1.x86_64.rpm"):
+            open(os.path.join(self.workdir, rpm), 'w').write(rpm)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def repomd(self):
+        path = os.path.join(self.workdir, "repodata", "repomd.xml")
+        ns = dict(r=TT._NS_REPO)
+
+        ret = dict()
+        for data in ET.parse(path).findall("r:data", ns):
+            href = data.find("r:location", ns).get("href")
+            ret[data.get("type")] = (os.path.join(self.workdir, href),
+                                     data.find("r:checksum", ns).text,
+                                     data.find("r:open-checksum", ns).text)
+        return ret
+
+    def test_10_generate(self):
+        index = TT.generate(self.workdir, read=mk_package)
+        self.assertEquals((index.nread, index.nreused), (2, 0))
+
+        repomd = self.repomd()
+        self.assertEquals(sorted(repomd.keys()),
+                          ["filelists", "filelists_db", "other", "other_db",
+                           "primary", "primary_db"])
+
+        for mdtype, (path, checksum, opensum) in repomd.iteritems():
+            self.assertEquals(TT._checksum(path), checksum)
+
+            opener = bz2.BZ2File if mdtype.endswith("_db") else gzip.open
+            content = opener(path).read()
+            self.assertEquals(hashlib.sha256(content).hexdigest(), opensum)
+
+        primary = ET.parse(gzip.open(repomd["primary"][0])).getroot()
+        self.assertEquals(primary.get("packages"), "2")
+
+        ns = dict(c=TT._NS_COMMON, rpm=TT._NS_RPM)
+        pkgs = primary.findall("c:package", ns)
+        self.assertEquals([p.find("c:name", ns).text for p in pkgs],
+                          ["a", "b"])
+        self.assertEquals(pkgs[0].find("c:description", ns).text,
+                          u"<&> \xe9")
+
+        # Files not in bin/ nor /etc/ are only in filelists.
+        self.assertEquals([f.text for f in pkgs[0].findall("c:format/c:file",
+                                                           ns)],
+                          ["/usr/bin/a", "/etc/a"])
+        self.assertEquals(pkgs[0].find("c:format/rpm:requires/rpm:entry",
+                                       ns).get("pre"), "1")
+
+    def test_20_generate_databases(self):
+        TT.generate(self.workdir, read=mk_package)
+        repomd = self.repomd()
+
+        db = os.path.join(self.workdir, "primary.sqlite")
+        open(db, 'wb').write(bz2.BZ2File(repomd["primary_db"][0]).read())
+
+        conn = sqlite3.connect(db)
+        self.assertEquals(conn.execute("SELECT * FROM db_info").fetchall(),
+                          [(10, repomd["primary"][1])])
+        self.assertEquals(conn.execute("SELECT name, location_href FROM "
+                                       "packages").fetchall(),
+                          [("a", "a-0.1-1.noarch.rpm"),
+                           ("b", "b-0.2-1.x86_64.rpm")])
+        self.assertEquals(conn.execute("SELECT name, type FROM files WHERE "
+                                       "pkgKey = 1").fetchall(),
+                          [("/usr/bin/a", "file"), ("/etc/a", "dir")])
+        conn.close()
+
+    def test_30_update_incrementally(self):
+        TT.generate(self.workdir, read=mk_package)
+
+        os.remove(os.path.join(self.workdir, "a-0.1-1.noarch.rpm"))
+        open(os.path.join(self.workdir, "c-0.3-1.noarch.rpm"), 'w').write("c")
+
+        index = TT.generate(self.workdir, read=mk_package)
+        self.assertEquals((index.nread, index.nreused), (1, 1))
+
+        repomd = self.repomd()
+        ns = dict(f=TT._NS_FILELISTS)
+        self.assertEquals([p.get("name") for p in
+                           ET.parse(gzip.open(repomd["filelists"][0])
+                                    ).findall("f:package", ns)],
+                          ["b", "c"])
+
+        db = os.path.join(self.workdir, "primary.sqlite")
+        open(db, 'wb').write(bz2.BZ2File(repomd["primary_db"][0]).read())
+
+        conn = sqlite3.connect(db)
+        self.assertEquals(conn.execute("SELECT * FROM db_info").fetchall(),
+                          [(10, repomd["primary"][1])])
+        self.assertEquals(conn.execute("SELECT name FROM packages ORDER BY "
+                                       "name").fetchall(), [("b", ), ("c", )])
+        self.assertEquals(conn.execute("SELECT DISTINCT name FROM provides "
+                                       "ORDER BY name").fetchall(),
+                          [("b", ), ("c", )])
+        conn.close()
+
+    def test_32_update_changed(self):
+        TT.generate(self.workdir, read=mk_package)
+
+        open(os.path.join(self.workdir, "b-0.2-1.x86_64.rpm"), 'w').write("")
+        index = TT.generate(self.workdir, read=mk_package)
+        self.assertEquals((index.nread, index.nreused), (1, 1))
+
+        path = self.repomd()["primary"][0]
+        ns = dict(c=TT._NS_COMMON)
+        self.assertEquals([p.find("c:size", ns).get("package") for p in
+                           ET.parse(gzip.open(path)).findall("c:package",
+                                                             ns)],
+                          ["18", "0"])
+
+
+# vim:sw=4:ts=4:et:
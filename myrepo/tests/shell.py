@@ -73,6 +73,18 @@ class Test_00_functions(unittest.TestCase):
         self.assertEquals(cmd, cmdref)
         self.assertEquals(workdir, os.curdir)
 
+    def test_20_cmd_kind(self):
+        self.assertEquals(TT.cmd_kind("mock -r fedora-19-x86_64 a.src.rpm"),
+                          "mock")
+        self.assertEquals(TT.cmd_kind("cd /tmp && createrepo --update ."),
+                          "createrepo")
+        self.assertEquals(TT.cmd_kind("cp -a /var/lib/mock/x/result/a /b"),
+                          "other")
+
+    def test_30_pmap__no_processes_left(self):
+        self.assertEquals(TT.pmap(abs, [-1, 2, -3], 2), [1, 2, 3])
+        self.assertEquals(TT.multiprocessing.active_children(), [])
+
 
 class Test_10_run(unittest.TestCase):
 
@@ -87,21 +99,21 @@ class Test_10_run(unittest.TestCase):
     def test_00_run_async__simplest_case(self):
         proc = TT.run_async("true", **self.kwargs)
 
-        self.assertTrue(isinstance(proc, TT.multiprocessing.Process))
+        self.assertTrue(isinstance(proc, TT.Job))
         self.assertTrue(TT.stop_async_run(proc))
         self.assertTrue(os.path.exists(self.logfile))
 
     def test_01_run_async__simplest_case(self):
         proc = TT.run_async("false", **self.kwargs)
 
-        self.assertTrue(isinstance(proc, TT.multiprocessing.Process))
+        self.assertTrue(isinstance(proc, TT.Job))
         self.assertFalse(TT.stop_async_run(proc))
         self.assertTrue(os.path.exists(self.logfile))
 
     def test_02_run_async__simplest_case(self):
         proc = TT.run_async("sleep 5 && true", **self.kwargs)
 
-        self.assertTrue(isinstance(proc, TT.multiprocessing.Process))
+        self.assertTrue(isinstance(proc, TT.Job))
         self.assertFalse(TT.stop_async_run(proc, 2))
         self.assertTrue(os.path.exists(self.logfile))
 
@@ -115,10 +127,28 @@ class Test_10_run(unittest.TestCase):
 
         proc = TT.run_async("sleep 5 && true", **kwargs)
 
-        self.assertTrue(isinstance(proc, TT.multiprocessing.Process))
+        self.assertTrue(isinstance(proc, TT.Job))
         self.assertFalse(TT.stop_async_run(proc, 2))
         self.assertTrue(os.path.exists(logfile_path))
 
+    def test_06_run_async__logfile_named_by_pid(self):
+        proc = TT.Job("echo OK", self.workdir, logfile=True)
+        proc.start()
+
+        self.assertTrue(TT.stop_async_run(proc))
+        self.assertEquals(proc.logfile,
+                          os.path.join(self.workdir, "%d.log" % proc.pid))
+        self.assertEquals(open(proc.logfile).read(), "OK\n")
+
+    def test_08_run_async__kill_whole_process_group(self):
+        mark = os.path.join(self.workdir, "mark")
+        proc = TT.run_async("(sleep 2 && touch %s) & wait" % mark,
+                            **self.kwargs)
+
+        self.assertFalse(TT.stop_async_run(proc, 1))
+        TT.time.sleep(2)
+        self.assertFalse(os.path.exists(mark))
+
     def test_10_run__simplest_case(self):
         self.assertTrue(TT.run("true", **self.kwargs))
         self.assertFalse(TT.run("false", **self.kwargs))
@@ -131,10 +161,44 @@ class Test_10_run(unittest.TestCase):
 
     def test_30_run__if_interrupted(self):
         proc = TT.run_async("sleep 20", **self.kwargs)
-        interrupter = TT.run_async("sleep 3 && kill -s INT %d" % proc.pid,
+        # Send INT to the process group of proc directly. It leads its own
+        # session so that Ctrl-C in the terminal does not reach it.
+        interrupter = TT.run_async("sleep 3 && kill -s INT -- -%d" % proc.pid,
+                                   **self.kwargs)
+
+        self.assertFalse(TT.stop_async_run(proc))
+        interrupter.join()
+
+    def test_32_run__if_parent_interrupted(self):
+        proc = TT.run_async("sleep 20", **self.kwargs)
+        # Send INT to this (parent) process as Ctrl-C in the terminal does.
+        interrupter = TT.run_async("sleep 2 && kill -s INT %d" % os.getpid(),
+                                   **self.kwargs)
+
+        self.assertRaises(KeyboardInterrupt, TT.stop_async_run, proc)
+        self.assertFalse(proc.is_alive())
+        self.assertFalse(proc.successful())
+        interrupter.join()
+
+    def test_34_prun__if_parent_interrupted(self):
+        marks = [os.path.join(self.workdir, "mark.%d" % i) for i in range(3)]
+        cs = ["sleep 4 && touch " + m for m in marks]
+        interrupter = TT.run_async("sleep 1 && kill -s INT %d" % os.getpid(),
                                    **self.kwargs)
 
+        # All of the jobs must be killed, not only the one waited for.
+        self.assertRaises(KeyboardInterrupt, TT.prun, cs, safer=True)
+        interrupter.join()
+        TT.time.sleep(4)
+        self.assertFalse(any(os.path.exists(m) for m in marks))
+
+    def test_36_run__if_reaped_elsewhere(self):
+        proc = TT.run_async("true", **self.kwargs)
+        os.waitpid(proc.pid, 0)
+
+        # Its exit status is lost and it must not be regarded as successful.
         self.assertFalse(TT.stop_async_run(proc))
+        self.assertFalse(proc.successful())
 
     def test_50_prun_async__simplest_case(self):
         cntr = itertools.count()
@@ -146,10 +210,28 @@ class Test_10_run(unittest.TestCase):
                            workdir=self.workdir, logfile=logfile())
 
         for proc in ps:
-            self.assertTrue(isinstance(proc, TT.multiprocessing.Process))
+            self.assertTrue(isinstance(proc, TT.Job))
             #self.assertFalse(TT.stop_async_run(proc, 2))
 
         #self.assertTrue(os.path.exists(self.logfile))
 
+    def test_60_prun__bounded(self):
+        cs = ["sleep 1 && true", "false", "sleep 1 && true"]
+        self.assertEquals(TT.prun(cs, maxjobs=2), [True, False, True])
+
+    def test_62_prun__bounded_by_kind(self):
+        mark = os.path.join(self.workdir, "running")
+
+        # Each job fails if another job is running at the same time.
+        c = "mkdir %s && sleep 1 && rmdir %s" % (mark, mark)
+        self.assertEquals(TT.prun([c for _ in range(3)],
+                                  limits=dict(other=1)),
+                          [True, True, True])
+
+    def test_64_prun__bounded_w_timeout(self):
+        cs = ["sleep 10", "true"]
+        self.assertEquals(TT.prun(cs, kwargs2=dict(timeout=1), maxjobs=1),
+                          [False, True])
+
 
 # vim:sw=4 ts=4 et:
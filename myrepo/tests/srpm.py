@@ -16,7 +16,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import myrepo.srpm as TT
+import myrepo.headercache as MHC
 import myrepo.tests.common as C
+import myrepo.tests.headercache as THC
 
 import os.path
 import os
@@ -65,6 +67,33 @@ class Test_00_Srpm(unittest.TestCase):
         self.assertTrue(isinstance(srpm, TT.Srpm))
         self.assertTrue(srpm.resolved)
 
+    def test_04___init___w_deps(self):
+        srpm = TT.Srpm("/path/to/dummy/src.rpm", "foo",
+                       buildrequires=["bar-devel"], provides=["foo"])
+
+        self.assertEquals(srpm.buildrequires, ["bar-devel"])
+        self.assertEquals(srpm.provides, ["foo"])
+
+    def test_06_resolve__w_cache(self):
+        workdir = C.setup_workdir()
+        try:
+            path = os.path.join(workdir, "foo-0.1-1.src.rpm")
+            open(path, 'w').write("foo")
+
+            cache = MHC.HeaderCache(os.path.join(workdir, "headers.sqlite"),
+                                    THC.read_entry)
+            srpm = TT.Srpm(path)
+            srpm.resolve(cache)
+
+            self.assertTrue(srpm.resolved)
+            self.assertTrue(srpm.is_srpm)
+            self.assertEquals((srpm.name, srpm.version, srpm.release),
+                              ("foo", "0.1", "1"))
+            self.assertEquals(srpm.buildrequires, ["foo-devel"])
+            self.assertEquals((cache.hits, cache.misses), (0, 1))
+        finally:
+            C.cleanup_workdir(workdir)
+
     def test_10_resolve__srpm_ok(self):
         path = random.choice(list_found_rpms())
         srpm = TT.Srpm(path)
@@ -82,4 +111,18 @@ class Test_00_Srpm(unittest.TestCase):
         self.assertNotEquals(srpm.noarch, None)
 
 
+class Test_10_functions(unittest.TestCase):
+
+    def test_10_toposort_layers(self):
+        srpms = [TT.Srpm("/a/%s.src.rpm" % n, n, buildrequires=brs) for n, brs
+                 in (("app", ["libfoo-devel", "python"]),
+                     ("libfoo", ["gcc"]),
+                     ("libfoo-python", ["libfoo-devel"]),
+                     ("python", []))]
+        layers = TT.toposort_layers(srpms)
+
+        self.assertEquals([[s.name for s in l] for l in layers],
+                          [["libfoo", "python"], ["app", "libfoo-python"]])
+
+
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.sshmux as TT
+import myrepo.repo as MR
+import myrepo.shell as MS
+import myrepo.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+# Fake ssh: It emulates the control socket with a plain file, counts
+# connections (handshakes) made and runs remote commands locally.
+_FAKE_SSH = """#! /bin/bash
+path=
+ctl=
+master=
+auto=
+while test $# -gt 0; do
+    case "$1" in
+        -o) case "$2" in
+                ControlPath=*) path=${2#ControlPath=};;
+                ControlMaster=auto) auto=1;;
+            esac; shift;;
+        -O) ctl=$2; shift;;
+        -fN) master=1;;
+        -*) ;;
+        *) shift; break;;
+    esac
+    shift
+done
+case "$ctl" in
+    check) test -e $path; exit $?;;
+    exit|stop) rm -f $path; exit 0;;
+esac
+if test -n "$master"; then
+    touch $path; echo master >> %(log)s; exit 0
+fi
+if test ! -e "$path"; then
+    echo connect >> %(log)s
+    test -z "$auto" || touch $path  # It becomes the master.
+fi
+eval "$@"
+"""
+
+
+class Test_00_Mux(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.log = os.path.join(self.workdir, "ssh.log")
+
+        bindir = os.path.join(self.workdir, "bin")
+        os.makedirs(bindir)
+
+        ssh = os.path.join(bindir, "ssh")
+        open(ssh, 'w').write(_FAKE_SSH % dict(log=self.log))
+        os.chmod(ssh, 0755)
+
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = bindir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        C.cleanup_workdir(self.workdir)
+
+    def connections(self):
+        if not os.path.exists(self.log):
+            return []
+
+        return open(self.log).read().split()
+
+    def test_10_open_and_close(self):
+        mux = TT.Mux("repo.example.com", "jdoe",
+                     controldir=os.path.join(self.workdir, "ctl"))
+
+        self.assertFalse(mux.is_open())
+        self.assertTrue(mux.open())
+        self.assertTrue(mux.is_open())
+        self.assertTrue(mux.open())  # Already opened.
+        self.assertEquals(mux.handshakes, 1)
+
+        mux.close()
+        self.assertFalse(mux.is_open())
+        self.assertEquals(self.connections(), ["master"])
+
+    def test_20_shared_by_server_commands(self):
+        server = MR.Server("repo.example.com", "jdoe", mux=False)
+        server._mux = mux = TT.Mux("repo.example.com", "jdoe",
+                                   controldir=os.path.join(self.workdir,
+                                                           "ctl"))
+        self.assertTrue(server.connect())
+
+        cs = [server.adjust_cmd("true", self.workdir)[0] for _ in range(5)]
+        self.assertEquals(MS.prun(cs), [True] * 5)
+
+        mux.close()
+        self.assertEquals(self.connections(), ["master"])
+        self.assertEquals(mux.sessions, 5)
+        self.assertEquals(mux.handshakes_avoided, 5)  # Opened explicitly.
+
+        # Sessions are counted only when they're spawned.
+        server.adjust_cmd("true", self.workdir)
+        self.assertEquals(mux.sessions, 5)
+
+    def test_22_shared_by_sessions(self):
+        mux = TT.Mux("repo.example.com", "jdoe",
+                     controldir=os.path.join(self.workdir, "ctl"))
+        c = "ssh %s %s true" % (mux.options(), mux.target)
+
+        # The first session becomes the master and the rest share it.
+        for _ in range(3):
+            self.assertTrue(MS.run(c))
+
+        mux.close()
+        self.assertEquals(self.connections(), ["connect"])
+        self.assertEquals((mux.sessions, mux.handshakes,
+                           mux.handshakes_avoided), (3, 1, 2))
+
+    def test_30_control_dir_not_safe(self):
+        controldir = os.path.join(self.workdir, "ctl")
+        os.makedirs(controldir)
+        os.chmod(controldir, 0777)  # Others may make sockets in it.
+
+        mux = TT.Mux("repo.example.com", "jdoe", controldir=controldir)
+        self.assertTrue(mux.options() is None)
+        self.assertFalse(mux.open())
+        self.assertEquals(self.connections(), [])
+
+
+# vim:sw=4:ts=4:et:
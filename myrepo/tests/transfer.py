@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.transfer as TT
+import myrepo.shell as MS
+import myrepo.tests.common as C
+
+import os.path
+import os
+import subprocess
+import unittest
+
+
+class Test_10_rsync_cmd(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.srcdir = os.path.join(self.workdir, "src")
+        self.dstdir = os.path.join(self.workdir, "dst")
+
+        for d in (self.srcdir, self.dstdir):
+            os.makedirs(d)
+
+        for rpm in ("a-0.1-1.noarch.rpm", "b-0.1-1.noarch.rpm"):
+            open(os.path.join(self.srcdir, rpm), 'w').write("0" * 1000)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def run_cmd(self, c):
+        return subprocess.check_output(c, shell=True, cwd=self.workdir)
+
+    def test_10_copy_missing_files_only(self):
+        c = TT.rsync_cmd(os.path.join(self.srcdir, "*.rpm"), self.dstdir)
+
+        self.assertTrue("Transferred 2000 bytes, skipped 0 bytes" in
+                        self.run_cmd(c))
+        self.assertEquals(sorted(os.listdir(self.dstdir)),
+                          sorted(os.listdir(self.srcdir)))
+
+        open(os.path.join(self.srcdir, "c-0.1-1.noarch.rpm"), 'w').write("0")
+        self.assertTrue("Transferred 1 bytes, skipped 2000 bytes" in
+                        self.run_cmd(c))
+
+    def test_20_checksum(self):
+        srcs = [os.path.join(self.srcdir, f) for f
+                in sorted(os.listdir(self.srcdir))]
+        c = TT.rsync_cmd(srcs, self.dstdir, checksum=True)
+        self.run_cmd(c)
+
+        # Same size and mtime but the content differs.
+        st = os.stat(srcs[0])
+        open(srcs[0], 'w').write("1" * 1000)
+        os.utime(srcs[0], (st.st_atime, st.st_mtime))
+
+        self.assertTrue("Transferred 1000 bytes, skipped 1000 bytes" in
+                        self.run_cmd(c))
+
+    def test_30_failure(self):
+        c = TT.rsync_cmd(os.path.join(self.srcdir, "not_exist"), self.dstdir)
+        self.assertFalse(MS.run(c, workdir=self.workdir))
+
+
+class Test_20_tar_cmd(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.dstdir = os.path.join(self.workdir, "dst")
+
+        for d, rpm in (("r0", "a-0.1-1.x86_64.rpm"), ("r0", "a-0.1-1.src.rpm"),
+                       ("r1", "a-0.1-1.i386.rpm")):
+            if not os.path.exists(os.path.join(self.workdir, d)):
+                os.makedirs(os.path.join(self.workdir, d))
+
+            open(os.path.join(self.workdir, d, rpm), 'w').write("0" * 1000)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_unpack_into_sub_dirs(self):
+        r0 = os.path.join(self.workdir, "r0")
+        r1 = os.path.join(self.workdir, "r1")
+        files = [(os.path.join(r0, "*.src.rpm"), "sources"),
+                 (os.path.join(r0, "*.x86_64.rpm"), "x86_64"),
+                 (os.path.join(r1, "*.i386.rpm"), "i386")]
+
+        for comp in ("none", "gzip"):
+            c = TT.tar_cmd(files, self.dstdir, compressor=comp,
+                           post="touch done")
+            out = subprocess.check_output(c, shell=True, cwd=self.workdir)
+
+            self.assertTrue("Uploaded 0.0 MB in " in out, out)
+            self.assertEquals(sorted(os.listdir(self.dstdir)),
+                              ["done", "i386", "sources", "x86_64"])
+            self.assertEquals(os.listdir(os.path.join(self.dstdir, "i386")),
+                              ["a-0.1-1.i386.rpm"])
+
+    def test_20_failure(self):
+        c = TT.tar_cmd([(os.path.join(self.workdir, "r0", "*.noarch.rpm"),
+                         "x86_64")], self.dstdir, post="touch done")
+
+        self.assertFalse(MS.run(c, workdir=self.workdir))
+        self.assertFalse(os.path.exists(os.path.join(self.dstdir, "done")))
+
+
+# It runs commands as if on the remote host, whose home dir is different from
+# the local one, and logs each session.
+_FAKE_SSH = """#! /bin/sh
+echo $1 >> %(log)s
+HOME=%(home)s exec sh -c "$2"
+"""
+
+
+class Test_30_pool_cmd(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.srcdir = os.path.join(self.workdir, "src")
+        self.pool = os.path.join(self.workdir, "yum", ".pool")
+
+        os.makedirs(self.srcdir)
+        for rpm in ("a-0.1-1.noarch.rpm", "b-0.1-1.noarch.rpm"):
+            open(os.path.join(self.srcdir, rpm), 'w').write(rpm * 100)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_dedup_among_repos(self):
+        src = os.path.join(self.srcdir, "*.rpm")
+        (d0, d1, d2) = [os.path.join(self.workdir, "yum", d) for d in
+                        ("fedora/19/x86_64", "fedora/19/i386",
+                         "rhel/6/x86_64")]
+
+        out = subprocess.check_output(TT.pool_cmd(src, [d0, d1], self.pool),
+                                      shell=True)
+        self.assertTrue("Uploaded 3600 bytes, deduplicated 0 bytes" in out)
+
+        out = subprocess.check_output(TT.pool_cmd(src, [d2], self.pool),
+                                      shell=True)
+        self.assertTrue("Uploaded 0 bytes, deduplicated 3600 bytes" in out)
+
+        rpm = "a-0.1-1.noarch.rpm"
+        inodes = set(os.stat(os.path.join(d, rpm)).st_ino for d
+                     in (d0, d1, d2))
+        self.assertEquals(len(inodes), 1)
+        self.assertEquals(os.stat(os.path.join(d0, rpm)).st_nlink, 4)
+        self.assertEquals(open(os.path.join(d2, rpm)).read(), rpm * 100)
+
+    def test_20_failure(self):
+        c = TT.pool_cmd(os.path.join(self.srcdir, "*.src.rpm"),
+                        [os.path.join(self.workdir, "sources")], self.pool)
+        self.assertFalse(MS.run(c, workdir=self.workdir))
+
+    def test_30_remote(self):
+        (bindir, home) = [os.path.join(self.workdir, d) for d in
+                          ("bin", "home")]
+        os.makedirs(bindir)
+        os.makedirs(home)
+
+        log = os.path.join(self.workdir, "ssh.log")
+        ssh = os.path.join(bindir, "ssh")
+        open(ssh, 'w').write(_FAKE_SSH % dict(log=log, home=home))
+        os.chmod(ssh, 0755)
+
+        src = os.path.join(self.srcdir, "*.rpm")
+        (d0, d1) = ("~/yum/fedora/19/x86_64", "~/yum/fedora/19/i386")
+        env = dict(os.environ, PATH=bindir + os.pathsep + os.environ["PATH"])
+
+        def run(dsts):
+            c = TT.pool_cmd(src, dsts, "~/yum/.pool", "repo.example.com")
+            return subprocess.check_output(c, shell=True, env=env)
+
+        out = run([d0])
+        self.assertTrue("Uploaded 3600 bytes, deduplicated 0 bytes" in out)
+        out = run([d1])
+        self.assertTrue("Uploaded 0 bytes, deduplicated 3600 bytes" in out)
+
+        # Paths in the pool and dirs are on the host, and it took two
+        # sessions to upload files and one to link them.
+        self.assertEquals(open(log).read().split(), ["repo.example.com"] * 3)
+
+        rpm = "a-0.1-1.noarch.rpm"
+        st = os.stat(os.path.join(home, "yum/fedora/19/i386", rpm))
+        self.assertEquals(st.st_nlink, 3)
+        # Files uploaded to stage are not left.
+        self.assertFalse([d for d in os.listdir(os.path.join(home, "yum",
+                                                             ".pool"))
+                          if d.startswith(".incoming")])
+
+
+# vim:sw=4:ts=4:et:
@@ -15,8 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import myrepo.tests.common as C
 import myrepo.utils as U
 
+import os.path
+import os
+import time
 import unittest
 
 
@@ -36,7 +40,57 @@ class Test_00(unittest.TestCase):
             U.typecheck(A(), str)
 
     def test_10_compile_template(self):
-        pass
+        workdir = C.setup_workdir()
+        try:
+            tmpl = os.path.join(workdir, "t")
+            open(tmpl, 'w').write("{{ a }} {{ b.c }}")
+
+            ctx = dict(a=1, b=dict(c=[2]), x=object())
+            self.assertEquals(U.compile_template("t", ctx, [workdir]),
+                              "1 [2]")
+
+            # Memoized results are used while variables used are same, and
+            # the template is not changed.
+            env = U.get_template_env([workdir])
+            render = env.get_template("t").render
+            try:
+                env.get_template("t").render = None
+                self.assertEquals(U.compile_template("t", dict(ctx, x=None),
+                                                     [workdir]), "1 [2]")
+            finally:
+                env.get_template("t").render = render
+
+            open(tmpl, 'w').write("{{ a }}")
+            os.utime(tmpl, (time.time() + 10, time.time() + 10))
+            self.assertEquals(U.compile_template("t", ctx, [workdir]), "1")
+            self.assertEquals(U.compile_template("t", dict(a=2), [workdir]),
+                              "2")
+        finally:
+            C.cleanup_workdir(workdir)
+
+    def test_12_compile_template__include(self):
+        workdir = C.setup_workdir()
+        try:
+            open(os.path.join(workdir, "t"), 'w').write(
+                "{{ a }} {% include 'u' %}")
+            inc = os.path.join(workdir, "u")
+            open(inc, 'w').write("{{ b }}")
+
+            # Variables used only in the template included are keys also.
+            self.assertEquals(U.compile_template("t", dict(a=1, b=2),
+                                                 [workdir]), "1 2")
+            self.assertEquals(U.compile_template("t", dict(a=1, b=3),
+                                                 [workdir]), "1 3")
+
+            # Templates included are reloaded if they were changed.
+            open(inc, 'w').write("{{ b }}{{ c }}")
+            os.utime(inc, (time.time() + 10, time.time() + 10))
+            self.assertEquals(U.compile_template("t", dict(a=1, b=3, c=4),
+                                                 [workdir]), "1 34")
+            self.assertEquals(U.compile_template("t", dict(a=1, b=3, c=5),
+                                                 [workdir]), "1 35")
+        finally:
+            C.cleanup_workdir(workdir)
 
     def test_20_is_local(self):
         self.assertTrue(U.is_local("localhost"))
@@ -0,0 +1,101 @@
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import myrepo.verify as TT
+import myrepo.repodata as MRD
+import myrepo.tests.common as C
+import myrepo.tests.repodata as MTR
+
+import os.path
+import os
+import unittest
+
+
+def mk_package(path, href):
+    return dict(MTR.mk_package(path, href), pkgid=TT.checksum(path))
+
+
+def generate(topdir, rpms):
+    """
+    Make up RPMs and the metadata of them in ``topdir``.
+    """
+    for rpm in rpms:
+        open(os.path.join(topdir, rpm), 'w').write(rpm * 100)
+
+    MRD.generate(topdir, database=False, read=mk_package)
+
+
+class Test_10_verify(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.topdir = os.path.join(self.workdir, "x86_64")
+        os.makedirs(self.topdir)
+
+        generate(self.topdir, ["a-0.1-1.noarch.rpm", "b-0.2-1.x86_64.rpm",
+                               "c-0.3-1.x86_64.rpm"])
+        self.cache = TT.ChecksumCache(os.path.join(self.workdir, "v.sqlite"))
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_load_packages(self):
+        ps = TT.load_packages(self.topdir)
+        self.assertEquals([p["href"] for p in ps],
+                          ["a-0.1-1.noarch.rpm", "b-0.2-1.x86_64.rpm",
+                           "c-0.3-1.x86_64.rpm"])
+        self.assertEquals(ps[0]["size"], 1800)
+        self.assertEquals(ps[0]["sumtype"], "sha256")
+
+    def test_20_verify__no_problems(self):
+        self.assertEquals(TT.verify(self.topdir, cache=self.cache), [])
+
+    def test_30_verify__problems(self):
+        rpm = lambda f: os.path.join(self.topdir, f)
+
+        os.remove(rpm("a-0.1-1.noarch.rpm"))
+        open(rpm("b-0.2-1.x86_64.rpm"), 'w').write("b")
+        open(rpm("c-0.3-1.x86_64.rpm"), 'w').write("c" * 1800)
+        open(rpm("d-0.4-1.noarch.rpm"), 'w').write("d")
+
+        self.assertEquals(TT.verify(self.topdir, jobs=2, cache=self.cache),
+                          [("missing", "a-0.1-1.noarch.rpm"),
+                           ("size mismatch (1 != 1800)",
+                            "b-0.2-1.x86_64.rpm"),
+                           ("checksum mismatch", "c-0.3-1.x86_64.rpm"),
+                           ("orphan", "d-0.4-1.noarch.rpm")])
+
+    def test_40_verify__cached(self):
+        TT.verify(self.topdir, cache=self.cache)
+
+        # Cached checksums are used while files are not changed.
+        checksum = TT.checksum
+        try:
+            TT.checksum = lambda *args: None
+            self.assertEquals(TT.verify(self.topdir, cache=self.cache), [])
+
+            rpm = os.path.join(self.topdir, "a-0.1-1.noarch.rpm")
+            os.remove(rpm)
+            open(rpm, 'w').write("a-0.1-1.noarch.rpm" * 100)
+
+            self.assertEquals(TT.verify(self.topdir, cache=self.cache),
+                              [("checksum mismatch", "a-0.1-1.noarch.rpm")])
+        finally:
+            TT.checksum = checksum
+
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,313 @@
+#
+# Backends to transfer files to servers.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""The 'scp' backend copies all of the files matched always, and the 'rsync'
+backend copies only files missing or changed on the server, decided by their
+size and mtime or checksum, resumes partial transfers and reports the number
+of bytes skipped. The 'tar' backend streams files, may be from several dirs
+and to several sub dirs on the server, as one tar archive over one SSH
+channel, and reports its throughput.
+
+Files may be also put into a pool of files keyed by their checksum on the
+server (see ``pool_cmd``), uploaded only if the pool lacks them and hardlinked
+into dirs of repos, to store the same files deployed into several repos, e.g.
+noarch RPMs and SRPMs, only once.
+"""
+import myrepo.globals as G
+
+import os.path
+
+
+# Filter to report the summary from the output of rsync --stats.
+_RSYNC_STATS_FILTER = """\
+awk '/^Total file size:/ { gsub(",", "", $4); t = $4 } \
+/^Total transferred file size:/ { gsub(",", "", $5); x = $5 } \
+END { printf "Transferred %%d bytes, skipped %%d bytes: %s\\n", x, t - x }'"""
+
+
+def _target(host, user=None):
+    return host if user is None else "%s@%s" % (user, host)
+
+
+def _srcs(src):
+    """
+    >>> _srcs("/a/b/*.rpm")
+    '/a/b/*.rpm'
+    >>> _srcs(["/a/b.rpm", "/a/c.rpm"])
+    '/a/b.rpm /a/c.rpm'
+    """
+    return src if isinstance(src, basestring) else ' '.join(src)
+
+
+def scp_cmd(src, dst, host=None, user=None, opts=None):
+    """
+    Make up a command string to copy files with scp, or cp if ``host`` is
+    None (local).
+
+    >>> scp_cmd("/a/b/*.rpm", "/c/d")
+    'cp -a /a/b/*.rpm /c/d'
+    >>> scp_cmd("/a/b/*.rpm", "/c/d", "repo.example.com", "jdoe")
+    'scp -p /a/b/*.rpm jdoe@repo.example.com:/c/d'
+
+    :param src: Copying source path or glob, or a list of them
+    :param dst: Copying destination path
+    :param host: Destination host or None (local)
+    :param user: User name on the host or None
+    :param opts: SSH options string or None
+
+    :return: Command string
+    """
+    if host is None:
+        return "cp -a %s %s" % (_srcs(src), dst)
+
+    return "scp -p %s%s %s:%s" % ('' if opts is None else opts + ' ',
+                                  _srcs(src), _target(host, user), dst)
+
+
+def rsync_cmd(src, dst, host=None, user=None, opts=None, checksum=False):
+    """
+    Make up a command string to copy files missing or changed only with
+    rsync in one session, and to report bytes skipped.
+
+    >>> rsync_cmd("/a/b/*.rpm", "/c/d")  # doctest: +NORMALIZE_WHITESPACE
+    'out=$(rsync -a --partial --stats /a/b/*.rpm /c/d/) && echo "$out" |
+     awk \\'/^Total file size:/ { gsub(",", "", $4); t = $4 }
+     /^Total transferred file size:/ { gsub(",", "", $5); x = $5 }
+     END { printf "Transferred %d bytes, skipped %d bytes: /c/d/\\\\n",
+     x, t - x }\\''
+    >>> c = rsync_cmd(["/a/b.rpm", "/a/c.rpm"], "/c/d", "repo.example.com",
+    ...               "jdoe", "-o ControlPath=/tmp/s", True)
+    >>> c.split(')')[0]  # doctest: +NORMALIZE_WHITESPACE
+    "out=$(rsync -a --partial --stats --checksum
+     -e 'ssh -o ControlPath=/tmp/s' /a/b.rpm /a/c.rpm
+     jdoe@repo.example.com:/c/d/"
+
+    :param src: Copying source path or glob, or a list of them
+    :param dst: Copying destination dir
+    :param host: Destination host or None (local)
+    :param user: User name on the host or None
+    :param opts: SSH options string or None
+    :param checksum: Compare files by their checksum instead of their size
+        and mtime if True
+
+    :return: Command string
+    """
+    dst = os.path.join(dst, '')  # Make it ends with '/'.
+    if host is not None:
+        dst = "%s:%s" % (_target(host, user), dst)
+
+    ropts = "-a --partial --stats"
+    if checksum:
+        ropts += " --checksum"
+
+    if host is not None and opts:
+        ropts += " -e 'ssh %s'" % opts
+
+    return "out=$(rsync %s %s %s) && echo \"$out\" | %s" % \
+        (ropts, _srcs(src), dst, _RSYNC_STATS_FILTER % dst)
+
+
+# Compressors for the 'tar' backend: name -> (compress, decompress) commands
+_COMPRESSORS = dict(none=None, gzip=("gzip -1 -c", "gzip -dc"),
+                    xz=("xz -1 -c", "xz -dc"))
+
+_TAR_THROUGHPUT_REPORT = """\
+awk -v s=$s -v t0=$t0 -v t1=$(date +%%s.%%N) 'BEGIN { t = t1 - t0; \
+if (t <= 0) t = 0.001; \
+printf "Uploaded %%.1f MB in %%.1f s, %%.2f MB/s: %s\\n", s / 1e6, t, \
+s / 1e6 / t }'"""
+
+# A block of junk appended to the tar stream if packing failed, to make the
+# unpacking fail and to keep the command run after unpacking from being run.
+_TAR_BROKEN_BLOCK = "printf %0512d 0"
+
+
+def choose_compressor(compress="auto", local=False, bandwidth=None):
+    """
+    Choose the compressor for the 'tar' backend by the speed of the link.
+
+    >>> choose_compressor("auto", True)
+    'none'
+    >>> choose_compressor("auto")
+    'gzip'
+    >>> choose_compressor("auto", bandwidth=1)
+    'xz'
+    >>> choose_compressor("auto", bandwidth=100)
+    'none'
+    >>> choose_compressor("xz", True)
+    'xz'
+
+    :param compress: One of G._TAR_COMPRESS; 'auto' or a compressor's name
+    :param local: The destination is on this host if True
+    :param bandwidth: Bandwidth of the link in MB/s or None (unknown)
+
+    :return: Compressor's name, one of _COMPRESSORS
+    """
+    if compress != "auto":
+        return compress
+
+    if local:
+        return "none"
+
+    if bandwidth is None:
+        return "gzip"
+
+    if bandwidth < G._TAR_XZ_BELOW:
+        return "xz"
+
+    return "gzip" if bandwidth < G._TAR_GZIP_BELOW else "none"
+
+
+def tar_cmd(files, dst, host=None, user=None, opts=None, compressor="none",
+            post=None):
+    """
+    Make up a command string to stream files as one tar archive and unpack
+    it into sub dirs of ``dst`` on the host, and to report its throughput.
+
+    >>> c = tar_cmd([("/a/b.src.rpm", "sources"), ("/c/*.noarch.rpm",
+    ...              "x86_64")], "/d", "repo.example.com", "jdoe",
+    ...             compressor="gzip", post="ls")
+    >>> "(cd /a && tar -cf - --transform 's,^,sources/,' b.src.rpm)" in c
+    True
+    >>> "(cd /c && tar -cf - --transform 's,^,x86_64/,' *.noarch.rpm)" in c
+    True
+    >>> "| gzip -1 -c | ssh jdoe@repo.example.com " \\
+    ...     "'mkdir -p /d && cd /d && gzip -dc | tar -xif - && ls';" in c
+    True
+
+    :param files: List of tuples of (source path or glob, sub dir of ``dst``
+        to put files in), or a source path or glob to put in ``dst``
+    :param dst: Destination dir
+    :param host: Destination host or None (local)
+    :param user: User name on the host or None
+    :param opts: SSH options string or None
+    :param compressor: Compressor's name, one of _COMPRESSORS
+    :param post: Command string run in ``dst`` after files were unpacked
+        successfully, or None
+
+    :return: Command string
+    """
+    if isinstance(files, basestring):
+        files = [(files, '')]
+
+    def pack(src, subdir):
+        t = " --transform 's,^,%s/,'" % subdir if subdir else ''
+        return "(cd %s && tar -cf -%s %s)" % (os.path.dirname(src), t,
+                                              os.path.basename(src))
+
+    comp = _COMPRESSORS[compressor]
+    unpack = "mkdir -p %s && cd %s && %star -xif -" % \
+        (dst, dst, '' if comp is None else comp[1] + " | ")
+    if post:
+        unpack += " && " + post
+
+    if host is None:
+        unpack = "(%s)" % unpack
+    else:
+        unpack = "ssh %s%s '%s'" % ('' if opts is None else opts + ' ',
+                                    _target(host, user), unpack)
+
+    return "(f=$(mktemp) && s=$(du -cLb %s | tail -n 1 | cut -f 1) && " \
+           "t0=$(date +%%s.%%N) && { %s || { rm -f $f; %s; }; } | " \
+           "%s%s; rc=$?; " \
+           "test -f $f || rc=1; rm -f $f; test $rc -eq 0 && %s)" % \
+           (' '.join(src for src, _d in files),
+            " && ".join(pack(*f) for f in files), _TAR_BROKEN_BLOCK,
+            '' if comp is None else comp[0] + " | ", unpack,
+            _TAR_THROUGHPUT_REPORT % dst)
+
+
+# Command to deploy files into the pool of files keyed by the SHA-256 checksum
+# of them. The list of checksums, names, sizes and paths of files is sent to
+# the host at once, which hardlinks the files the pool has into dirs and
+# prints the names of the rest; these are uploaded as one tar archive and put
+# into the pool and hardlinked on the host. Paths in the pool are only made
+# up on the host to expand '~' in them against the host.
+_POOL_DEPLOY = """\
+(l=$(for f in %(src)s; do test -f "$f" || exit 1; \
+echo "$(sha256sum "$f" | cut -d ' ' -f 1) ${f##*/} \
+$(stat -L -c %%s "$f") $f"; done) || exit 1; \
+m=$(echo "$l" | cut -d ' ' -f 1,2 | %(rsh)s '%(link)s') || exit 1; \
+m=$(echo $m); \
+test -z "$m" || { tar -cf - $(echo "$l" | awk -v m="$m" '%(missing)s \
+{ d = substr($4, 1, length($4) - length($2)); print "-C", d ? d : ".", $2 }') \
+| %(rsh)s '%(commit)s'; } || exit 1; \
+echo "$l" | awk -v m="$m" '%(missing)s { n += $3; next } { s += $3 } END \
+{ printf "Uploaded %%d bytes, deduplicated %%d bytes: %(dst)s\\n", n, s }')"""
+
+# Awk pattern matches lines of files missing in the pool, listed in $m.
+_POOL_MISSING = """\
+BEGIN { split(m, a, " "); for (i in a) x[a[i]] = 1 } $2 in x"""
+
+
+def pool_cmd(src, dsts, pool, host=None, user=None, opts=None):
+    """
+    Make up a command string to upload files only if the pool on the host
+    lacks them, to hardlink them from the pool into each dir of ``dsts`` and
+    to report bytes uploaded and deduplicated. The pool and ``dsts`` must be
+    on the same file system. It takes two SSH sessions at most whatever the
+    number of files is.
+
+    >>> c = pool_cmd("/a/*.rpm", ["/d/x86_64", "/d/i386"], "~/d/.pool",
+    ...              "repo.example.com", "jdoe")
+    >>> "for f in /a/*.rpm; do " in c
+    True
+    >>> "| ssh jdoe@repo.example.com 'mkdir -p /d/x86_64 /d/i386 && " \\
+    ...     "while read c n; do " \\
+    ...     "p=~/d/.pool/$(echo $c | cut -c 1-2)/$c.rpm; " \\
+    ...     "if test -f $p; then ln -f $p /d/x86_64/$n && " \\
+    ...     "ln -f $p /d/i386/$n || exit 1; else echo $n; fi; done'" in c
+    True
+    >>> "| ssh jdoe@repo.example.com 'mkdir -p ~/d/.pool && " \\
+    ...     "t=$(mktemp -d ~/d/.pool/.incoming.XXXXXX) || exit 1; " in c
+    True
+
+    :param src: Copying source path or glob, or a list of them
+    :param dsts: List of dirs to hardlink files into
+    :param pool: Top dir of the pool
+    :param host: Destination host or None (local)
+    :param user: User name on the host or None
+    :param opts: SSH options string or None
+
+    :return: Command string
+    """
+    if host is None:
+        rsh = "sh -c"
+    else:
+        rsh = "ssh %s%s" % ('' if opts is None else opts + ' ',
+                            _target(host, user))
+
+    path = "p=%s/$(echo $c | cut -c 1-2)/$c.rpm" % pool
+    links = " && ".join("ln -f $p %s/$n" % d for d in dsts)
+
+    link = "mkdir -p %s && while read c n; do %s; if test -f $p; then " \
+           "%s || exit 1; else echo $n; fi; done" % \
+           (' '.join(dsts), path, links)
+    commit = "mkdir -p %s && t=$(mktemp -d %s/.incoming.XXXXXX) || exit 1; " \
+             "(cd $t && tar -xf - && for n in *; do " \
+             "c=$(sha256sum $n | cut -c 1-64); %s; mkdir -p ${p%%/*} && " \
+             "mv -f $n $p && %s || exit 1; done); rc=$?; rm -rf $t; " \
+             "exit $rc" % (pool, pool, path, links)
+
+    return _POOL_DEPLOY % dict(src=_srcs(src), rsh=rsh, link=link,
+                               commit=commit, missing=_POOL_MISSING,
+                               dst=' '.join(dsts))
+
+
+# vim:sw=4:ts=4:et:
@@ -20,6 +20,8 @@
 import myrepo.globals as G
 import rpmkit.utils as U
 import jinja2
+import jinja2.meta
+import logging
 import os.path
 import os
 
@@ -32,13 +34,147 @@ uconcat = U.uconcat
 uniq = U.uniq
 
 
+# Environments of jinja2 keyed by template search paths, and results of
+# rendering templates keyed by (template, search paths, variables used).
+_ENVS = dict()
+_RENDERED = dict()
+_UNDECLARED = dict()
+
+
+def _bytecode_cache(cachedir=G._TEMPLATE_CACHE_DIR):
+    """
+    :return: jinja2.FileSystemBytecodeCache instance or None if the cache dir
+        is not available
+    """
+    try:
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+        return jinja2.FileSystemBytecodeCache(cachedir)
+    except OSError as e:
+        logging.debug("Could not use the bytecode cache: " + str(e))
+        return None
+
+
+def get_template_env(tpaths=G._TEMPLATE_PATHS):
+    """
+    Get the environment of jinja2 shared in the process for given template
+    search paths. Templates compiled are cached in it and on disk.
+
+    :param tpaths: List of template search path :: [str]
+    :return: jinja2.Environment instance
+
+    >>> get_template_env(["/a"]) is get_template_env(["/a"])
+    True
+    >>> get_template_env(["/a"]) is get_template_env(["/b"])
+    False
+    """
+    key = tuple(tpaths)
+    if key not in _ENVS:
+        _ENVS[key] = jinja2.Environment(loader=jinja2.FileSystemLoader(tpaths),
+                                        bytecode_cache=_bytecode_cache(),
+                                        cache_size=-1)
+    return _ENVS[key]
+
+
+def _freeze(obj):
+    """
+    Make up a hashable object from ``obj`` consists of dicts, lists and
+    primitive values. Other objects may be changed after that and are not
+    allowed.
+
+    >>> _freeze(dict(b=[1, {"c": 2}], a=None))
+    (('a', None), ('b', (1, (('c', 2),))))
+    >>> _freeze([object()])  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    TypeError: Not a primitive value: <object ...>
+    """
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in obj.iteritems()))
+
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(x) for x in obj)
+
+    if obj is None or isinstance(obj, (basestring, bool, int, long, float)):
+        return obj
+
+    raise TypeError("Not a primitive value: %r" % obj)
+
+
+def _dependencies(env, template, seen=None):
+    """
+    :param env: jinja2.Environment instance
+    :param template: jinja2.Template instance loaded in ``env``
+    :param seen: Set of the names of templates visited already
+
+    :return: A tuple of (set of the names of variables in the context used
+        in the template and the ones it includes, imports or extends
+        recursively, list of these templates), or None if the names of some
+        of them are not known until rendered
+    """
+    if template not in _UNDECLARED:
+        ast = env.parse(env.loader.get_source(env, template.name)[0])
+        _UNDECLARED[template] = (jinja2.meta.find_undeclared_variables(ast),
+                                 list(jinja2.meta.find_referenced_templates(
+                                      ast)))
+
+    (variables, names) = _UNDECLARED[template]
+    if None in names:
+        return None
+
+    seen = set([template.name]) if seen is None else seen
+    (variables, templates) = (set(variables), [])
+
+    for name in names:
+        if name in seen:
+            continue
+
+        seen.add(name)
+        t = env.get_template(name)  # Reloaded if the file was changed.
+        deps = _dependencies(env, t, seen)
+        if deps is None:
+            return None
+
+        variables |= deps[0]
+        templates += [t] + deps[1]
+
+    return (variables, templates)
+
+
 def compile_template(tmpl, context={}, tpaths=G._TEMPLATE_PATHS):
     """
+    Render the template. Results are memoized and the same one is returned if
+    the values of variables used in the template and the ones it includes,
+    imports or extends are same.
+
     :param tmpl: Template file name or (abs or rel) path
     :param context: Context parameters to instantiate the template :: dict
     :param tpaths: List of template search path :: [str]
     """
-    env = jinja2.Environment(loader=jinja2.FileSystemLoader(tpaths))
-    return env.get_template(tmpl).render(**context)
+    env = get_template_env(tpaths)
+    template = env.get_template(tmpl)  # Reloaded if the file was changed.
+
+    deps = _dependencies(env, template)
+    if deps is None:
+        return template.render(**context)
+
+    (variables, templates) = deps
+    templates = tuple([template] + templates)
+
+    try:
+        key = (tmpl, tuple(tpaths),
+               _freeze(dict((k, context[k]) for k in variables
+                            if k in context)))
+    except TypeError:  # Some values used are not primitive ones.
+        return template.render(**context)
+
+    if key not in _RENDERED or _RENDERED[key][0] != templates:
+        if len(_RENDERED) >= G._TEMPLATE_MEMO_SIZE:
+            _RENDERED.clear()
+
+        _RENDERED[key] = (templates, template.render(**context))
+
+    return _RENDERED[key][1]
+
 
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,342 @@
+#
+# Verify RPMs in dirs of yum repos against their metadata.
+#
+# Copyright (C) 2013 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Each file listed in primary.xml of the metadata of a dir is checked if it
+exists and its size and checksum are same as the ones recorded, and RPMs in
+the dir not listed in the metadata are reported as orphans. Signatures of
+RPMs are also checked w/ 'rpm -K' optionally.
+
+Checksums are computed in threads as hashlib releases the GIL while hashing
+large data, and are cached in a sqlite database keyed by the absolute path
+of the file; they are valid while the size, the mtime and the inode number of
+the file are same, so that only RPMs added or changed are read again.
+
+It runs on servers as 'python -m myrepo.verify DIR ...' (see
+myrepo.commands.verify) and needs myrepo installed on them.
+"""
+import myrepo.globals as G
+
+import gzip
+import hashlib
+import logging
+import multiprocessing.pool
+import optparse
+import os.path
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import xml.etree.cElementTree as ET
+
+
+_NS = dict(c="http://linux.duke.edu/metadata/common",
+           r="http://linux.duke.edu/metadata/repo")
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS checksums (
+ path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER,
+ sumtype TEXT, checksum TEXT, signed INTEGER)"""
+
+# Output of 'rpm -K' of RPMs signed and verified successfully; it's like
+# 'rsa sha1 (md5) pgp md5 OK' (old rpm) or 'digests signatures OK'.
+_SIG_OK_RE = re.compile(r"\b(pgp|gpg|signatures)\b.* OK$", re.I)
+
+
+def _sumtype(sumtype):
+    """
+    >>> _sumtype("sha"), _sumtype("sha256")
+    ('sha1', 'sha256')
+    """
+    return "sha1" if sumtype == "sha" else sumtype
+
+
+def checksum(path, sumtype="sha256", bufsize=1024 * 1024):
+    """
+    Compute the checksum of the file by reading it in chunks.
+
+    :param path: File path
+    :param sumtype: Checksum type, e.g. sha256, sha (sha1) or md5
+    :param bufsize: Size of each chunk
+
+    :return: The checksum in hex digits
+    """
+    h = hashlib.new(_sumtype(sumtype))
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(bufsize), ''):
+            h.update(data)
+
+    return h.hexdigest()
+
+
+def check_signature(path):
+    """
+    :param path: RPM file path
+    :return: True if the RPM is signed and the signature is valid
+    """
+    p = subprocess.Popen(["rpm", "-K", path], stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    out = p.communicate()[0].strip()
+
+    return p.returncode == 0 and _SIG_OK_RE.search(out) is not None
+
+
+def load_packages(topdir):
+    """
+    Load the list of files in the metadata of the dir.
+
+    :param topdir: Dir in which repodata/ is
+    :return: List of dicts of files have href, size, sumtype and checksum
+    """
+    repomd = ET.parse(os.path.join(topdir, "repodata", "repomd.xml"))
+    primary = [d for d in repomd.findall("r:data", _NS) if
+               d.get("type") == "primary"][0]
+    href = primary.find("r:location", _NS).get("href")
+
+    ret = []
+    for p in ET.parse(gzip.open(os.path.join(topdir, href))
+                      ).findall("c:package", _NS):
+        sum = p.find("c:checksum", _NS)
+        ret.append(dict(href=p.find("c:location", _NS).get("href"),
+                        size=int(p.find("c:size", _NS).get("package")),
+                        sumtype=sum.get("type"), checksum=sum.text))
+
+    return ret
+
+
+def list_rpms(topdir):
+    """
+    :param topdir: Dir in which RPMs are
+    :return: List of paths relative to ``topdir`` of RPMs in it recursively;
+        hidden dirs and repodata/ are skipped
+    """
+    ret = []
+    for d, ds, fs in os.walk(topdir):
+        ds[:] = sorted(x for x in ds if not x.startswith('.') and
+                       x != "repodata")
+        ret += [os.path.relpath(os.path.join(d, f), topdir) for f in
+                sorted(fs) if f.endswith(".rpm") and not f.startswith('.')]
+
+    return ret
+
+
+def _stat(path):
+    """
+    :return: (size, mtime, inode) of the file
+    """
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime, st.st_ino)
+
+
+class ChecksumCache(object):
+    """
+    The cache must be accessed only from the thread created it.
+
+    >>> import tempfile, shutil
+    >>> topdir = tempfile.mkdtemp()
+    >>> cache = ChecksumCache(os.path.join(topdir, "verify.sqlite"))
+    >>> rpm = os.path.join(topdir, "a.rpm")
+    >>> open(rpm, 'w').write("a")
+    >>> cache.lookup(rpm, "sha256")
+    >>> cache.store(rpm, "sha256", "abc", True)
+    >>> cache.lookup(rpm, "sha256")
+    ('abc', True)
+    >>> cache.lookup(rpm, "md5")
+    >>> shutil.rmtree(topdir)
+    """
+
+    def __init__(self, path=G._VERIFY_CACHE):
+        """
+        :param path: Path of the sqlite database file of the cache
+        """
+        self.path = path
+        self._conn = None
+
+    def conn(self):
+        if self._conn is None:
+            topdir = os.path.dirname(self.path)
+            if topdir and not os.path.isdir(topdir):
+                os.makedirs(topdir)
+
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.text_factory = str
+            self._conn.execute(_SCHEMA)
+
+        return self._conn
+
+    def lookup(self, path, sumtype):
+        """
+        :param path: File path
+        :param sumtype: Checksum type
+
+        :return: A tuple of (checksum, True if the RPM is known to be signed)
+            if found and valid else None
+        """
+        path = os.path.abspath(path)
+        row = self.conn().execute("SELECT size, mtime, inode, checksum, "
+                                  "signed FROM checksums WHERE path = ? AND "
+                                  "sumtype = ?", (path, sumtype)).fetchone()
+
+        if row is None or tuple(row[:3]) != _stat(path):
+            return None
+
+        return (row[3], bool(row[4]))
+
+    def store(self, path, sumtype, checksum, signed=False):
+        """
+        Store the checksum of the file. Failures to write are not fatal as
+        it's just a cache.
+
+        :param path: File path
+        :param sumtype: Checksum type
+        :param checksum: Checksum of the file
+        :param signed: True if the signature of the RPM was verified
+        """
+        path = os.path.abspath(path)
+        try:
+            conn = self.conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO checksums VALUES "
+                             "(?, ?, ?, ?, ?, ?, ?)",
+                             [path] + list(_stat(path)) +
+                             [sumtype, checksum, int(signed)])
+        except sqlite3.Error as e:
+            logging.warn("Could not store the checksum of %s: %s" % (path, e))
+
+
+def _check(args):
+    """
+    Compute the checksum of the file and check the signature of it if needed.
+    It runs in worker threads.
+
+    :param args: A tuple of (path, sumtype, check_sig)
+    :return: A tuple of (checksum, signed or None, error message or None)
+    """
+    (path, sumtype, check_sig) = args
+    try:
+        return (checksum(path, sumtype),
+                check_signature(path) if check_sig else None, None)
+    except (IOError, OSError) as e:
+        return (None, None, str(e))
+
+
+def verify(topdir, check_sig=False, jobs=G._VERIFY_JOBS, cache=None):
+    """
+    Verify files in the dir against its metadata.
+
+    :param topdir: Dir in which repodata/ and RPMs are
+    :param check_sig: Check signatures of RPMs too if True
+    :param jobs: Number of threads to compute checksums in
+    :param cache: ChecksumCache instance or None to use the default one
+
+    :return: List of (problem, path relative to ``topdir``) found
+    """
+    cache = ChecksumCache() if cache is None else cache
+
+    ps = load_packages(topdir)
+    hrefs = set(p["href"] for p in ps)
+
+    problems = [("orphan", f) for f in list_rpms(topdir) if f not in hrefs]
+    (todo, hits) = ([], 0)
+
+    for p in ps:
+        path = os.path.join(topdir, p["href"])
+        if not os.path.isfile(path):
+            problems.append(("missing", p["href"]))
+            continue
+
+        size = os.path.getsize(path)
+        if size != p["size"]:
+            problems.append(("size mismatch (%d != %d)" % (size, p["size"]),
+                             p["href"]))
+            continue
+
+        c = cache.lookup(path, p["sumtype"])
+        if c is None or (check_sig and not c[1]):
+            todo.append(p)
+        else:
+            hits += 1
+            if c[0] != p["checksum"]:
+                problems.append(("checksum mismatch", p["href"]))
+
+    logging.info("Compute checksums of %d files (%d cached): %s" %
+                 (len(todo), hits, topdir))
+
+    pool = multiprocessing.pool.ThreadPool(max(1, jobs))
+    try:
+        rs = pool.map(_check, [(os.path.join(topdir, p["href"]), p["sumtype"],
+                                check_sig) for p in todo], 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for p, (sum, signed, err) in zip(todo, rs):
+        if err is not None:
+            problems.append(("error (%s)" % err, p["href"]))
+            continue
+
+        if sum != p["checksum"]:
+            problems.append(("checksum mismatch", p["href"]))
+        elif check_sig and not signed:
+            problems.append(("bad or no signature", p["href"]))
+
+        # Checksums are cached even if they don't match as the ones of files.
+        cache.store(os.path.join(topdir, p["href"]), p["sumtype"], sum,
+                    bool(signed))
+
+    return sorted(problems, key=lambda p: (p[1], p[0]))
+
+
+def main(argv=sys.argv):
+    p = optparse.OptionParser("%prog [OPTION ...] DIR ...")
+    p.add_option("-s", "--check-sig", action="store_true", default=False,
+                 help="Check signatures of RPMs too")
+    p.add_option("-j", "--jobs", type="int", default=G._VERIFY_JOBS,
+                 help="Number of threads to compute checksums in [%default]")
+    p.add_option("-v", "--verbose", action="store_true", default=False)
+
+    (options, args) = p.parse_args(argv[1:])
+    if not args:
+        p.print_usage()
+        return 1
+
+    logging.basicConfig(format=G._LOG_FMT, datefmt=G._LOG_DFMT,
+                        level=logging.DEBUG if options.verbose else
+                        logging.INFO)
+
+    cache = ChecksumCache()
+    nproblems = 0
+    for d in args:
+        try:
+            problems = verify(d, options.check_sig, options.jobs, cache)
+        except (IOError, OSError, IndexError, SyntaxError) as e:
+            problems = [("no valid metadata (%s)" % e, "repodata")]
+
+        for problem, f in problems:
+            print "%s: %s" % (os.path.join(d, f), problem)
+
+        nproblems += len(problems)
+
+    logging.info("%d problems found in %d dirs" % (nproblems, len(args)))
+    return 1 if nproblems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et: